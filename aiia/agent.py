@@ -0,0 +1,262 @@
+"""
+A ReAct style agent loop shared by the workflows.
+
+The model is prompted to answer in `Label: text` clauses (Thought, Action,
+Final Answer). Its streamed output is split into clauses as it arrives, one
+chunk at a time, and kept as a list of steps, so each turn costs time in the
+length of that turn rather than of the whole transcript. Each Action names a
+tool, `NAME(argument)` or `NAME[argument]`, whose result is appended to the
+transcript as an Observation before the model is asked to continue.
+
+```
+agent = Agent(PROMPT.format(question=question), tools={"SEARCH": search})
+answer = agent.run()
+```
+"""
+import re
+import sys
+import asyncio
+import inspect
+
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+LABEL = re.compile(r"([A-Za-z][\w ]*):")
+PARTIAL_LABEL = re.compile(r"[A-Za-z][\w ]*")
+ACTION = re.compile(r"\s*(\w+)\s*[\(\[](.*)[\)\]]\s*$", re.DOTALL)
+
+# Longest line prefix that is still examined for a clause label
+MAX_LABEL_LENGTH = 32
+
+
+class Step(NamedTuple):
+    label: str
+    text: str
+
+
+class ClauseParser:
+    """
+    Split streamed text into `Label: text` clauses incrementally.
+
+    A clause starts at a line beginning with a label and runs until the next
+    such line. Text before the first label gets the label "". Only the text fed
+    since the last call is looked at, and a label is recognised as soon as its
+    colon arrives, before the rest of its line. Once a clause in `stop_labels`
+    starts, it and everything after it is ignored.
+    """
+
+    def __init__(self, stop_labels=()):
+        self.stop_labels = stop_labels
+        self.stopped = False
+        self.labels: List[str] = []
+        self._parts: List[List[str]] = []
+        self._line = ""
+        self._in_body = False
+        self._pending: List[str] = []
+
+    def feed(self, text: str) -> None:
+        start = 0
+        while start < len(text) and not self.stopped:
+            end = text.find("\n", start)
+            end = len(text) if end < 0 else end + 1
+            self._feed_line(text[start:end])
+            start = end
+
+    def _feed_line(self, piece: str) -> None:
+        if self._in_body:
+            self._append(piece)
+        else:
+            self._line += piece
+            match = LABEL.match(self._line)
+            if match and match.group(1) in self.stop_labels:
+                self.stopped = True
+                return
+            if match:
+                self.labels.append(match.group(1))
+                self._parts.append([self._line[match.end() :]])
+                self._pending.append(self._line)
+                self._in_body = True
+            elif (
+                piece.endswith("\n")
+                or len(self._line) > MAX_LABEL_LENGTH
+                or not PARTIAL_LABEL.fullmatch(self._line)
+            ):
+                self._append(self._line)
+                self._in_body = True
+
+        if piece.endswith("\n"):
+            self._line = ""
+            self._in_body = False
+
+    def _append(self, text: str) -> None:
+        if not self._parts:
+            self.labels.append("")
+            self._parts.append([])
+        self._parts[-1].append(text)
+        self._pending.append(text)
+
+    def close(self) -> None:
+        """Flush a last line that was too short to tell whether it is a label."""
+        if self._line and not self._in_body and not self.stopped:
+            self._append(self._line)
+        self._line = ""
+        self._in_body = False
+
+    def pop_text(self) -> str:
+        """The text assigned to a clause since the last call."""
+        text = "".join(self._pending)
+        self._pending.clear()
+        return text
+
+    @property
+    def clauses(self) -> List[Step]:
+        return [
+            Step(label, "".join(parts))
+            for label, parts in zip(self.labels, self._parts)
+        ]
+
+
+def parse_action(action: str):
+    """Split `NAME(argument)` or `NAME[argument]` into (name, argument)."""
+    match = ACTION.match(action)
+    if match is None:
+        return action.strip(), ""
+    return match.group(1), match.group(2)
+
+
+def echo(text: str) -> None:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+class Agent:
+    """
+    :param prompt: The instructions and question the transcript starts with.
+    :param tools: Callables by action name, taking the raw argument string. They
+        may be coroutine functions; their result becomes the Observation, or
+        nothing is observed if they return None. Exceptions are observed too.
+    :param model: Model used by the default `complete`.
+    :param complete: Called with the transcript so far, returns an iterable of
+        the model's streamed continuation. Defaults to `aiia.gpt.stream_response`.
+    :param stop_labels: Clauses the model must not write itself. The default
+        `complete` sends them to the API as stop sequences; with any `complete`,
+        streaming stops as soon as one starts and it is dropped from the
+        transcript.
+    :param max_steps: Give up after this many actions.
+    :param on_text: Called with every piece of text added to the transcript.
+    :param loop: Event loop to run async tools on, kept across steps so tools can
+        hold on to resources like a browser. If not given, one is created for
+        the duration of `run`.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        tools: Dict[str, Callable[[str], Any]],
+        model: str = "gpt-3.5-turbo",
+        complete: Optional[Callable[[str], Iterable[str]]] = None,
+        stop_labels=("Observation",),
+        max_steps: int = 100,
+        on_text: Callable[[str], None] = echo,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.tools = tools
+        self.model = model
+        self.complete = complete or self._complete
+        self.stop_labels = set(stop_labels)
+        self.max_steps = max_steps
+        self.on_text = on_text
+        self.loop = loop
+        self._own_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.steps: List[Step] = [Step("", prompt)]
+        self._transcript = [prompt]
+
+    @property
+    def transcript(self) -> str:
+        if len(self._transcript) > 1:
+            self._transcript = ["".join(self._transcript)]
+        return self._transcript[0]
+
+    def _complete(self, prompt: str) -> Iterable[str]:
+        import aiia.gpt
+
+        return aiia.gpt.stream_response(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+            stop=[f"\n{label}:" for label in sorted(self.stop_labels)],
+        )
+
+    def _add(self, step: Step, text: str) -> None:
+        self.steps.append(step)
+        self._transcript.append(text)
+
+    def turn(self) -> List[Step]:
+        """Stream one continuation from the model and return its clauses."""
+        parser = ClauseParser(self.stop_labels)
+        stream = self.complete(self.transcript)
+        try:
+            for chunk in stream:
+                parser.feed(chunk)
+                text = parser.pop_text()
+                if text:
+                    self.on_text(text)
+                if parser.stopped:
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        parser.close()
+        text = parser.pop_text()
+        if text:
+            self.on_text(text)
+
+        clauses = parser.clauses
+        for clause in clauses:
+            text = f"{clause.label}:{clause.text}" if clause.label else clause.text
+            self._add(clause, text)
+        return clauses
+
+    def call_tool(self, action: str) -> Optional[str]:
+        name, argument = parse_action(action)
+        tool = self.tools.get(name)
+        if tool is None:
+            return f"Unknown action {name}, use one of [{', '.join(self.tools)}]"
+
+        try:
+            result = tool(argument)
+            if inspect.isawaitable(result):
+                if self.loop is None:
+                    self.loop = self._own_loop = asyncio.new_event_loop()
+                result = self.loop.run_until_complete(result)
+        except Exception as e:
+            # Let the model see the failure and try something else
+            return f"{name} failed: {e!r}"
+        return None if result is None else str(result)
+
+    def run(self) -> Optional[str]:
+        """Run until the model gives a Final Answer, returned, or stops acting."""
+        try:
+            return self._run()
+        finally:
+            if self._own_loop is not None:
+                self._own_loop.close()
+                self.loop = self._own_loop = None
+
+    def _run(self) -> Optional[str]:
+        for _ in range(self.max_steps):
+            clauses = self.turn()
+            labels = [clause.label for clause in clauses]
+            if "Final Answer" in labels:
+                return clauses[labels.index("Final Answer")].text.strip()
+            if "Action" not in labels:
+                return None
+
+            action = clauses[len(labels) - 1 - labels[::-1].index("Action")].text
+            observation = self.call_tool(action)
+            if observation is not None:
+                newline = "" if self._transcript[-1].endswith("\n") else "\n"
+                text = f"{newline}Observation: {observation}\n"
+                self.on_text(text)
+                self._add(Step("Observation", f" {observation}\n"), text)
+        return None
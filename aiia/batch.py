@@ -0,0 +1,245 @@
+"""
+Reply to many conversations at once, within the API's rate limits.
+
+Conversations come from a directory of `.chat.md` logs or from JSON lines, one
+`{"metadata": ..., "messages": [...]}` conversation per line. A fixed pool of
+workers takes them one at a time, so at most `max_concurrency` requests are in
+flight and a stream of any length is never held in memory. Requests are paced by
+a tokens-per-minute bucket, and failed ones are retried with exponential backoff
+and jitter; a 429 pauses every worker for its `Retry-After`.
+
+Conversations whose last message is already an assistant reply are skipped, so
+an interrupted run can simply be started again.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import urllib.error
+import email.utils
+
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from . import context, parsecache
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Conversation(NamedTuple):
+    id: str
+    data: Dict[str, Any]
+    path: Optional[str] = None
+    stat: Optional[os.stat_result] = None
+    # Set instead of data for a log that could not be read
+    error: Optional[Exception] = None
+
+
+def needs_reply(data: Dict[str, Any]) -> bool:
+    messages = data.get("messages") or []
+    return bool(messages) and messages[-1].get("role") != "assistant"
+
+
+def iter_directory(
+    directory: str, cache: Optional[parsecache.ParsedLogCache] = None
+) -> Iterator[Conversation]:
+    """
+    Yield the `.chat.md` logs in `directory`, in name order, loading unchanged
+    ones from `cache` if given.
+    """
+    with os.scandir(directory) as entries:
+        paths = sorted(e.path for e in entries if e.name.endswith(".chat.md"))
+    for path in paths:
+        try:
+            st = os.stat(path)
+            data = parsecache.load_chat_log(path, st, cache)
+        except Exception as e:
+            yield Conversation(path, {}, path, error=e)
+            continue
+        yield Conversation(path, data, path, st)
+
+
+def iter_jsonl(lines: Iterable[str]) -> Iterator[Conversation]:
+    """Yield conversations from JSON lines, identified by their `id` or line number."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield Conversation(str(number), {}, error=e)
+            continue
+        yield Conversation(str(data.get("id", number)), data)
+
+
+class TokenBucket:
+    """
+    Allows `tokens_per_minute` tokens a minute, with bursts of up to a minute's
+    worth. Waiters are served in order.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.level = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        rate = self.capacity / 60
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    async def acquire(self, tokens: int) -> None:
+        # A request larger than the bucket waits for it to be full
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= tokens:
+                    self.level -= tokens
+                    return
+                await asyncio.sleep((tokens - self.level) * 60 / self.capacity)
+
+    def consume(self, tokens: int) -> None:
+        """Correct an earlier estimate; negative `tokens` are given back."""
+        self._refill()
+        self.level = min(self.capacity, self.level - tokens)
+
+
+def retryable(error: BaseException) -> bool:
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRY_STATUSES
+    return isinstance(
+        error, (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError)
+    )
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds to wait according to the response's Retry-After header, if any."""
+    headers = getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+class Scheduler:
+    """
+    :param max_concurrency: Requests in flight at once.
+    :param tokens_per_minute: Cap on estimated prompt and reply tokens a minute.
+    :param max_retries: Retries for a request that hit a 429, a 5xx or a
+        dropped connection, before its error is raised.
+    :param base_delay: Backoff before the first retry; doubles with each one.
+    :param max_delay: Longest backoff between retries.
+    :param reply_tokens: Reply length assumed when reserving tokens, corrected
+        once the reply is in.
+    :param kwargs: Passed to `aiia.gpt.aget_response`, e.g. client.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        reply_tokens: int = 500,
+        **kwargs,
+    ):
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.reply_tokens = reply_tokens
+        self.kwargs = kwargs
+        self.retries = 0
+        self._resume_at = 0.0
+
+    def backoff(self, error: BaseException, attempt: int) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter, so clients that failed together retry apart
+            ceiling = min(self.max_delay, self.base_delay * 2**attempt)
+            delay = random.uniform(0, ceiling)
+        return delay
+
+    async def respond(self, messages, model: str) -> str:
+        from . import gpt
+
+        tokens = sum(context.estimate_tokens(m.get("content", "")) for m in messages)
+        attempt = 0
+        while True:
+            # A rate limit applies to every request, so wait out any 429 seen
+            while time.monotonic() < self._resume_at:
+                await asyncio.sleep(self._resume_at - time.monotonic())
+            if self.bucket is not None:
+                await self.bucket.acquire(tokens + self.reply_tokens)
+
+            try:
+                reply = await gpt.aget_response(messages, model=model, **self.kwargs)
+            except Exception as e:
+                if not retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(e, attempt)
+                if getattr(e, "code", None) == 429:
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+
+            if self.bucket is not None:
+                self.bucket.consume(context.estimate_tokens(reply) - self.reply_tokens)
+            return reply
+
+
+async def run_batch(
+    conversations: Iterable[Conversation],
+    scheduler: Scheduler,
+    on_reply: Callable[[Conversation, str, bool], None],
+    on_error: Callable[[Conversation, BaseException], None],
+    model: str = "gpt-3.5-turbo",
+) -> Dict[str, int]:
+    """
+    Reply to every conversation that needs it, calling `on_reply(conversation,
+    reply, summarized)` as each one finishes, where `summarized` tells whether
+    its metadata gained a new context summary. Returns counts of replied,
+    skipped and failed conversations.
+    """
+    counts = {"replied": 0, "skipped": 0, "failed": 0}
+    conversations = iter(conversations)
+
+    async def worker():
+        for conversation in conversations:
+            if conversation.error is not None:
+                counts["failed"] += 1
+                on_error(conversation, conversation.error)
+                continue
+            if not needs_reply(conversation.data):
+                counts["skipped"] += 1
+                continue
+            chat_model = conversation.data.get("metadata", {}).get("model", model)
+            try:
+                messages, summarized = await asyncio.to_thread(
+                    context.fit_chat, conversation.data, chat_model
+                )
+                reply = await scheduler.respond(messages, chat_model)
+            except Exception as e:
+                counts["failed"] += 1
+                on_error(conversation, e)
+                continue
+            counts["replied"] += 1
+            on_reply(conversation, reply, summarized)
+
+    await asyncio.gather(*[worker() for _ in range(scheduler.max_concurrency)])
+    return counts
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from typing import Any, Dict, List, Optional
+
+
+def default_cache_dir(name: str = "responses") -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "aiia", name)
+
+
+class DiskCache:
+    """
+    A directory of JSON entries, one file per key, safe to share between
+    processes.
+
+    Writes go to a temporary file that is atomically renamed into place. Reads
+    bump the entry's mtime, which makes eviction least-recently-used.
+
+    :param path: Directory to store entries in.
+    :param max_bytes: Evict least recently used entries beyond this total size.
+    :param max_age: Entries not used for this many seconds are evicted.
+    :param evict_every: Run eviction after this many writes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_age: float = 30 * 24 * 60 * 60,
+        evict_every: int = 64,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def hash(value: Any) -> str:
+        encoded = json.dumps(value, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry stored under `key`, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - entry.get("created", 0) > self.max_age:
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put_entry(self, key: str, entry: Dict[str, Any]) -> None:
+        """Atomically store `entry` under `key`, stamping its creation time."""
+        path = self._entry_path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"created": time.time(), **entry}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self.writes += 1
+        if self.writes % self.evict_every == 0:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def evict(self) -> int:
+        """
+        Drop entries unused for longer than `max_age`, then the least recently
+        used ones until the cache fits in `max_bytes`. Returns the number removed.
+        """
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda entry: entry[1], reverse=True)
+
+        removed = 0
+        total = 0
+        for path, mtime, size in entries:
+            total += size
+            if now - mtime > self.max_age or total > self.max_bytes:
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except OSError:
+                    pass
+                total -= size
+
+        self.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        for path, _, _ in list(self._entries()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries())
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, _, size in entries),
+        }
+
+
+class ResponseCache(DiskCache):
+    """
+    A content-addressed on-disk cache of chat completions.
+
+    Each entry holds the streamed chunks of one response, named by the sha256 of
+    the request (model, messages and sampling params), so a hit can be replayed
+    as the same stream.
+
+    :param path: Directory to store entries in. Defaults to ~/.cache/aiia/responses.
+    """
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        super().__init__(path or default_cache_dir("responses"), **kwargs)
+
+    @classmethod
+    def key(cls, model: str, messages: List[Dict[str, Any]], **params) -> str:
+        return cls.hash({"model": model, "messages": messages, "params": params})
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached chunks for `key`, or None on a miss."""
+        entry = self.get_entry(key)
+        return entry["chunks"] if entry is not None else None
+
+    def put(self, key: str, chunks: List[str]) -> None:
+        """Atomically store the chunks of a completed response under `key`."""
+        self.put_entry(key, {"chunks": chunks})
@@ -1,17 +1,28 @@
 #!/usr/bin/env python
+import os
 import sys
+import time
 import argparse
 import json
 
 from typing import Dict, Any
 
 from . import parse
-from . import gpt
+
+# Only what every subcommand needs is imported here; aiia.gpt (urllib, ssl,
+# asyncio) and aiia.server are imported by the subcommands that use them
 
 eprint = lambda *args, **kwargs: print(*args, file=sys.stderr, **kwargs)
 
+STARTED = time.perf_counter()
+
 
 def parse_command(file_path, input_format="markdown", output_format="json"):
+    if output_format == "jsonl":
+        return parse_command_jsonl(file_path, input_format=input_format)
+    if output_format == "markdown" and input_format == "markdown":
+        return parse_command_markdown(file_path)
+
     if file_path == "-":
         eprint("> Parsing chat logs from stdin")
         data = sys.stdin.read()
@@ -32,12 +43,78 @@ def parse_command(file_path, input_format="markdown", output_format="json"):
         print(json.dumps(data, indent=4))
     elif output_format == "markdown":
         eprint("> Converting chat logs to markdown")
-        print(parse.to_chat_markdown(data))
+        parse.write_chat_markdown(data, sys.stdout)
+        print("")
+
+
+def parse_command_markdown(file_path):
+    """
+    Normalize a markdown chat log, streaming each message from the input straight
+    to the output without holding the whole log in memory.
+    """
+    if file_path == "-":
+        eprint("> Parsing chat logs from stdin")
+        file = sys.stdin
+    else:
+        eprint(f"> Parsing chat logs from file: {file_path}")
+        file = open(file_path, "r")
+
+    with file:
+        eprint("> Streaming chat logs from markdown to markdown")
+        items = parse.iter_chat_markdown(file)
+        metadata = next(items)
+        chat = {"metadata": metadata, "messages": items}
+        parse.write_chat_markdown(chat, sys.stdout)
+        print("")
+
+
+def parse_command_jsonl(file_path, input_format="markdown"):
+    """
+    Print the chat log as JSON lines: `{"metadata": ...}` first, then one line per
+    message. Markdown input is parsed incrementally, so each message is written as
+    soon as it is read and memory use does not grow with the size of the log.
+    """
+    if file_path == "-":
+        eprint("> Parsing chat logs from stdin")
+        file = sys.stdin
+    else:
+        eprint(f"> Parsing chat logs from file: {file_path}")
+        file = open(file_path, "r")
+
+    with file:
+        if input_format == "markdown":
+            eprint("> Streaming chat logs from markdown to jsonl")
+            items = parse.iter_chat_markdown(file)
+            metadata = next(items)
+        elif input_format == "json":
+            eprint("> Converting chat logs from json to jsonl")
+            data = json.load(file)
+            metadata = data.get("metadata", {})
+            items = iter(data.get("messages", []))
+
+        print(json.dumps({"metadata": metadata}))
+        sys.stdout.flush()
+        for message in items:
+            print(json.dumps(message))
+            sys.stdout.flush()
 
 
 def respond_command(
-    file_path, input_format="markdown", inplace=False, model="gpt-3.5-turbo"
+    file_path,
+    input_format="markdown",
+    inplace=False,
+    model="gpt-3.5-turbo",
+    stats=False,
+    stream_format="text",
+    coalesce_ms=16.0,
 ):
+    from . import context, events, gpt, telemetry
+
+    sink = None
+    if stats:
+        sink = telemetry.MemorySink()
+        telemetry.add_sink(sink)
+
     if file_path == "-":
         eprint("> Parsing chat logs from stdin")
         contents = sys.stdin.read()
@@ -46,38 +123,37 @@ def respond_command(
         with open(file_path, "r") as file:
             contents = file.read()
 
-    data: Dict[str, Any] = {}
-    if input_format == "markdown":
-        eprint("> Parsing chat logs from markdown")
-        data = parse.parse_chat_markdown(contents)
-    elif input_format == "json":
-        eprint("> Parsing chat logs from json")
-        data = json.loads(contents)
-    elif input_format == "text":
-        eprint("> Parsing chat logs from text")
-        data = {
-            "metadata": {},
-            "messages": [
-                {
-                    "role": "user",
-                    "content": contents,
-                }
-            ],
-        }
+    eprint(f"> Parsing chat logs from {input_format}")
+    data: Dict[str, Any] = parse.load_chat(contents, input_format)
 
-    eprint("> Getting GPT to respond")
     model = data.get("metadata", {}).get("model", model)
-    response = gpt.stream_response(data.get("messages", []), model=model)
-    if not inplace:
-        for chunk in response:
-            print(chunk, end="")
+    messages, summarized = context.fit_chat(data, model)
+    if summarized:
+        covered = data["metadata"]["context_summary"]["messages"]
+        eprint(f"> Summarized the first {covered} messages to fit the context budget")
+
+    eprint("> Getting GPT to respond")
+    setup_ms = (time.perf_counter() - STARTED) * 1000
+    response = gpt.stream_response(messages, model=model)
+    if not inplace and stream_format == "events":
+        writer = events.EventWriter(sys.stdout, model, interval=coalesce_ms / 1000)
+        if not writer.stream(response):
+            sys.exit(1)
+    elif not inplace:
+        # One write per batch of tokens rather than per token
+        for chunk in events.coalesce(response, coalesce_ms / 1000):
+            sys.stdout.write(chunk)
             sys.stdout.flush()
         print("")
         sys.stdout.flush()
+    elif input_format == "markdown" and file_path != "-":
+        if summarized:
+            # Keep the summary in the frontmatter for the next turn
+            with open(file_path, "w") as file:
+                parse.write_chat_markdown(data, file)
+        parse.append_assistant_message(file_path, response)
     else:
-        message = ""
-        for chunk in response:
-            message += chunk
+        message = "".join(response)
 
         open(file_path, "w").write(
             parse.to_chat_markdown(
@@ -94,6 +170,298 @@ def respond_command(
             )
         )
 
+    cache = gpt.default_cache()
+    if cache is not None:
+        eprint(f"> Response cache: {cache.hits} hits, {cache.misses} misses")
+
+    if sink is not None:
+        telemetry.remove_sink(sink)
+        eprint(f"> aiia took {setup_ms:.1f} ms to get to the request")
+        eprint(telemetry.format_summary(sink.records))
+
+
+def stats_command(path=None, model=None, last=None, output_format="text"):
+    from . import telemetry
+
+    path = path or telemetry.log_path_from_env() or telemetry.default_log_path()
+    try:
+        records = telemetry.read_log(path)
+    except FileNotFoundError:
+        eprint(f"> No telemetry at {path}, set AIIA_TELEMETRY=1 to record it")
+        sys.exit(1)
+
+    if model:
+        records = [r for r in records if r.get("model") == model]
+    if last:
+        records = records[-last:]
+
+    if output_format == "jsonl":
+        for record in records:
+            print(json.dumps(record))
+    else:
+        print(telemetry.format_summary(records))
+
+
+def respond_batch_command(
+    source,
+    output=None,
+    model="gpt-3.5-turbo",
+    jobs=8,
+    tokens_per_minute=None,
+    retries=6,
+):
+    import asyncio
+    from . import batch, parsecache
+
+    cache = None
+    if source == "-":
+        eprint("> Reading conversations from stdin")
+        conversations = batch.iter_jsonl(sys.stdin)
+    elif os.path.isdir(source):
+        eprint(f"> Reading chat logs from directory: {source}")
+        cache = parsecache.default_cache()
+        conversations = batch.iter_directory(source, cache)
+    else:
+        eprint(f"> Reading conversations from file: {source}")
+        conversations = batch.iter_jsonl(open(source, "r"))
+
+    # Results go back into the chat logs, unless there is nowhere to put them
+    if output is None and not os.path.isdir(source):
+        output = "-"
+
+    done = set()
+    if output not in (None, "-") and os.path.exists(output):
+        with open(output, "r") as file:
+            for line in file:
+                result = json.loads(line)
+                if "error" not in result:
+                    done.add(result["id"])
+        eprint(f"> Resuming, {len(done)} conversations already in {output}")
+    out = sys.stdout if output == "-" else open(output, "a") if output else None
+
+    def pending():
+        for conversation in conversations:
+            if conversation.id not in done:
+                yield conversation
+
+    def on_reply(conversation, reply, summarized):
+        if out is not None:
+            messages = conversation.data.get("messages", [])
+            result = {
+                **conversation.data,
+                "id": conversation.id,
+                "messages": messages + [{"role": "assistant", "content": reply}],
+            }
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            return
+
+        current = os.stat(conversation.path)
+        stat = conversation.stat
+        if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+            eprint(f"> {conversation.path}: changed while waiting, not written")
+            return
+        if summarized:
+            with open(conversation.path, "w") as file:
+                parse.write_chat_markdown(conversation.data, file)
+        parse.append_assistant_message(conversation.path, [reply])
+        eprint(f"> {conversation.path}: replied")
+
+    def on_error(conversation, error):
+        eprint(f"> {conversation.id}: {error}")
+        if out is not None:
+            out.write(json.dumps({"id": conversation.id, "error": str(error)}) + "\n")
+            out.flush()
+
+    scheduler = batch.Scheduler(
+        max_concurrency=jobs, tokens_per_minute=tokens_per_minute, max_retries=retries
+    )
+    try:
+        counts = asyncio.run(
+            batch.run_batch(pending(), scheduler, on_reply, on_error, model=model)
+        )
+    finally:
+        if out not in (None, sys.stdout):
+            out.close()
+        if cache is not None:
+            cache.close()
+
+    eprint(
+        f"> {counts['replied']} replied, {counts['skipped']} already answered,"
+        f" {counts['failed']} failed, {scheduler.retries} retries"
+    )
+    if counts["failed"]:
+        sys.exit(1)
+
+
+def search_command(query, directory=None, limit=20, raw=False, output_format="text"):
+    from . import parsecache, search
+
+    conn = search.connect()
+    cache = parsecache.default_cache()
+    try:
+        updated = search.update_index(
+            conn, directory or search.default_chat_logs_dir(), cache
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    if updated:
+        eprint(f"> Indexed {updated} chat logs")
+
+    try:
+        results = search.search(conn, query, limit=limit, raw=raw)
+    except ValueError as e:
+        eprint(f"> {e}")
+        sys.exit(2)
+    for result in results:
+        if output_format == "jsonl":
+            print(json.dumps(result))
+        else:
+            snippet = " ".join(result["snippet"].split())
+            print(f"{result['path']}: ({result['title']}) {snippet}")
+
+
+def template_command(
+    action,
+    name=None,
+    variables=(),
+    vars_json=None,
+    output=None,
+    output_format="markdown",
+):
+    from . import templates
+
+    registry = templates.default_registry()
+    if action == "list":
+        for template_name in registry.names():
+            print(template_name)
+        return
+
+    values = {}
+    if vars_json is not None:
+        if vars_json == "-":
+            values.update(json.load(sys.stdin))
+        else:
+            with open(vars_json, "r") as file:
+                values.update(json.load(file))
+    for assignment in variables:
+        key, sep, value = assignment.partition("=")
+        if not sep:
+            eprint(f"> Expected --var NAME=VALUE, got {assignment!r}")
+            sys.exit(2)
+        values[key] = value
+
+    try:
+        template = registry.get(name)
+    except FileNotFoundError as e:
+        eprint(f"> {e}")
+        sys.exit(1)
+    if action == "vars":
+        print("\n".join(template.variables))
+        return
+    try:
+        if output_format == "json":
+            rendered = json.dumps(template.render(**values), indent=4) + "\n"
+        else:
+            rendered = template.render_markdown(**values)
+    except KeyError as e:
+        eprint(f"> Missing template variable {e}, pass it with --var {e.args[0]}=...")
+        sys.exit(1)
+
+    file = open(output, "w") if output else sys.stdout
+    try:
+        file.write(rendered)
+    finally:
+        if output:
+            file.close()
+
+
+def serve_command(socket_path=None):
+    import asyncio
+    from . import server
+
+    try:
+        asyncio.run(server.serve(socket_path))
+    except KeyboardInterrupt:
+        pass
+
+
+def forward_command(args) -> bool:
+    """
+    Hand a parse or respond over to a running `aiia serve` daemon. Returns False
+    if there is none, or the command is one the daemon does not handle, so the
+    caller should run it locally. Set AIIA_DAEMON=0 to never forward.
+
+    Parses that stream message by message, to jsonl or from markdown to markdown,
+    are always run locally: the daemon builds its output in memory.
+    """
+    if os.environ.get("AIIA_DAEMON") == "0":
+        return False
+    if args.command == "respond" and (args.inplace or args.stats):
+        return False
+    if args.command == "parse" and (
+        args.output_format == "jsonl"
+        or args.output_format == args.input_format == "markdown"
+    ):
+        return False
+    from . import daemon
+
+    if not daemon.is_running():
+        return False
+
+    if args.file_path == "-":
+        contents = sys.stdin.read()
+    else:
+        with open(args.file_path, "r") as file:
+            contents = file.read()
+
+    frame = {
+        "type": args.command,
+        "contents": contents,
+        "input_format": args.input_format,
+    }
+    if args.command == "parse":
+        frame["output_format"] = args.output_format
+    else:
+        frame["model"] = args.model
+        frame["coalesce_ms"] = args.coalesce_ms
+
+    if args.command == "respond" and args.stream_format == "events":
+        from . import events
+
+        # The daemon takes the model from the frontmatter, so report that one
+        if args.input_format == "markdown":
+            metadata = next(parse.iter_chat_markdown(contents.splitlines(True)))
+        else:
+            metadata = json.loads(contents).get("metadata", {})
+        model = metadata.get("model", args.model)
+        writer = events.EventWriter(sys.stdout, model, interval=0)
+        writer.started()
+        for response in daemon.request(frame):
+            if response["type"] == "chunk":
+                writer.chunks += 1
+                writer.delta(response["content"])
+            elif response["type"] == "done":
+                writer.done()
+            else:
+                writer.error(RuntimeError(response.get("message", response["type"])))
+                sys.exit(1)
+        return True
+
+    for response in daemon.request(frame):
+        if response["type"] == "result":
+            print(response["output"])
+        elif response["type"] == "chunk":
+            print(response["content"], end="")
+            sys.stdout.flush()
+        elif response["type"] == "done":
+            print("")
+        elif response["type"] == "error":
+            eprint(f"> Error from aiia serve: {response['message']}")
+            sys.exit(1)
+    return True
+
 
 def create_parser():
     parser = argparse.ArgumentParser(
@@ -115,7 +483,10 @@ def create_parser():
     )
 
     parse_parser.add_argument(
-        "-of", "--output-format", choices=["json", "markdown"], default="json"
+        "-of",
+        "--output-format",
+        choices=["json", "jsonl", "markdown"],
+        default="json",
     )
 
     parse_parser.add_argument(
@@ -144,6 +515,135 @@ def create_parser():
         choices=["json", "markdown", "text"],
         default="markdown",
     )
+    respond_parser.add_argument(
+        "-sf",
+        "--stream-format",
+        choices=["text", "events"],
+        default="text",
+        help="print the reply as text, or as JSON lines of start, delta, done and "
+        "error events",
+    )
+    respond_parser.add_argument(
+        "--coalesce-ms",
+        type=float,
+        default=16.0,
+        help="join tokens arriving within this window into one write, 0 to not",
+    )
+    respond_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print connection, time-to-first-token and throughput timings",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "respond-batch",
+        help="reply to a directory of chat logs or a jsonl stream of conversations",
+    )
+    batch_parser.add_argument(
+        "source",
+        nargs="?",
+        default="-",
+        help="directory of chat logs or jsonl file, reads jsonl from stdin by default",
+    )
+    batch_parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="jsonl file to append results to, resuming from it if it exists; "
+        "defaults to replying in place for a directory, stdout for jsonl",
+    )
+    batch_parser.add_argument(
+        "-m", "--model", default="gpt-3.5-turbo", help="model to use"
+    )
+    batch_parser.add_argument(
+        "-j", "--jobs", type=int, default=8, help="requests to run at once"
+    )
+    batch_parser.add_argument(
+        "--tpm", type=int, default=None, help="cap on tokens per minute"
+    )
+    batch_parser.add_argument(
+        "--retries", type=int, default=6, help="retries per conversation"
+    )
+
+    search_parser = subparsers.add_parser(
+        "search",
+        help="full-text search the chat log archive",
+    )
+    search_parser.add_argument("query", help="words to search for")
+    search_parser.add_argument(
+        "-d", "--dir", default=None, help="chat log directory, defaults to ~/chat-logs"
+    )
+    search_parser.add_argument(
+        "-n", "--limit", type=int, default=20, help="maximum number of results"
+    )
+    search_parser.add_argument(
+        "--raw", action="store_true", help="treat the query as FTS5 query syntax"
+    )
+    search_parser.add_argument(
+        "-of", "--output-format", choices=["text", "jsonl"], default="text"
+    )
+
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="summarize the request latencies recorded with AIIA_TELEMETRY",
+    )
+    stats_parser.add_argument(
+        "path",
+        nargs="?",
+        default=None,
+        help="log file, defaults to $AIIA_TELEMETRY or ~/.cache/aiia/telemetry.jsonl",
+    )
+    stats_parser.add_argument("-m", "--model", default=None, help="only this model")
+    stats_parser.add_argument(
+        "-n", "--last", type=int, default=None, help="only the last N requests"
+    )
+    stats_parser.add_argument(
+        "-of", "--output-format", choices=["text", "jsonl"], default="text"
+    )
+
+    template_parser = subparsers.add_parser(
+        "template",
+        help="render the prompt templates in ~/.local/share/prompts",
+    )
+    template_parser.add_argument(
+        "action",
+        choices=["render", "list", "vars"],
+        help="render a template, list the templates or list a template's variables",
+    )
+    template_parser.add_argument(
+        "name", nargs="?", help="template name, e.g. add-types-template, or path"
+    )
+    template_parser.add_argument(
+        "--var",
+        dest="variables",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="value of a placeholder, may be repeated",
+    )
+    template_parser.add_argument(
+        "--vars-json",
+        default=None,
+        metavar="FILE",
+        help="JSON object of placeholder values, - for stdin",
+    )
+    template_parser.add_argument(
+        "-o", "--output", default=None, help="file to write, defaults to stdout"
+    )
+    template_parser.add_argument(
+        "-of", "--output-format", choices=["markdown", "json"], default="markdown"
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="run a long-lived daemon on a unix socket for editors and the cli",
+    )
+    serve_parser.add_argument(
+        "-s",
+        "--socket",
+        default=None,
+        help="socket path, defaults to $AIIA_SOCKET or $XDG_RUNTIME_DIR/aiia-$UID.sock",
+    )
 
     return parser
 
@@ -151,6 +651,11 @@ def create_parser():
 def main():
     parser = create_parser()
     args = parser.parse_args()
+    if args.command == "respond" and args.inplace and args.stream_format == "events":
+        parser.error("--stream-format events prints the reply, it cannot be --inplace")
+
+    if args.command in ("parse", "respond") and forward_command(args):
+        return
 
     if args.command == "parse":
         parse_command(
@@ -164,7 +669,47 @@ def main():
             input_format=args.input_format,
             inplace=args.inplace,
             model=args.model,
+            stats=args.stats,
+            stream_format=args.stream_format,
+            coalesce_ms=args.coalesce_ms,
+        )
+    elif args.command == "respond-batch":
+        respond_batch_command(
+            args.source,
+            output=args.output,
+            model=args.model,
+            jobs=args.jobs,
+            tokens_per_minute=args.tpm,
+            retries=args.retries,
+        )
+    elif args.command == "search":
+        search_command(
+            args.query,
+            directory=args.dir,
+            limit=args.limit,
+            raw=args.raw,
+            output_format=args.output_format,
+        )
+    elif args.command == "stats":
+        stats_command(
+            args.path,
+            model=args.model,
+            last=args.last,
+            output_format=args.output_format,
+        )
+    elif args.command == "template":
+        if args.action != "list" and not args.name:
+            parser.error(f"template {args.action} needs a template name")
+        template_command(
+            args.action,
+            args.name,
+            variables=args.variables,
+            vars_json=args.vars_json,
+            output=args.output,
+            output_format=args.output_format,
         )
+    elif args.command == "serve":
+        serve_command(args.socket)
     else:
         parser.print_help()
 
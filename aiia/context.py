@@ -0,0 +1,336 @@
+"""
+Fit a chat into a token budget before it is sent to the model.
+
+Recent turns are kept verbatim. Once the whole chat no longer fits, the oldest
+turns are replaced by one running summary, which is kept in the chat's
+frontmatter so the next turn can reuse it rather than summarize again:
+
+    ---
+    model: gpt-4
+    context_budget: 6000
+    context_summary:
+      messages: 12
+      hash: 3f1c9a0e5b7d2c11
+      content: The user is porting a parser to Rust ...
+    ---
+
+Summarizing cuts the verbatim tail down to `keep_ratio` of the budget, so a new
+summary is only needed every few turns, and it is built from the previous
+summary plus the turns that since fell out of the window, a request's worth at a
+time. Every summary is also kept in ~/.cache/aiia/summaries under the hash of
+the messages it covers, for replies whose frontmatter is not written back.
+"""
+import json
+import hashlib
+import functools
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .cache import DiskCache, default_cache_dir
+
+Estimator = Callable[[str], int]
+Summarizer = Callable[[List[Dict[str, Any]]], str]
+
+# Prompt tokens to use per model, leaving room for the response. Names are
+# matched exactly, since a longer name may well have a larger context window;
+# other models get DEFAULT_BUDGET, which sends the whole chat.
+MODEL_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-3.5-turbo-0301": 3000,
+    "gpt-3.5-turbo-0613": 3000,
+    "gpt-3.5-turbo-16k": 12000,
+    "gpt-3.5-turbo-16k-0613": 12000,
+    "gpt-3.5-turbo-1106": 12000,
+    "gpt-3.5-turbo-0125": 12000,
+    "gpt-4": 6000,
+    "gpt-4-0314": 6000,
+    "gpt-4-0613": 6000,
+    "gpt-4-32k": 24000,
+    "gpt-4-32k-0314": 24000,
+    "gpt-4-32k-0613": 24000,
+    # 128k context windows
+    "gpt-4-1106-preview": 96000,
+    "gpt-4-0125-preview": 96000,
+    "gpt-4-turbo-preview": 96000,
+    "gpt-4-vision-preview": 96000,
+    "gpt-4-turbo": 96000,
+    "gpt-4-turbo-2024-04-09": 96000,
+    "gpt-4o": 96000,
+    "gpt-4o-2024-05-13": 96000,
+    "gpt-4o-2024-08-06": 96000,
+    "gpt-4o-mini": 96000,
+    "gpt-4o-mini-2024-07-18": 96000,
+}
+DEFAULT_BUDGET = 0
+
+# Tokens the API adds around every message for the role and separators
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n\n"
+
+SUMMARIZE_PROMPT = """\
+Summarize the conversation so far in a few short paragraphs, keeping every \
+decision, fact, name, number and piece of code that later messages may refer \
+to. If it starts with an earlier summary, fold that in. Reply with the summary \
+only."""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A fast, tokenizer free estimate: about four characters per token for prose,
+    but at least one token per word for text with many short words or symbols.
+    """
+    return max(len(text) // 4, len(text.split())) + MESSAGE_OVERHEAD
+
+
+def tiktoken_estimator(model: str) -> Estimator:
+    """An exact estimator using OpenAI's tokenizer; requires tiktoken."""
+    import tiktoken
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text)) + MESSAGE_OVERHEAD
+
+
+def get_estimator(metadata: Dict[str, Any], model: str) -> Estimator:
+    """Pick the estimator named by the `tokenizer` frontmatter field."""
+    if metadata.get("tokenizer") == "tiktoken":
+        try:
+            return tiktoken_estimator(model)
+        except ImportError:
+            pass
+    return estimate_tokens
+
+
+def get_budget(metadata: Dict[str, Any], model: str) -> int:
+    """The `context_budget` frontmatter field, or the model's default."""
+    budget = metadata.get("context_budget")
+    if budget is None:
+        return model_budget(model)
+    return int(budget)
+
+
+def model_budget(model: str) -> int:
+    """The budget of a known model, or DEFAULT_BUDGET for any other."""
+    return MODEL_BUDGETS.get(model, DEFAULT_BUDGET)
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    encoded = json.dumps(
+        [message.get("role"), message.get("content")], ensure_ascii=False
+    )
+    return encoded.encode("utf-8") + b"\n"
+
+
+def messages_hash(messages: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(b"".join(map(_encode, messages))).hexdigest()[:16]
+
+
+def prefix_hashes(messages: List[Dict[str, Any]]) -> List[str]:
+    """`messages_hash(messages[:i])` for every i, in one pass."""
+    digest = hashlib.sha256()
+    hashes = [digest.hexdigest()[:16]]
+    for message in messages:
+        digest.update(_encode(message))
+        hashes.append(digest.hexdigest()[:16])
+    return hashes
+
+
+class SummaryCache(DiskCache):
+    """
+    Summaries of the start of chats, named by the model and the hash of the
+    messages they cover.
+
+    :param model: Model the summaries are made for.
+    :param path: Directory to store entries in. Defaults to ~/.cache/aiia/summaries.
+    """
+
+    def __init__(self, model: str, path: Optional[str] = None, **kwargs):
+        super().__init__(path or default_cache_dir("summaries"), **kwargs)
+        self.model = model
+
+    def key(self, messages_hash: str) -> str:
+        return self.hash([self.model, messages_hash])
+
+    def get(self, messages_hash: str) -> Optional[str]:
+        entry = self.get_entry(self.key(messages_hash))
+        return entry["content"] if entry is not None else None
+
+    def put(self, messages_hash: str, content: str) -> None:
+        self.put_entry(self.key(messages_hash), {"content": content})
+
+
+def summary_message(content: str) -> Dict[str, str]:
+    return {"role": "system", "content": SUMMARY_PREFIX + content}
+
+
+def fit_messages(
+    messages: List[Dict[str, Any]],
+    budget: int,
+    summarize: Summarizer,
+    summary: Optional[Dict[str, Any]] = None,
+    estimate: Estimator = estimate_tokens,
+    keep_ratio: float = 0.5,
+    cache: Union[SummaryCache, Callable[[], SummaryCache], None] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Return the messages to send and the summary they use, if any.
+
+    Leading system messages are always kept. Of the rest, the oldest are
+    replaced by a summary when needed, cut at a user message so turns stay
+    whole, and the last message is always kept verbatim.
+
+    :param budget: Tokens the returned messages may use; 0 or less to disable.
+    :param summarize: Called with the messages to summarize, returns the summary.
+        It is never given more than `budget` tokens at once.
+    :param summary: The summary stored with the chat by a previous call, a dict
+        of `messages` (how many non-system messages it covers), `hash` and
+        `content`.
+    :param estimate: Returns the number of tokens in a message's content.
+    :param keep_ratio: Share of the budget kept verbatim after summarizing.
+    :param cache: Where summaries are stored, and looked up when `summary` is
+        missing or out of date. May be a function returning the cache, which is
+        only called once the chat is over budget.
+    """
+    start = 0
+    while start < len(messages) and messages[start].get("role") == "system":
+        start += 1
+    system, rest = messages[:start], messages[start:]
+
+    costs = [estimate(m.get("content", "")) for m in rest]
+    system_cost = sum(estimate(m.get("content", "")) for m in system)
+    if budget <= 0 or system_cost + sum(costs) <= budget:
+        return messages, summary
+    if callable(cache):
+        cache = cache()
+
+    # Suffix sums, so the cost of keeping rest[i:] verbatim is tail[i]
+    tail = [0] * (len(rest) + 1)
+    for i in range(len(rest) - 1, -1, -1):
+        tail[i] = tail[i + 1] + costs[i]
+    hashes = prefix_hashes(rest)
+
+    def valid(candidate):
+        # Frontmatter is edited by hand, so anything may be found there
+        if not isinstance(candidate, dict):
+            return False
+        covered = candidate.get("messages")
+        if not isinstance(covered, int) or not 0 < covered < len(rest):
+            return False
+        if not isinstance(candidate.get("content"), str):
+            return False
+        return candidate.get("hash") == hashes[covered]
+
+    if not valid(summary) and cache is not None:
+        # The longest start of the chat an earlier turn summarized
+        for covered in range(len(rest) - 1, 0, -1):
+            content = cache.get(hashes[covered])
+            if content is not None:
+                summary = {
+                    "messages": covered,
+                    "hash": hashes[covered],
+                    "content": content,
+                }
+                break
+
+    if valid(summary):
+        covered = summary["messages"]
+        summary_cost = estimate(SUMMARY_PREFIX + summary["content"])
+        if system_cost + summary_cost + tail[covered] <= budget:
+            fitted = system + [summary_message(summary["content"])] + rest[covered:]
+            return fitted, summary
+
+    # Keep as many recent messages as fit in keep_ratio of the budget
+    target = budget * keep_ratio - system_cost
+    cut = len(rest) - 1
+    while cut > 0 and tail[cut - 1] <= target:
+        cut -= 1
+    while 0 < cut < len(rest) - 1 and rest[cut].get("role") != "user":
+        cut += 1
+    if valid(summary) and summary["messages"] > cut:
+        cut = summary["messages"]
+    if cut <= 0:
+        return messages, summary
+
+    covered, content = 0, None
+    if valid(summary):
+        covered, content = summary["messages"], summary["content"]
+
+    # Roll the summary forward a request at a time, each folding in the last
+    limit = budget - estimate(SUMMARIZE_PROMPT)
+    while covered < cut:
+        piece = [summary_message(content)] if content is not None else []
+        size = sum(estimate(m["content"]) for m in piece)
+        end = covered
+        while end < cut and size + costs[end] <= limit:
+            size += costs[end]
+            end += 1
+        chunk = rest[covered:end]
+        if end == covered:
+            # A message too long for a request on its own is cut short
+            chunk = [truncate(rest[end], limit - size, estimate)]
+            end += 1
+        content = summarize(piece + chunk).strip()
+        covered = end
+        if cache is not None:
+            cache.put(hashes[covered], content)
+
+    summary = {"messages": cut, "hash": hashes[cut], "content": content}
+    return system + [summary_message(content)] + rest[cut:], summary
+
+
+def truncate(
+    message: Dict[str, Any], tokens: int, estimate: Estimator = estimate_tokens
+) -> Dict[str, Any]:
+    """`message` with its content cut down to about `tokens` tokens."""
+    content = message.get("content", "")
+    cost = estimate(content)
+    if cost <= tokens:
+        return message
+    keep = max(tokens - MESSAGE_OVERHEAD, 0) / max(cost - MESSAGE_OVERHEAD, 1)
+    return {**message, "content": content[: int(len(content) * keep)]}
+
+
+def gpt_summarizer(model: str) -> Summarizer:
+    """Summarize with the chat's own model through `aiia.gpt`."""
+
+    def summarize(messages):
+        from . import gpt
+
+        return gpt.get_response(
+            messages + [{"role": "user", "content": SUMMARIZE_PROMPT}], model=model
+        )
+
+    return summarize
+
+
+def fit_chat(
+    data: Dict[str, Any],
+    model: str,
+    summarize: Optional[Summarizer] = None,
+    cache: Optional[SummaryCache] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Fit a parsed chat into the budget its frontmatter sets for `model`.
+
+    Returns the messages to send and whether `data["metadata"]` was updated
+    with a new `context_summary` that should be written back to the chat.
+    Summaries go to `cache`, by default a `SummaryCache` in ~/.cache/aiia that is
+    only opened once the chat outgrows its budget.
+    """
+    metadata = data.setdefault("metadata", {})
+    previous = metadata.get("context_summary")
+    messages, summary = fit_messages(
+        data.get("messages", []),
+        get_budget(metadata, model),
+        summarize or gpt_summarizer(model),
+        summary=previous,
+        estimate=get_estimator(metadata, model),
+        cache=cache or functools.partial(SummaryCache, model),
+    )
+    if summary is None or summary == previous:
+        return messages, False
+    metadata["context_summary"] = summary
+    return messages, True
@@ -0,0 +1,80 @@
+"""
+The client side of the `aiia serve` protocol, see aiia/server.py.
+
+Kept apart from the daemon itself so that checking for a running daemon and
+forwarding to it costs the CLI no more than a socket import.
+"""
+import os
+import json
+import stat
+import socket
+
+from typing import Any, Dict, Iterator, Optional
+
+
+def default_socket_path() -> str:
+    if os.environ.get("AIIA_SOCKET"):
+        return os.environ["AIIA_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or _tempdir()
+    return os.path.join(runtime_dir, f"aiia-{os.getuid()}.sock")
+
+
+def is_own_socket(socket_path: str) -> bool:
+    """
+    Whether `socket_path` is a socket owned by this user. The fallback path is in
+    the shared temporary directory, where another user could have created it to
+    read the chats sent to it.
+    """
+    try:
+        st = os.stat(socket_path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def is_running(socket_path: Optional[str] = None) -> bool:
+    """Whether a daemon of this user is accepting connections on the socket."""
+    socket_path = socket_path or default_socket_path()
+    if not is_own_socket(socket_path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def request(
+    frame: Dict[str, Any], socket_path: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Send one request to the daemon and yield the frames answering it, up to and
+    including the final result, done, cancelled or error frame.
+    """
+    socket_path = socket_path or default_socket_path()
+    if not is_own_socket(socket_path):
+        raise PermissionError(f"{socket_path} is not a socket owned by this user")
+    frame = {"id": 1, **frame}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(frame).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as responses:
+            for line in responses:
+                response = json.loads(line)
+                yield response
+                if response["type"] != "chunk":
+                    return
+    finally:
+        sock.close()
+
+
+def _tempdir() -> str:
+    # What tempfile.gettempdir() would pick, without importing tempfile
+    for name in ("TMPDIR", "TEMP", "TMP"):
+        if os.environ.get(name):
+            return os.environ[name]
+    return "/tmp"
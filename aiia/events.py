@@ -0,0 +1,222 @@
+"""
+Batch a streamed reply into fewer, larger writes, and report it as events.
+
+Replies arrive a token at a time, and writing every token costs a syscall for
+`aiia respond` and a redraw for the editor reading it. `coalesce` and
+`acoalesce` join the chunks that arrive within `interval` seconds of the last
+write, or up to `max_chars`, so a fast stream is written about 60 times a
+second while a slow one is still written as soon as each chunk arrives.
+
+`EventWriter` writes a reply as newline-delimited JSON events, as printed by
+`aiia respond --stream-format events`:
+
+    {"type": "start", "model": "gpt-4", "t_ms": 0.0}
+    {"type": "delta", "content": "Hello wor", "t_ms": 412.9}
+    {"type": "delta", "content": "ld!", "t_ms": 430.1}
+    {"type": "done", "t_ms": 431.0, "ttft_ms": 412.9, "chunks": 4, "deltas": 2,
+     "chars": 12}
+
+A failure ends the stream with `{"type": "error", "message": "...", "t_ms": ...}`
+instead of done. `t_ms` is the time since the start event.
+"""
+import json
+import time
+import queue
+import asyncio
+import threading
+
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, TextIO
+
+# Default window a delta is held back to be joined with the chunks after it
+INTERVAL = 0.016
+MAX_CHARS = 4096
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def coalesce(
+    chunks: Iterable[str], interval: float = INTERVAL, max_chars: int = MAX_CHARS
+) -> Iterator[str]:
+    """
+    Yield `chunks` joined into batches. A chunk is held back at most `interval`
+    seconds after the previous batch, however long the next one takes, because
+    `chunks` is read on a separate thread.
+    """
+    if interval <= 0:
+        yield from chunks
+        return
+
+    items: "queue.Queue[Any]" = queue.Queue()
+
+    def read():
+        try:
+            for chunk in chunks:
+                items.put(chunk)
+        except BaseException as e:
+            items.put(_Failure(e))
+        else:
+            items.put(_END)
+
+    threading.Thread(target=read, daemon=True).start()
+
+    pending = []
+    size = 0
+    last = float("-inf")
+    while True:
+        timeout = None
+        if pending:
+            timeout = max(last + interval - time.perf_counter(), 0)
+        try:
+            item = items.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+        if isinstance(item, str):
+            pending.append(item)
+            size += len(item)
+        elif item is not None:
+            if pending:
+                yield "".join(pending)
+            if isinstance(item, _Failure):
+                raise item.error
+            return
+
+        now = time.perf_counter()
+        if pending and (now - last >= interval or size >= max_chars):
+            yield "".join(pending)
+            pending.clear()
+            size = 0
+            last = now
+
+
+async def acoalesce(
+    chunks: AsyncIterator[str], interval: float = INTERVAL, max_chars: int = MAX_CHARS
+) -> AsyncIterator[str]:
+    """`coalesce` for an async stream, without a thread."""
+    if interval <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    pending = []
+    size = 0
+    last = float("-inf")
+    waiting: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if waiting is None:
+                waiting = asyncio.ensure_future(chunks.__anext__())
+            timeout = None
+            if pending:
+                timeout = max(last + interval - time.perf_counter(), 0)
+            # Waiting on the future rather than the read keeps a timeout from
+            # cancelling a chunk that is half read
+            done, _ = await asyncio.wait({waiting}, timeout=timeout)
+            if done:
+                try:
+                    chunk = waiting.result()
+                except StopAsyncIteration:
+                    waiting = None
+                    break
+                waiting = None
+                pending.append(chunk)
+                size += len(chunk)
+
+            now = time.perf_counter()
+            if pending and (now - last >= interval or size >= max_chars):
+                yield "".join(pending)
+                pending.clear()
+                size = 0
+                last = now
+        if pending:
+            yield "".join(pending)
+    finally:
+        if waiting is not None:
+            # Let the read unwind, so the caller can close `chunks` afterwards
+            waiting.cancel()
+            await asyncio.wait({waiting})
+
+
+class EventWriter:
+    """
+    Writes the events of one reply to `out`, flushing after each.
+
+    :param model: Reported in the start event.
+    :param interval: Coalescing window of `stream` in seconds, 0 for a delta per
+        chunk.
+    :param max_chars: Largest delta `stream` holds back.
+    """
+
+    def __init__(
+        self,
+        out: TextIO,
+        model: Optional[str] = None,
+        interval: float = INTERVAL,
+        max_chars: int = MAX_CHARS,
+    ):
+        self.out = out
+        self.model = model
+        self.interval = interval
+        self.max_chars = max_chars
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.chunks = 0
+        self.deltas = 0
+        self.chars = 0
+
+    def _ms(self, stamp: float) -> float:
+        return round((stamp - self.start) * 1000, 3)
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        event["t_ms"] = self._ms(time.perf_counter())
+        self.out.write(json.dumps(event) + "\n")
+        self.out.flush()
+
+    def started(self) -> None:
+        self.start = time.perf_counter()
+        self.emit({"type": "start", "model": self.model})
+
+    def delta(self, content: str) -> None:
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.deltas += 1
+        self.chars += len(content)
+        self.emit({"type": "delta", "content": content})
+
+    def done(self) -> None:
+        self.emit(
+            {
+                "type": "done",
+                "ttft_ms": self._ms(self.first) if self.first is not None else None,
+                "chunks": self.chunks,
+                "deltas": self.deltas,
+                "chars": self.chars,
+            }
+        )
+
+    def error(self, error: BaseException) -> None:
+        self.emit({"type": "error", "message": str(error) or repr(error)})
+
+    def _count(self, chunks: Iterable[str]) -> Iterator[str]:
+        for chunk in chunks:
+            self.chunks += 1
+            yield chunk
+
+    def stream(self, chunks: Iterable[str]) -> bool:
+        """
+        Write the whole reply, start to done, coalescing `chunks` into deltas.
+        A failure is written as an error event; returns whether there was none.
+        """
+        self.started()
+        try:
+            for content in coalesce(self._count(chunks), self.interval, self.max_chars):
+                self.delta(content)
+        except Exception as e:
+            self.error(e)
+            return False
+        self.done()
+        return True
@@ -1,49 +1,772 @@
 import os
-import urllib.request
-import urllib.parse
+import io
+import base64
+import ssl
+import socket
 import json
+import time
+import asyncio
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-assert OPENAI_API_KEY, "OPENAI_API_KEY environment variable required"
 
-from typing import Any, Dict, Iterator, List
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from . import telemetry
+from .cache import ResponseCache
+from .sse import SSEDecoder, delta_content
+
+
+class Client:
+    """
+    A small HTTP/1.1 client for the OpenAI chat completions API that keeps a pool
+    of persistent connections per host, so consecutive requests skip the TCP and
+    TLS handshakes.
+
+    :param base_url: The API root, e.g. "https://api.openai.com/v1" or a local
+        OpenAI-compatible stand-in such as "http://127.0.0.1:8080/v1".
+    :param api_key: The bearer token to send. Defaults to OPENAI_API_KEY, which is
+        only required once a client is created, not when this module is imported.
+    :param connect_timeout: Seconds to wait for a connection to be established.
+    :param read_timeout: Seconds to wait on any single read from the socket.
+    :param max_idle: Maximum number of idle connections kept per host.
+
+    A proxy from HTTPS_PROXY / HTTP_PROXY is honored as by urllib, NO_PROXY
+    included: https requests are tunneled through it with CONNECT, plain http ones
+    are sent to it with the absolute URL.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENAI_BASE_URL,
+        api_key: Optional[str] = None,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        max_idle: int = 8,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key or OPENAI_API_KEY
+        assert self.api_key, "OPENAI_API_KEY environment variable required"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+
+        parsed = urllib.parse.urlsplit(self.base_url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.path = parsed.path
+
+        self.proxy = None
+        self._proxy_headers: Dict[str, str] = {}
+        proxy = urllib.request.getproxies().get(self.scheme)
+        if proxy and not urllib.request.proxy_bypass(self.host):
+            if "://" not in proxy:
+                proxy = "http://" + proxy
+            self.proxy = urllib.parse.urlsplit(proxy)
+            if self.proxy.username is not None:
+                credentials = "%s:%s" % (
+                    urllib.parse.unquote(self.proxy.username),
+                    urllib.parse.unquote(self.proxy.password or ""),
+                )
+                self._proxy_headers["Proxy-Authorization"] = "Basic " + (
+                    base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+                )
+        if self.proxy and self.scheme != "https":
+            # A plain http proxy takes the absolute URL in the request line
+            self._target = f"{self.scheme}://{parsed.netloc}{self.path}"
+        else:
+            self._target = self.path
+
+        self._ssl_context = None
+        if self.scheme == "https":
+            self._ssl_context = ssl.create_default_context()
+        self._idle: Dict[Tuple[str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        host, port = self.host, self.port
+        if self.proxy:
+            host = self.proxy.hostname
+            port = self.proxy.port or (443 if self.proxy.scheme == "https" else 80)
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(
+                host,
+                port,
+                timeout=self.connect_timeout,
+                context=self._ssl_context,
+            )
+            if self.proxy:
+                conn.set_tunnel(self.host, self.port, self._proxy_headers)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get((self.host, self.port))
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault((self.host, self.port), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        """Close every idle connection held by the pool."""
+        with self._lock:
+            pools, self._idle = self._idle, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+    def _request(
+        self,
+        path: str,
+        body: bytes,
+        headers: Dict[str, str],
+        timings: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Send a POST and return (connection, response). A pooled connection that
+        the server has since closed is retried once on a new connection, not on
+        another pooled one that may be just as stale; a fresh one is not retried,
+        since the server may have received the request.
+        """
+        if self.proxy and self.scheme != "https":
+            headers = {**headers, **self._proxy_headers}
+        conn, reused = self._acquire()
+        for attempt in range(2):
+            if attempt:
+                conn, reused = self._new_connection(), False
+            if timings is not None:
+                timings["connected"] = time.perf_counter()
+                timings["reused"] = reused
+            try:
+                conn.request("POST", self._target + path, body, headers)
+                response = conn.getresponse()
+                if timings is not None:
+                    timings["headers"] = time.perf_counter()
+                return conn, response
+            except (
+                http.client.RemoteDisconnected,
+                ConnectionResetError,
+                BrokenPipeError,
+            ):
+                conn.close()
+                if attempt or not reused:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def stream_chat(
+        self, payload: Dict[str, Any], timings: Optional[Dict[str, Any]] = None
+    ) -> Iterator[bytes]:
+        """
+        POST a streaming chat completion and yield the raw response body as it
+        arrives off the socket.
+
+        The connection goes back to the pool only once the response has been read
+        to the end; a caller that stops iterating early causes it to be closed.
+        If `timings` is given, perf_counter stamps of when the connection was
+        ready and the headers arrived are put in it, see aiia.telemetry.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer " + self.api_key,
+            "Connection": "keep-alive",
+        }
+        body = json.dumps(payload).encode("utf-8")
+        conn, response = self._request("/chat/completions", body, headers, timings)
+
+        if response.status != 200:
+            error_body = response.read()
+            conn.close()
+            raise urllib.error.HTTPError(
+                self.base_url + "/chat/completions",
+                response.status,
+                response.reason,
+                response.headers,
+                io.BytesIO(error_body),
+            )
+
+        finished = False
+        try:
+            while True:
+                data = response.read1(65536)
+                if not data:
+                    break
+                yield data
+            finished = True
+        finally:
+            if finished and not response.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+
+_default_client: Optional[Client] = None
+
+
+def default_client() -> Client:
+    """Return the shared module-level Client, creating it on first use."""
+    global _default_client
+    if _default_client is None:
+        _default_client = Client()
+    return _default_client
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def default_cache() -> Optional[ResponseCache]:
+    """
+    Return the shared ResponseCache if caching was opted into by setting the
+    AIIA_CACHE environment variable (to "1" or to a cache directory).
+    """
+    global _default_cache
+    setting = os.environ.get("AIIA_CACHE", "")
+    if _default_cache is None and setting not in ("", "0"):
+        _default_cache = ResponseCache(None if setting == "1" else setting)
+    return _default_cache
+
+
+class StopMatcher:
+    """
+    Finds the first of several stop sequences in text that arrives in chunks.
+
+    `feed` returns the part of the text seen so far that is certain to come
+    before any stop sequence. A tail that could still turn out to be the start
+    of one is held back until the next chunk, so each chunk is searched together
+    with at most the longest stop sequence's worth of earlier text.
+    """
+
+    def __init__(self, stop: List[str]):
+        self.stop = [s for s in stop if s]
+        self.stopped = False
+        self._held = ""
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped:
+            return ""
+        text = self._held + chunk
+        found = [i for i in (text.find(s) for s in self.stop) if i >= 0]
+        if found:
+            self.stopped = True
+            self._held = ""
+            return text[: min(found)]
+
+        hold = 0
+        for s in self.stop:
+            for k in range(min(len(s) - 1, len(text)), hold, -1):
+                if text.endswith(s[:k]):
+                    hold = k
+                    break
+        self._held = text[len(text) - hold :]
+        return text[: len(text) - hold]
+
+    def flush(self) -> str:
+        """Return the held back text once the stream has ended without a match."""
+        held, self._held = self._held, ""
+        return held
+
+
+def _normalize_stop(stop) -> List[str]:
+    if stop is None:
+        return []
+    return [stop] if isinstance(stop, str) else list(stop)
 
 
 def stream_response(
-    messages: List[Dict[str, Any]], model: str = "gpt-3.5-turbo"
+    messages: List[Dict[str, Any]],
+    model: str = "gpt-3.5-turbo",
+    client: Optional[Client] = None,
+    cache: Optional[ResponseCache] = None,
+    stop: Optional[List[str]] = None,
+    **params,
 ) -> Iterator[str]:
     """
     Stream response from the OpenAI API for chat-based language models.
 
     :param messages: A list of message dictionaries with 'role' and 'content' keys.
     :param model: The name of the language model to use. Defaults to "gpt-3.5-turbo".
+    :param client: The Client to send the request with. Defaults to a shared,
+        connection-pooling client.
+    :param cache: A ResponseCache to replay identical requests from. Defaults to
+        the cache enabled through AIIA_CACHE, if any.
+    :param stop: Sequences at which the response ends, not included in it. They
+        are sent to the API and also matched here as the response streams in,
+        closing the connection at the first match.
+    :param params: Extra sampling parameters for the payload, e.g. temperature.
     :returns: An iterator yielding the content of the response.
     """
-    payload = {"stream": True, "model": model, "messages": messages}
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer " + OPENAI_API_KEY,
-    }
-    url = "https://api.openai.com/v1/chat/completions"
+    stop = _normalize_stop(stop)
+    if stop:
+        params["stop"] = stop
+
+    if not telemetry.enabled():
+        yield from _cached_stream_response(messages, model, client, cache, params)
+        return
+
+    timer = telemetry.RequestTimer(model)
+    try:
+        for chunk in _cached_stream_response(
+            messages, model, client, cache, params, timer
+        ):
+            timer.chunk(chunk)
+            yield chunk
+    except Exception as e:
+        timer.error = repr(e)
+        raise
+    finally:
+        timer.finish()
 
-    req = urllib.request.Request(url, json.dumps(payload).encode("utf-8"), headers)
-    response = urllib.request.urlopen(req)
 
-    for line in response:
-        line = line.decode("utf-8")
-        line = line.lstrip("data: ").strip()
-        if not line:
-            continue
+def _cached_stream_response(
+    messages: List[Dict[str, Any]],
+    model: str,
+    client: Optional[Client],
+    cache: Optional[ResponseCache],
+    params: Dict[str, Any],
+    timer: Optional[telemetry.RequestTimer] = None,
+) -> Iterator[str]:
+    timings = timer.timings if timer is not None else None
+    cache = cache or default_cache()
+    if cache is None:
+        yield from _stream_response(messages, model, client, params, timings)
+        return
+
+    key = cache.key(model, messages, **params)
+    chunks = cache.get(key)
+    if chunks is not None:
+        if timer is not None:
+            timer.cached = True
+        yield from chunks
+        return
 
-        if line == "[DONE]":
-            break
+    chunks = []
+    for chunk in _stream_response(messages, model, client, params, timings):
+        chunks.append(chunk)
+        yield chunk
+    cache.put(key, chunks)
 
-        data = json.loads(line)
-        if data["object"] == "chat.completion.chunk":
-            delta = data["choices"][0]["delta"]
-            if delta != "":
-                yield delta.get("content", "")
+
+def _stream_response(
+    messages: List[Dict[str, Any]],
+    model: str,
+    client: Optional[Client],
+    params: Dict[str, Any],
+    timings: Optional[Dict[str, Any]] = None,
+) -> Iterator[str]:
+    payload = {**params, "stream": True, "model": model, "messages": messages}
+    client = client or default_client()
+    matcher = StopMatcher(params["stop"]) if params.get("stop") else None
+
+    body = client.stream_chat(payload, timings)
+    try:
+        for content in _iter_content(body):
+            if matcher is not None:
+                content = matcher.feed(content)
+                if matcher.stopped:
+                    # Closing the body drops the connection, which tells the
+                    # server to stop generating
+                    if content:
+                        yield content
+                    return
+            if content:
+                yield content
+        if matcher is not None:
+            held = matcher.flush()
+            if held:
+                yield held
+        # Drain the rest of the body so the connection can be reused
+        for _ in body:
+            pass
+    finally:
+        body.close()
+
+
+def _iter_content(body: Iterator[bytes]) -> Iterator[str]:
+    decoder = SSEDecoder()
+    for chunk in body:
+        for event in decoder.feed(chunk):
+            if event.event != "message":
+                continue
+            if event.data == "[DONE]":
+                return
+            content = delta_content(event.data)
+            if content:
+                yield content
 
 
 def get_response(*args, **kwargs) -> str:
     return "".join(stream_response(*args, **kwargs))
+
+
+class AsyncClient:
+    """
+    The asyncio counterpart of Client. Many streaming completions can be in
+    flight at once on a single event loop, each on its own persistent HTTP/1.1
+    connection drawn from a per-host pool.
+
+    Takes the same parameters as Client. Pooled connections belong to the event
+    loop that opened them and are discarded if the client is used from another.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENAI_BASE_URL,
+        api_key: Optional[str] = None,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        max_idle: int = 32,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key or OPENAI_API_KEY
+        assert self.api_key, "OPENAI_API_KEY environment variable required"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+
+        parsed = urllib.parse.urlsplit(self.base_url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.path = parsed.path
+
+        # As http.client writes it: IPv6 literals bracketed, the port only when
+        # it is not the scheme's default
+        self._host_header = f"[{self.host}]" if ":" in self.host else self.host
+        if self.port != (443 if self.scheme == "https" else 80):
+            self._host_header += f":{self.port}"
+
+        self._ssl_context = None
+        if self.scheme == "https":
+            self._ssl_context = ssl.create_default_context()
+        self._idle: Dict[Tuple[str, int], List[Tuple[Any, Any]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _new_connection(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host,
+                self.port,
+                ssl=self._ssl_context,
+                server_hostname=self.host if self._ssl_context else None,
+            ),
+            self.connect_timeout,
+        )
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return reader, writer
+
+    def _idle_connections(self) -> List[Tuple[Any, Any]]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._idle = {}
+        return self._idle.setdefault((self.host, self.port), [])
+
+    async def _acquire(self) -> Tuple[Tuple[Any, Any], bool]:
+        idle = self._idle_connections()
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        return await self._new_connection(), False
+
+    def _release(self, conn) -> None:
+        idle = self._idle_connections()
+        if len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def close(self) -> None:
+        """Close every idle connection held by the pool."""
+        pools, self._idle = self._idle, {}
+        for idle in pools.values():
+            for _, writer in idle:
+                writer.close()
+
+    async def _read(self, coro):
+        return await asyncio.wait_for(coro, self.read_timeout)
+
+    async def _request(
+        self,
+        path: str,
+        body: bytes,
+        headers: Dict[str, str],
+        timings: Optional[Dict[str, Any]] = None,
+    ):
+        head = f"POST {self.path + path} HTTP/1.1\r\nHost: {self._host_header}\r\n"
+        for name, value in headers.items():
+            head += f"{name}: {value}\r\n"
+        head += f"Content-Length: {len(body)}\r\n\r\n"
+
+        (reader, writer), reused = await self._acquire()
+        for attempt in range(2):
+            if attempt:
+                (reader, writer), reused = await self._new_connection(), False
+            if timings is not None:
+                timings["connected"] = time.perf_counter()
+                timings["reused"] = reused
+            try:
+                writer.write(head.encode("latin-1") + body)
+                await writer.drain()
+                status_line = await self._read(reader.readline())
+                if not status_line:
+                    raise ConnectionResetError("connection closed by server")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if attempt or not reused:
+                    raise
+                continue
+            except BaseException:
+                writer.close()
+                raise
+
+            _, status, reason = status_line.decode("latin-1").split(" ", 2)
+            response_headers = http.client.HTTPMessage()
+            while True:
+                line = await self._read(reader.readline())
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                response_headers[name.strip()] = value.strip()
+            if timings is not None:
+                timings["headers"] = time.perf_counter()
+            return (reader, writer), int(status), reason.strip(), response_headers
+
+    async def _iter_body(self, reader, headers) -> AsyncIterator[bytes]:
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size_line = await self._read(reader.readline())
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+                if size == 0:
+                    # Trailer section, terminated by an empty line
+                    while (await self._read(reader.readline())) not in (
+                        b"\r\n",
+                        b"\n",
+                        b"",
+                    ):
+                        pass
+                    return
+                data = await self._read(reader.readexactly(size + 2))
+                yield data[:-2]
+        elif "Content-Length" in headers:
+            remaining = int(headers["Content-Length"])
+            while remaining:
+                data = await self._read(reader.read(min(remaining, 65536)))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await self._read(reader.read(65536))
+                if not data:
+                    return
+                yield data
+
+    async def stream_chat(
+        self, payload: Dict[str, Any], timings: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        POST a streaming chat completion and yield the raw response body as it
+        arrives. As with Client.stream_chat, the connection is only pooled again
+        once the response has been read to the end, and `timings` is filled in.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer " + self.api_key,
+            "Connection": "keep-alive",
+        }
+        body = json.dumps(payload).encode("utf-8")
+        conn, status, reason, response_headers = await self._request(
+            "/chat/completions", body, headers, timings
+        )
+        reader, writer = conn
+        will_close = response_headers.get("Connection", "").lower() == "close"
+
+        if status != 200:
+            error_body = b"".join(
+                [data async for data in self._iter_body(reader, response_headers)]
+            )
+            writer.close()
+            raise urllib.error.HTTPError(
+                self.base_url + "/chat/completions",
+                status,
+                reason,
+                response_headers,
+                io.BytesIO(error_body),
+            )
+
+        finished = False
+        try:
+            async for data in self._iter_body(reader, response_headers):
+                yield data
+            finished = True
+        finally:
+            if finished and not will_close:
+                self._release(conn)
+            else:
+                writer.close()
+
+
+_default_async_client: Optional[AsyncClient] = None
+
+
+def default_async_client() -> AsyncClient:
+    """Return the shared module-level AsyncClient, creating it on first use."""
+    global _default_async_client
+    if _default_async_client is None:
+        _default_async_client = AsyncClient()
+    return _default_async_client
+
+
+async def astream_response(
+    messages: List[Dict[str, Any]],
+    model: str = "gpt-3.5-turbo",
+    client: Optional[AsyncClient] = None,
+    cache: Optional[ResponseCache] = None,
+    stop: Optional[List[str]] = None,
+    **params,
+) -> AsyncIterator[str]:
+    """
+    Asynchronously stream a response from the OpenAI API, see stream_response.
+
+    :param client: The AsyncClient to send the request with. Defaults to a
+        shared, connection-pooling client.
+    :returns: An async iterator yielding the content of the response.
+    """
+    stop = _normalize_stop(stop)
+    if stop:
+        params["stop"] = stop
+
+    timer = telemetry.RequestTimer(model) if telemetry.enabled() else None
+    stream = _astream_response(messages, model, client, cache, params, timer)
+    try:
+        async for chunk in stream:
+            if timer is not None:
+                timer.chunk(chunk)
+            yield chunk
+    except Exception as e:
+        if timer is not None:
+            timer.error = repr(e)
+        raise
+    finally:
+        await stream.aclose()
+        if timer is not None:
+            timer.finish()
+
+
+async def _astream_response(
+    messages: List[Dict[str, Any]],
+    model: str,
+    client: Optional[AsyncClient],
+    cache: Optional[ResponseCache],
+    params: Dict[str, Any],
+    timer: Optional[telemetry.RequestTimer] = None,
+) -> AsyncIterator[str]:
+    matcher = StopMatcher(params["stop"]) if params.get("stop") else None
+    cache = cache or default_cache()
+    key = cache.key(model, messages, **params) if cache is not None else None
+    if cache is not None:
+        chunks = cache.get(key)
+        if chunks is not None:
+            if timer is not None:
+                timer.cached = True
+            for chunk in chunks:
+                yield chunk
+            return
+
+    payload = {**params, "stream": True, "model": model, "messages": messages}
+    client = client or default_async_client()
+
+    chunks = []
+    decoder = SSEDecoder()
+    body = client.stream_chat(payload, timer.timings if timer is not None else None)
+    try:
+        done = False
+        async for data in body:
+            if done:
+                continue
+            for event in decoder.feed(data):
+                if event.event != "message":
+                    continue
+                if event.data == "[DONE]":
+                    done = True
+                    break
+                content = delta_content(event.data)
+                if matcher is not None and content:
+                    content = matcher.feed(content)
+                    done = matcher.stopped
+                if content:
+                    chunks.append(content)
+                    yield content
+                if done:
+                    break
+            if matcher is not None and matcher.stopped:
+                # Dropping the connection tells the server to stop generating
+                break
+        if matcher is not None:
+            held = matcher.flush()
+            if held:
+                chunks.append(held)
+                yield held
+    finally:
+        await body.aclose()
+
+    if cache is not None:
+        cache.put(key, chunks)
+
+
+async def aget_response(*args, **kwargs) -> str:
+    return "".join([chunk async for chunk in astream_response(*args, **kwargs)])
+
+
+async def gather_responses(
+    batch: List[List[Dict[str, Any]]],
+    max_concurrency: int = 8,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> List[str]:
+    """
+    Get responses for many conversations at once, with at most `max_concurrency`
+    requests in flight.
+
+    :param batch: A list of conversations, each a list of message dictionaries.
+    :param max_concurrency: The maximum number of concurrent requests.
+    :param return_exceptions: Return the exception in place of the response for
+        requests that fail, rather than raising the first one.
+    :param kwargs: Passed to aget_response for every conversation, e.g. model.
+    :returns: The responses, in the same order as `batch`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def respond(messages):
+        async with semaphore:
+            return await aget_response(messages, **kwargs)
+
+    return await asyncio.gather(
+        *[respond(messages) for messages in batch],
+        return_exceptions=return_exceptions,
+    )
@@ -1,7 +1,30 @@
-import re
-import yaml
+import io
+import os
+import json
+import time
+import itertools
 
-from typing import Dict, List, Union
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Union
+
+
+# PyYAML is imported on first use, so logs without frontmatter never pay for it.
+# libyaml's C loader and dumper are several times faster than the pure Python
+# ones, which are used when PyYAML was built without it or USE_LIBYAML is unset
+USE_LIBYAML = True
+
+
+def _load_yaml(text: str) -> Any:
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", None) if USE_LIBYAML else None
+    return yaml.load(text, Loader=loader or yaml.SafeLoader)
+
+
+def _dump_yaml(data: Any, fileobj: TextIO) -> None:
+    import yaml
+
+    dumper = getattr(yaml, "CSafeDumper", None) if USE_LIBYAML else None
+    yaml.dump(data, fileobj, Dumper=dumper or yaml.SafeDumper, sort_keys=False)
 
 
 def parse_chat_markdown(
@@ -23,63 +46,122 @@ def parse_chat_markdown(
             dictionary.  - messages (list): A list of dictionaries, each containing the 'role'
             (system, user, or assistant) and 'content' of the message.
     """
-    pattern = re.compile(r"^---$", re.MULTILINE)
-    matches = pattern.findall(contents)
-    if len(matches) >= 2:
-        parts = contents.split("---", 2)
-        yaml_frontmatter = parts[1].strip()
-        yaml_data = yaml.safe_load(yaml_frontmatter)
-        markdown_body = parts[2].strip()
-    else:
-        yaml_data = {}
-        markdown_body = contents.strip()
-
-    messages = []
-    message = ""
-    role = ""
+    items = _iter_chat_lines(contents.splitlines())
+    metadata = next(items)
+
+    return {
+        "metadata": metadata,
+        "messages": list(items),
+    }
+
+
+def load_chat(contents: str, input_format: str = "markdown") -> Dict[str, Any]:
+    """Loads a chat from markdown, json, or plain text (a single user message).
+
+    Args:
+        contents (str): The chat log.
+        input_format (str): One of 'markdown', 'json' or 'text'.
+
+    Returns:
+        dict: A dictionary with 'metadata' and 'messages' keys.
+    """
+    if input_format == "markdown":
+        return parse_chat_markdown(contents)
+    elif input_format == "json":
+        return json.loads(contents)
+    elif input_format == "text":
+        return {
+            "metadata": {},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": contents,
+                }
+            ],
+        }
+    raise ValueError(f"Unknown input format {input_format!r}")
+
+
+def iter_chat_markdown(fileobj: TextIO) -> Iterator[Dict[str, Any]]:
+    """Incrementally parses a chat markdown file, see `parse_chat_markdown`.
+
+    The first item yielded is the metadata dictionary from the YAML frontmatter (empty if
+    there is none). It is followed by each message dictionary, yielded as soon as the
+    boundary (`>>>` or `🤖 GPT:`) that ends it has been read, so only one message is ever
+    held in memory.
+
+    Args:
+        fileobj (TextIO): A text stream of the chat markdown file, e.g. an open file or
+            sys.stdin.
+
+    Yields:
+        dict: The metadata, then one dictionary per message with 'role' and 'content'.
+    """
+    lines = (line[:-1] if line.endswith("\n") else line for line in fileobj)
+    return _iter_chat_lines(lines)
+
+
+def _iter_chat_lines(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    lines = iter(lines)
+
+    # The first non-blank line opens the frontmatter if it is `---`
+    first = next((line for line in lines if line.strip()), None)
+    body: List[str] = [first] if first is not None else []
+
+    yaml_data = {}
+    if first == "---":
+        frontmatter: List[str] = []
+        for line in lines:
+            if line == "---":
+                yaml_frontmatter = "\n".join(frontmatter).strip()
+                yaml_data = _load_yaml(yaml_frontmatter) or {}
+                body = []
+                break
+            frontmatter.append(line)
+        else:
+            # Never closed, so it was not frontmatter after all
+            body += frontmatter
+
+    yield yaml_data
 
     if yaml_data.get("prompt"):
-        messages.append({"role": "system", "content": yaml_data["prompt"]})
+        yield {"role": "system", "content": yaml_data["prompt"]}
+
+    message: List[str] = []
+    role = ""
+    started = False
+
+    for line in itertools.chain(body, lines):
+        if not started:
+            if not line.strip():
+                continue
+            line = line.lstrip()
+            started = True
 
-    for line in markdown_body.splitlines():
         if line.startswith(">>>"):
             if message:
-                message = message.strip()
-                messages.append(
-                    {
-                        "role": role,
-                        "content": message,
-                    }
-                )
+                yield {
+                    "role": role,
+                    "content": "\n".join(message).strip(),
+                }
             role = "user"
-            message = line[3:].strip() + "\n"
+            message = [line[3:].strip()]
         elif line.startswith("🤖 GPT:"):
             if message:
-                message = message.strip()
-                messages.append(
-                    {
-                        "role": role,
-                        "content": message,
-                    }
-                )
+                yield {
+                    "role": role,
+                    "content": "\n".join(message).strip(),
+                }
             role = "assistant"
-            message = line[7:].strip() + "\n"
+            message = [line[7:].strip()]
         else:
-            message += line + "\n"
+            message.append(line)
 
     if message:
-        message = message.strip()
-        messages.append(
-            {
-                "role": role,
-                "content": message,
-            }
-        )
-
-    return {
-        "metadata": yaml_data,
-        "messages": messages,
-    }
+        yield {
+            "role": role,
+            "content": "\n".join(message).strip(),
+        }
 
 
 def to_chat_markdown(chat: dict) -> str:
@@ -91,13 +173,100 @@ def to_chat_markdown(chat: dict) -> str:
     Returns:
         str: Formatted markdown string with YAML frontmatter
     """
-    yaml_frontmatter: str = yaml.safe_dump(chat["metadata"], sort_keys=False)
-    markdown_body: str = ""
+    buffer = io.StringIO()
+    write_chat_markdown(chat, buffer)
+    return buffer.getvalue()
+
+
+def write_chat_markdown(chat: dict, fileobj: TextIO) -> None:
+    """Serializes a chat to markdown with YAML frontmatter, writing it piece by piece.
+
+    The frontmatter and every message are written straight to `fileobj`, so no copy
+    of the whole document is ever built. `chat["messages"]` may be any iterable,
+    including the generator returned by `iter_chat_markdown`.
+
+    Args:
+        chat (dict): A dictionary with 'metadata' and 'messages' keys.
+        fileobj (TextIO): The text stream to write to.
+    """
+    fileobj.write("---\n")
+    _dump_yaml(chat["metadata"], fileobj)
+    fileobj.write("---\n\n")
+    write_messages_markdown(chat["messages"], fileobj)
+
+
+def write_messages_markdown(
+    messages: Iterable[Dict[str, Any]], fileobj: TextIO
+) -> None:
+    """Writes the user and assistant messages of a chat as markdown, see `write_chat_markdown`.
 
-    for message in chat["messages"]:
+    Args:
+        messages (Iterable[dict]): Message dictionaries with 'role' and 'content'.
+        fileobj (TextIO): The text stream to write to.
+    """
+    for message in messages:
         if message["role"] == "user":
-            markdown_body += f">>> {message['content']}\n\n"
+            fileobj.write(">>> ")
+            fileobj.write(message["content"])
+            fileobj.write("\n\n")
         elif message["role"] == "assistant":
-            markdown_body += f"🤖 GPT:\n\n{message['content']}\n\n"
+            fileobj.write("🤖 GPT:\n\n")
+            fileobj.write(message["content"])
+            fileobj.write("\n\n")
+
+
+def append_assistant_message(
+    file_path: str, chunks: Iterable[str], fsync_interval: float = 1.0
+) -> None:
+    """Streams an assistant reply onto the end of a chat markdown file.
+
+    Once the first chunk arrives, trailing whitespace is trimmed, then the `🤖 GPT:`
+    header is appended and each chunk is written as it arrives. Nothing before the end
+    of the file is rewritten, so the cost scales with the reply rather than with the
+    log. The file is fsynced after the first chunk, at most every `fsync_interval`
+    seconds while streaming, and at the end. Since the file is a valid chat log at
+    every point, a crash mid-stream leaves a truncated assistant message that parses
+    normally and can be edited or retried, and a request that fails before replying
+    leaves the file as it was.
+
+    Args:
+        file_path (str): The chat markdown file to append to.
+        chunks (Iterable[str]): The reply, e.g. from `aiia.gpt.stream_response`.
+        fsync_interval (float): Minimum number of seconds between fsyncs.
+    """
+    with open(file_path, "rb+") as f:
+        # Find where the trailing whitespace starts by reading back from the end
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            tail = f.read(end - start)
+            stripped = tail.rstrip()
+            if stripped:
+                end = start + len(stripped)
+                break
+            end = start
+
+        def write_header():
+            f.truncate(end)
+            f.seek(end)
+            header = "\n\n🤖 GPT:\n\n" if end else "🤖 GPT:\n\n"
+            f.write(header.encode("utf-8"))
+
+        started = False
+        last_sync = float("-inf")
+        for chunk in chunks:
+            if not started:
+                write_header()
+                started = True
+            f.write(chunk.encode("utf-8"))
+            f.flush()
+            if time.monotonic() - last_sync >= fsync_interval:
+                os.fsync(f.fileno())
+                last_sync = time.monotonic()
 
-    return f"---\n{yaml_frontmatter}---\n\n{markdown_body}"
+        if not started:
+            write_header()
+        f.write(b"\n\n")
+        f.flush()
+        os.fsync(f.fileno())
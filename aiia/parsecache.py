@@ -0,0 +1,137 @@
+"""
+A sidecar cache of parsed chat logs for tools that read the whole archive.
+
+Each log's parsed form (metadata and messages) is pickled into one SQLite table
+keyed by its path, along with the mtime and size it was parsed at. A log that
+has not changed since is loaded from there without reading it or running the
+YAML and markdown parsers; one that has is parsed again and its row replaced,
+so the cache holds at most one entry per log.
+
+It is opt-in: set AIIA_PARSE_CACHE to "1" (or to a file) and `aiia
+respond-batch`, `aiia search` and `scripts/summarize-chats` use it.
+"""
+import os
+import pickle
+import sqlite3
+
+from typing import Any, Dict, Optional
+
+from . import parse
+from .cache import default_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parsed (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+
+def default_cache_path() -> str:
+    return default_cache_dir("parsed.sqlite")
+
+
+class ParsedLogCache:
+    """
+    :param path: SQLite file to keep parsed logs in. Defaults to
+        ~/.cache/aiia/parsed.sqlite. Entries are pickled, so it must only be
+        writable by the user.
+    :param commit_every: Commit after this many new entries; `close` commits the
+        rest.
+    """
+
+    def __init__(self, path: Optional[str] = None, commit_every: int = 256):
+        self.path = path or default_cache_path()
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        os.chmod(self.path, 0o600)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def get(self, path: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        """The parsed log, if it was stored at the same mtime and size."""
+        row = self.conn.execute(
+            "SELECT data FROM parsed WHERE path = ? AND mtime_ns = ? AND size = ?",
+            (path, st.st_mtime_ns, st.st_size),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            data = pickle.loads(row[0])
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, path: str, st: os.stat_result, data: Dict[str, Any]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)",
+            (
+                path,
+                st.st_mtime_ns,
+                st.st_size,
+                pickle.dumps(data, pickle.HIGHEST_PROTOCOL),
+            ),
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def load(self, path: str, st: Optional[os.stat_result] = None) -> Dict[str, Any]:
+        """Parse the log at `path`, or load it from the cache if unchanged."""
+        st = st or os.stat(path)
+        data = self.get(path, st)
+        if data is None:
+            with open(path, "r") as f:
+                data = parse.parse_chat_markdown(f.read())
+            self.put(path, st, data)
+        return data
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self) -> "ParsedLogCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def cache_path_from_env() -> Optional[str]:
+    setting = os.environ.get("AIIA_PARSE_CACHE", "")
+    if setting in ("", "0"):
+        return None
+    return default_cache_path() if setting == "1" else setting
+
+
+def default_cache() -> Optional[ParsedLogCache]:
+    """A ParsedLogCache if AIIA_PARSE_CACHE is set, otherwise None."""
+    path = cache_path_from_env()
+    return ParsedLogCache(path) if path is not None else None
+
+
+def load_chat_log(
+    path: str,
+    st: Optional[os.stat_result] = None,
+    cache: Optional[ParsedLogCache] = None,
+) -> Dict[str, Any]:
+    """Parse the log at `path`, through `cache` if one is given."""
+    if cache is not None:
+        return cache.load(path, st)
+    with open(path, "r") as f:
+        return parse.parse_chat_markdown(f.read())
@@ -0,0 +1,181 @@
+"""
+A full-text search index over the chat log archive, stored in SQLite FTS5.
+
+Every message of every `.chat.md` file becomes one row, alongside the title and
+model from the log's frontmatter. The index is brought up to date from file
+mtimes and sizes before each search, so only logs that changed are re-parsed.
+"""
+import os
+import sqlite3
+
+from typing import Any, Dict, List, Optional
+
+from . import parsecache
+from .cache import default_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    first_rowid INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5 (
+    path UNINDEXED,
+    position UNINDEXED,
+    role UNINDEXED,
+    model UNINDEXED,
+    title,
+    content,
+    tokenize = 'unicode61'
+);
+"""
+
+
+def default_index_path() -> str:
+    return default_cache_dir("search.sqlite")
+
+
+def default_chat_logs_dir() -> str:
+    return os.path.expanduser("~/chat-logs")
+
+
+def connect(index_path: Optional[str] = None) -> sqlite3.Connection:
+    index_path = index_path or default_index_path()
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def update_index(
+    conn: sqlite3.Connection,
+    directory: str,
+    cache: Optional[parsecache.ParsedLogCache] = None,
+) -> int:
+    """
+    Re-index every chat log in `directory` whose mtime or size changed since it
+    was last indexed, and drop logs that no longer exist. Returns the number of
+    logs that were (re-)indexed. Logs are loaded through `cache` if given, which
+    saves parsing them again when the index is rebuilt.
+    """
+    indexed = {
+        path: (mtime_ns, size, first_rowid, count)
+        for path, mtime_ns, size, first_rowid, count in conn.execute(
+            "SELECT path, mtime_ns, size, first_rowid, count FROM files"
+        )
+    }
+
+    changed = []
+    seen = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".chat.md") or not entry.is_file():
+                continue
+            st = entry.stat()
+            seen.add(entry.path)
+            known = indexed.get(entry.path)
+            if known is None or known[:2] != (st.st_mtime_ns, st.st_size):
+                changed.append((entry.path, st))
+
+    removed = [path for path in indexed if path not in seen]
+    if not changed and not removed:
+        return 0
+
+    def delete(path):
+        # Each log's messages occupy a contiguous rowid range, which FTS5 can
+        # delete by key rather than by scanning the UNINDEXED path column
+        _, _, first_rowid, count = indexed[path]
+        conn.execute(
+            "DELETE FROM messages WHERE rowid BETWEEN ? AND ?",
+            (first_rowid, first_rowid + count - 1),
+        )
+
+    with conn:
+        for path in removed:
+            delete(path)
+            conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+        (next_rowid,) = conn.execute(
+            "SELECT coalesce(max(rowid), 0) + 1 FROM messages"
+        ).fetchone()
+
+        for path, st in changed:
+            try:
+                data = parsecache.load_chat_log(path, st, cache)
+            except Exception:
+                # An unparsable log is indexed as empty until it changes again
+                data = {"metadata": {}, "messages": []}
+
+            metadata = data.get("metadata") or {}
+            title = str(metadata.get("title", ""))
+            model = str(metadata.get("model", ""))
+            messages = data.get("messages", [])
+
+            if path in indexed:
+                delete(path)
+            conn.executemany(
+                "INSERT INTO messages"
+                " (rowid, path, position, role, model, title, content)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (next_rowid + i, path, i, m["role"], model, title, m["content"])
+                    for i, m in enumerate(messages)
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_mtime_ns, st.st_size, next_rowid, len(messages)),
+            )
+            next_rowid += len(messages)
+
+    return len(changed)
+
+
+def to_fts_query(query: str) -> str:
+    """Quote every word of a plain query, so that each must appear literally."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def search(
+    conn: sqlite3.Connection, query: str, limit: int = 20, raw: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Return the best matching messages for `query`, ranked by bm25 with matches
+    in titles weighted above matches in message content.
+
+    :param query: Words to look for, or an FTS5 query if `raw` is set.
+    :param limit: The maximum number of results.
+    :returns: Dictionaries with path, position, role, title, model and snippet.
+    :raises ValueError: If the query is empty or, with `raw`, not valid FTS5.
+    """
+    if not query.strip():
+        raise ValueError("Empty search query")
+    try:
+        rows = conn.execute(
+            """
+            SELECT path, position, role, title, model,
+                   snippet(messages, 5, '[', ']', '…', 16)
+            FROM messages
+            WHERE messages MATCH ?
+            ORDER BY bm25(messages, 0, 0, 0, 0, 5.0, 1.0)
+            LIMIT ?
+            """,
+            (query if raw else to_fts_query(query), limit),
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search query {query!r}: {e}") from e
+    return [
+        {
+            "path": path,
+            "position": position,
+            "role": role,
+            "title": title,
+            "model": model,
+            "snippet": snippet,
+        }
+        for path, position, role, title, model, snippet in rows
+    ]
@@ -0,0 +1,164 @@
+"""
+A long-lived `aiia serve` daemon listening on a Unix domain socket.
+
+Editors and the `aiia` CLI can send it requests instead of starting a fresh
+Python process for every action, so interpreter startup, imports and the HTTPS
+handshake to the API are paid once.
+
+The protocol is newline-delimited JSON frames. Every request carries an `id`
+that is echoed back on each frame answering it, so several requests can be in
+flight on one connection:
+
+    -> {"id": 1, "type": "parse", "contents": "...", "input_format": "markdown"}
+    <- {"id": 1, "type": "result", "data": {"metadata": {...}, "messages": [...]}}
+
+    -> {"id": 2, "type": "respond", "contents": "...", "input_format": "markdown"}
+    <- {"id": 2, "type": "chunk", "content": "Hello"}
+    <- {"id": 2, "type": "done"}
+
+    -> {"id": 2, "type": "cancel"}
+
+A respond request may set `coalesce_ms` to have chunks arriving within that
+many milliseconds of the last one sent joined into one frame.
+
+Any failure is reported as `{"id": ..., "type": "error", "message": "..."}`.
+Closing the connection cancels whatever it still has in flight.
+"""
+import os
+import sys
+import json
+import asyncio
+
+from typing import Any, Dict, Optional
+
+from . import events, parse
+from .daemon import default_socket_path, is_running
+
+
+def format_chat(data: Dict[str, Any], output_format: str) -> str:
+    """Serialize a parsed chat the way `aiia parse` prints it."""
+    if output_format == "markdown":
+        return parse.to_chat_markdown(data)
+    if output_format == "jsonl":
+        lines = [json.dumps({"metadata": data.get("metadata", {})})]
+        lines += [json.dumps(message) for message in data.get("messages", [])]
+        return "\n".join(lines)
+    return json.dumps(data, indent=4)
+
+
+class Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.tasks: Dict[Any, asyncio.Task] = {}
+
+    def send(self, frame: Dict[str, Any]) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(frame).encode("utf-8") + b"\n")
+
+    async def serve(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    self.send({"id": None, "type": "error", "message": str(e)})
+                    continue
+                self.dispatch(request)
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+            self.writer.close()
+
+    def dispatch(self, request: Dict[str, Any]) -> None:
+        request_id = request.get("id")
+        if request.get("type") == "cancel":
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            return
+
+        task = asyncio.create_task(self.handle(request))
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(request_id, None))
+
+    async def handle(self, request: Dict[str, Any]) -> None:
+        request_id = request.get("id")
+        try:
+            if request.get("type") == "parse":
+                await self.handle_parse(request_id, request)
+            elif request.get("type") == "respond":
+                await self.handle_respond(request_id, request)
+            else:
+                raise ValueError(f"Unknown request type {request.get('type')!r}")
+        except asyncio.CancelledError:
+            self.send({"id": request_id, "type": "cancelled"})
+        except Exception as e:
+            self.send({"id": request_id, "type": "error", "message": str(e)})
+        await self.drain()
+
+    async def drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle_parse(self, request_id, request: Dict[str, Any]) -> None:
+        data = parse.load_chat(
+            request.get("contents", ""), request.get("input_format", "markdown")
+        )
+        frame: Dict[str, Any] = {"id": request_id, "type": "result", "data": data}
+        if request.get("output_format"):
+            frame["output"] = format_chat(data, request["output_format"])
+        self.send(frame)
+
+    async def handle_respond(self, request_id, request: Dict[str, Any]) -> None:
+        from . import context, gpt
+
+        data = parse.load_chat(
+            request.get("contents", ""), request.get("input_format", "markdown")
+        )
+        model = data.get("metadata", {}).get(
+            "model", request.get("model", "gpt-3.5-turbo")
+        )
+        # Summaries are not written back to the client's buffer, the next turn
+        # finds them in the summary cache instead
+        messages, _ = await asyncio.to_thread(context.fit_chat, data, model)
+        chunks = gpt.astream_response(messages, model=model)
+        interval = float(request.get("coalesce_ms") or 0) / 1000
+        try:
+            async for chunk in events.acoalesce(chunks, interval):
+                self.send({"id": request_id, "type": "chunk", "content": chunk})
+                await self.drain()
+        finally:
+            await chunks.aclose()
+        self.send({"id": request_id, "type": "done"})
+
+
+async def serve(socket_path: Optional[str] = None) -> None:
+    socket_path = socket_path or default_socket_path()
+    if os.path.exists(socket_path):
+        if is_running(socket_path):
+            raise RuntimeError(f"aiia serve is already running on {socket_path}")
+        os.unlink(socket_path)
+
+    async def on_connect(reader, writer):
+        await Connection(reader, writer).serve()
+
+    # Create the socket private rather than chmod it after, when it is already
+    # accepting connections
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(on_connect, path=socket_path)
+    finally:
+        os.umask(umask)
+    print(f"> Listening on {socket_path}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
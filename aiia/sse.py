@@ -0,0 +1,118 @@
+import json
+
+from json.decoder import scanstring
+from typing import List, NamedTuple, Optional
+
+
+class Event(NamedTuple):
+    event: str
+    data: str
+    id: str
+
+
+class SSEDecoder:
+    """
+    An incremental Server-Sent-Events decoder.
+
+    Raw bytes are fed in as they arrive off the socket, in chunks of any size, and
+    every event completed by that chunk is returned. Lines may end in CRLF, LF or
+    CR; comments (keepalives) are skipped; multiple `data:` lines are joined with
+    newlines, as the spec requires, and an event with no data is not dispatched.
+
+    ```
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            print(event.event, event.data)
+    ```
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._event = ""
+        self._data: List[str] = []
+        self._id = ""
+
+    def feed(self, chunk: bytes) -> List[Event]:
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if b"\r" in buffer:
+            # A trailing CR may be the first half of a CRLF split across chunks
+            held = b"\r" if buffer.endswith(b"\r") else b""
+            if held:
+                buffer = buffer[:-1]
+            buffer = buffer.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        else:
+            held = b""
+
+        # Decode everything up to the last complete line in one go; a line break
+        # never falls inside a multi-byte UTF-8 sequence
+        last = buffer.rfind(b"\n")
+        self._buffer = buffer[last + 1 :] + held
+        if last == -1:
+            return []
+
+        events = []
+        data = self._data
+        for line in buffer[:last].decode("utf-8").split("\n"):
+            if line.startswith("data: "):
+                data.append(line[6:])
+            elif not line:
+                if data:
+                    joined = "\n".join(data)
+                    if joined:
+                        events.append(Event(self._event or "message", joined, self._id))
+                    data = self._data = []
+                self._event = ""
+            else:
+                self._field(line)
+                data = self._data
+        return events
+
+    def _field(self, line: str) -> None:
+        if line.startswith(":"):
+            return
+
+        name, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+
+        if name == "data":
+            self._data.append(value)
+        elif name == "event":
+            self._event = value
+        elif name == "id":
+            self._id = value
+
+
+_DELTA_MARKERS = ('"delta":{"content":"', '"delta": {"content": "')
+
+
+def delta_content(data: str) -> Optional[str]:
+    """
+    Return the content delta carried by a chat.completion.chunk event, or None if
+    it carries none or is not JSON at all.
+
+    The common single-choice `{"delta":{"content":"..."}}` shape is handled by
+    scanning straight to the string, without decoding the rest of the object;
+    anything else falls back to json.loads.
+    """
+    if '"chat.completion.chunk"' in data:
+        for marker in _DELTA_MARKERS:
+            start = data.find(marker)
+            if start != -1 and data.find('"delta"', start + 8) == -1:
+                content, end = scanstring(data, start + len(marker))
+                if data.startswith("}", end):
+                    return content
+                break
+
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return None
+    if (
+        not isinstance(message, dict)
+        or message.get("object") != "chat.completion.chunk"
+    ):
+        return None
+    choices = message.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
@@ -0,0 +1,251 @@
+"""
+Latency telemetry for chat completion requests.
+
+When at least one sink is registered, `aiia.gpt.stream_response` and
+`astream_response` time every request and hand each sink one record:
+
+    {"time": 1690000000.0, "model": "gpt-4", "cached": false, "reused": true,
+     "connect_ms": 0.1, "headers_ms": 310.2, "ttft_ms": 412.9,
+     "duration_ms": 3120.4, "chunks": 182, "chars": 731, "tokens_per_s": 67.2,
+     "gap_p50_ms": 11.8, "gap_p95_ms": 40.1, "gap_p99_ms": 95.3,
+     "gap_max_ms": 120.0, "gap_histogram": [0, 3, ...], "error": null}
+
+`connect_ms` is the time to get a connection (near zero when a pooled one was
+reused), `headers_ms` until the response headers arrived and `ttft_ms` until
+the first content. Gaps between chunks are kept as counts in GAP_BUCKETS, so
+logs of many requests can be merged into one histogram.
+
+Setting AIIA_TELEMETRY to "1", or to a file path, appends every record to a
+JSONL log (by default ~/.cache/aiia/telemetry.jsonl) which `aiia stats`
+summarizes. With no sinks nothing is timed at all.
+"""
+import os
+import json
+import time
+import bisect
+
+from typing import Any, Callable, Dict, List, Optional
+
+from .cache import default_cache_dir
+
+Sink = Callable[[Dict[str, Any]], None]
+
+# Upper bounds in milliseconds of the inter-chunk gap histogram buckets; the last
+# bucket counts everything slower
+GAP_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096]
+
+_sinks: List[Sink] = []
+_configured = False
+
+
+def default_log_path() -> str:
+    return default_cache_dir("telemetry.jsonl")
+
+
+def log_path_from_env() -> Optional[str]:
+    setting = os.environ.get("AIIA_TELEMETRY", "")
+    if setting in ("", "0"):
+        return None
+    return default_log_path() if setting == "1" else setting
+
+
+def enabled() -> bool:
+    global _configured
+    if not _configured:
+        _configured = True
+        path = log_path_from_env()
+        if path is not None:
+            _sinks.append(JSONLSink(path))
+    return bool(_sinks)
+
+
+def add_sink(sink: Sink) -> None:
+    _sinks.append(sink)
+
+
+def remove_sink(sink: Sink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def emit(record: Dict[str, Any]) -> None:
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception:
+            # Telemetry must never break a request
+            pass
+
+
+class JSONLSink:
+    """Appends each record as one line to `path`, shared safely by processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        # One write on an O_APPEND descriptor, so lines never interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+class MemorySink:
+    """Keeps the records in a list, e.g. for `aiia respond --stats`."""
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        self.records.append(record)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """The `q`th percentile (0-100) of `values` by nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(len(ordered) * q / 100 + 0.5), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class RequestTimer:
+    """
+    Times one streamed request. `timings` is filled in by the client with
+    perf_counter stamps: `connected`, `headers` and whether the connection was
+    `reused`.
+    """
+
+    def __init__(self, model: str, cached: bool = False):
+        self.model = model
+        self.cached = cached
+        self.time = time.time()
+        self.start = time.perf_counter()
+        self.timings: Dict[str, Any] = {}
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.gaps: List[float] = []
+        self.chunks = 0
+        self.chars = 0
+        self.error: Optional[str] = None
+
+    def chunk(self, content: str) -> None:
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+        self.chunks += 1
+        self.chars += len(content)
+
+    def record(self) -> Dict[str, Any]:
+        end = time.perf_counter()
+        gaps_ms = [gap * 1000 for gap in self.gaps]
+        histogram = [0] * (len(GAP_BUCKETS) + 1)
+        for gap in gaps_ms:
+            histogram[bisect.bisect_left(GAP_BUCKETS, gap)] += 1
+
+        def since_start(stamp):
+            return _ms(stamp - self.start) if stamp is not None else None
+
+        streaming = (self.last - self.first) if self.first is not None else 0
+        return {
+            "time": self.time,
+            "model": self.model,
+            "cached": self.cached,
+            "reused": self.timings.get("reused"),
+            "connect_ms": since_start(self.timings.get("connected")),
+            "headers_ms": since_start(self.timings.get("headers")),
+            "ttft_ms": since_start(self.first),
+            "duration_ms": _ms(end - self.start),
+            "chunks": self.chunks,
+            "chars": self.chars,
+            "tokens_per_s": round((self.chunks - 1) / streaming, 2)
+            if streaming > 0
+            else None,
+            "gap_p50_ms": percentile(gaps_ms, 50),
+            "gap_p95_ms": percentile(gaps_ms, 95),
+            "gap_p99_ms": percentile(gaps_ms, 99),
+            "gap_max_ms": max(gaps_ms) if gaps_ms else None,
+            "gap_histogram": histogram,
+            "error": self.error,
+        }
+
+    def finish(self) -> None:
+        emit(self.record())
+
+
+def read_log(path: str) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A line cut short by a crash
+                continue
+    return records
+
+
+def histogram_percentile(histogram: List[int], q: float) -> Optional[float]:
+    """The upper bound of the bucket holding the `q`th percentile."""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = max(int(total * q / 100 + 0.5), 1)
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return GAP_BUCKETS[bucket] if bucket < len(GAP_BUCKETS) else float("inf")
+    return float("inf")
+
+
+METRICS = ["connect_ms", "headers_ms", "ttft_ms", "duration_ms", "tokens_per_s"]
+
+
+def format_summary(records: List[Dict[str, Any]]) -> str:
+    """
+    A table of p50/p95/p99/max per metric over `records`, plus the merged
+    histogram of gaps between chunks.
+    """
+    cached = sum(r.get("cached") is True for r in records)
+    errors = sum(bool(r.get("error")) for r in records)
+    lines = [f"{len(records)} requests, {cached} cached, {errors} failed"]
+
+    lines.append(f"{'':14}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for metric in METRICS:
+        values = [r[metric] for r in records if r.get(metric) is not None]
+        if not values:
+            continue
+        cells = [percentile(values, q) for q in (50, 95, 99)] + [max(values)]
+        lines.append(f"{metric:14}" + "".join(f"{cell:10.1f}" for cell in cells))
+
+    histogram = [0] * (len(GAP_BUCKETS) + 1)
+    for r in records:
+        for bucket, count in enumerate(r.get("gap_histogram") or []):
+            histogram[bucket] += count
+    if sum(histogram):
+        cells = [histogram_percentile(histogram, q) for q in (50, 95, 99)]
+        gaps = [r["gap_max_ms"] for r in records if r.get("gap_max_ms") is not None]
+        cells.append(max(gaps))
+        lines.append(f"{'gap_ms (<=)':14}" + "".join(f"{cell:10.1f}" for cell in cells))
+        lines.append("")
+        lines.append("gaps between chunks:")
+        peak = max(histogram)
+        bounds = [0] + GAP_BUCKETS + [float("inf")]
+        for bucket, count in enumerate(histogram):
+            if count:
+                label = f"  {bounds[bucket]:g}-{bounds[bucket + 1]:g} ms"
+                bar = "#" * max(round(40 * count / peak), 1)
+                lines.append(f"{label:20}{count:8}  {bar}")
+    return "\n".join(lines)
@@ -0,0 +1,281 @@
+"""
+Prompt templates: `.chat.md` chat logs with `{placeholder}` slots in their
+messages, like the ones in `prompts/`.
+
+A template is parsed once into its metadata and message skeletons, each content
+split into literal text and placeholder slots, and rendering only fills in the
+slots. Rendered as a chat, variables therefore never reach the frontmatter or
+the markdown parser, so a value containing `>>>` or `---` stays inside its
+message, and YAML is never parsed again for a template that has not changed.
+Rendered as markdown, the template keeps its own layout, with the values filled
+into the text after the frontmatter; a line of a value that would open a new
+message there, one starting with `>>>` or `🤖 GPT:`, is indented by a space so
+that it stays in the message the value was put in:
+
+    registry = TemplateRegistry()
+    chat = registry.render("add-types-template", language="python", selection=code)
+
+The registry keeps parsed templates in memory, checked against the file's mtime
+and size on every use, and in ~/.cache/aiia/templates so that a fresh `aiia
+template render` process skips PyYAML altogether.
+"""
+import os
+import string
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import parse
+from .cache import DiskCache, default_cache_dir
+
+SUFFIX = ".chat.md"
+
+# Bump when the form templates are cached in changes
+CACHE_VERSION = 2
+
+_formatter = string.Formatter()
+
+# Lines starting with these open a message, see aiia.parse
+MESSAGE_MARKERS = (">>>", "🤖 GPT:")
+
+# What str.splitlines, which the parser splits on, counts as a line break
+_LINE_BREAKS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+def default_directories() -> List[str]:
+    """Where `install` links the prompts, ~/.local/share/prompts."""
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
+    return [os.path.join(data_home, "prompts")]
+
+
+def split_frontmatter(contents: str) -> Tuple[str, str]:
+    """
+    `contents` split after the `---` line that closes its frontmatter, or
+    `("", contents)` if it has none.
+    """
+    lines = contents.splitlines(keepends=True)
+    start = 0
+    while start < len(lines) and not lines[start].strip():
+        start += 1
+    if start == len(lines) or lines[start].rstrip("\r\n") != "---":
+        return "", contents
+    for end in range(start + 1, len(lines)):
+        if lines[end].rstrip("\r\n") == "---":
+            split = sum(len(line) for line in lines[: end + 1])
+            return contents[:split], contents[split:]
+    return "", contents
+
+
+class Template:
+    """
+    A parsed template. `messages` hold `role` and `parts`, the content as
+    `string.Formatter().parse` splits it: (literal, field, format_spec,
+    conversion) tuples, where field is None for trailing literal text. `head` is
+    the template up to the end of its frontmatter and `body` the parts of the
+    rest, for rendering it as markdown.
+    """
+
+    def __init__(
+        self,
+        metadata: Dict[str, Any],
+        messages: List[Dict[str, Any]],
+        head: str = "",
+        body: Optional[List[Tuple]] = None,
+        path: Optional[str] = None,
+    ):
+        self.metadata = metadata
+        self.messages = messages
+        self.head = head
+        self.body = body if body is not None else []
+        self.path = path
+
+    @classmethod
+    def parse(cls, contents: str, path: Optional[str] = None) -> "Template":
+        chat = parse.parse_chat_markdown(contents)
+        messages = [
+            {"role": m["role"], "parts": list(_formatter.parse(m["content"]))}
+            for m in chat["messages"]
+        ]
+        head, body = split_frontmatter(contents)
+        return cls(chat["metadata"], messages, head, list(_formatter.parse(body)), path)
+
+    @classmethod
+    def load(cls, path: str) -> "Template":
+        with open(path, "r") as f:
+            return cls.parse(f.read(), path)
+
+    @property
+    def variables(self) -> List[str]:
+        """Names of the placeholders, in order of first use."""
+        names: Dict[str, None] = {}
+        for message in self.messages:
+            for _, field, _, _ in message["parts"]:
+                if field is not None:
+                    names[_root(field)] = None
+        return list(names)
+
+    def render(self, **variables) -> Dict[str, Any]:
+        """
+        A chat with `variables` substituted into every message's content, as
+        `str.format` would. Raises KeyError for a placeholder with no value.
+        """
+        messages = [
+            {"role": m["role"], "content": _substitute(m["parts"], variables)}
+            for m in self.messages
+        ]
+        return {"metadata": dict(self.metadata), "messages": messages}
+
+    def render_markdown(self, **variables) -> str:
+        """
+        The template as markdown with `variables` substituted after the
+        frontmatter, laid out as in the template file. Lines of the values that
+        start with a message marker are indented, so they do not start messages.
+        """
+        return self.head + _substitute(self.body, variables, escape=True)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "metadata": self.metadata,
+            "messages": self.messages,
+            "head": self.head,
+            "body": self.body,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], path: Optional[str] = None) -> "Template":
+        messages = [
+            {"role": m["role"], "parts": [tuple(part) for part in m["parts"]]}
+            for m in data["messages"]
+        ]
+        body = [tuple(part) for part in data["body"]]
+        return cls(data["metadata"], messages, data["head"], body, path)
+
+
+def _substitute(
+    parts: List[Tuple], variables: Dict[str, Any], escape: bool = False
+) -> str:
+    pieces = []
+    line_start = True
+    for literal, field, spec, conversion in parts:
+        pieces.append(literal)
+        if literal:
+            line_start = literal[-1] in _LINE_BREAKS
+        if field is None:
+            continue
+        value, _ = _formatter.get_field(field, (), variables)
+        value = _formatter.convert_field(value, conversion)
+        value = _formatter.format_field(value, spec or "")
+        if escape and value:
+            value = _indent_markers(value, line_start)
+            line_start = value[-1] in _LINE_BREAKS
+        pieces.append(value)
+    return "".join(pieces)
+
+
+def _indent_markers(value: str, line_start: bool) -> str:
+    """`value` with a space before every line that starts with a message marker."""
+    lines = value.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if (i or line_start) and line.startswith(MESSAGE_MARKERS):
+            lines[i] = " " + line
+    return "".join(lines)
+
+
+def _root(field: str) -> str:
+    """The variable a field refers to, `user` for `user.name` or `user[0]`."""
+    for i, char in enumerate(field):
+        if char in ".[":
+            return field[:i]
+    return field
+
+
+class TemplateRegistry:
+    """
+    Finds templates by name and keeps them parsed.
+
+    :param directories: Where to look for `<name>.chat.md`. Defaults to
+        ~/.local/share/prompts.
+    :param cache: Where to keep parsed templates across processes. Defaults to
+        ~/.cache/aiia/templates.
+    :param persist: Set to False to only keep parsed templates in memory.
+    """
+
+    def __init__(
+        self,
+        directories: Optional[Sequence[str]] = None,
+        cache: Optional[DiskCache] = None,
+        persist: bool = True,
+    ):
+        self.directories = (
+            list(directories) if directories is not None else default_directories()
+        )
+        if cache is None and persist:
+            cache = DiskCache(
+                default_cache_dir("templates"), max_bytes=16 * 1024 * 1024
+            )
+        self.cache = cache
+        self._templates: Dict[str, Any] = {}
+
+    def find(self, name: str) -> str:
+        """The path of template `name`, which may also be a path itself."""
+        candidates = []
+        if os.sep in name or name.endswith(SUFFIX):
+            candidates.append(os.path.expanduser(name))
+        for directory in self.directories:
+            candidates.append(os.path.join(directory, name + SUFFIX))
+            candidates.append(os.path.join(directory, name))
+        for path in candidates:
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        raise FileNotFoundError(f"No template named {name!r} in {self.directories}")
+
+    def names(self) -> List[str]:
+        names = set()
+        for directory in self.directories:
+            try:
+                entries = os.listdir(directory)
+            except OSError:
+                continue
+            names.update(e[: -len(SUFFIX)] for e in entries if e.endswith(SUFFIX))
+        return sorted(names)
+
+    def get(self, name: str) -> Template:
+        """The parsed template, parsed again only if its file changed."""
+        path = self.find(name)
+        st = os.stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+
+        known = self._templates.get(path)
+        if known is not None and known[0] == version:
+            return known[1]
+
+        template = None
+        key = DiskCache.hash([CACHE_VERSION, path, *version])
+        if self.cache is not None:
+            entry = self.cache.get_entry(key)
+            if entry is not None:
+                template = Template.from_json(entry["template"], path)
+        if template is None:
+            template = Template.load(path)
+            if self.cache is not None:
+                self.cache.put_entry(key, {"template": template.to_json()})
+
+        self._templates[path] = (version, template)
+        return template
+
+    def render(self, name: str, **variables) -> Dict[str, Any]:
+        return self.get(name).render(**variables)
+
+
+_default_registry: Optional[TemplateRegistry] = None
+
+
+def default_registry() -> TemplateRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = TemplateRegistry()
+    return _default_registry
+
+
+def render(name: str, **variables) -> Dict[str, Any]:
+    """Render template `name` from the default registry."""
+    return default_registry().render(name, **variables)
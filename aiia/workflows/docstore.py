@@ -0,0 +1,75 @@
+import os
+import mmap
+
+from typing import List
+
+
+class DocumentStore:
+    """
+    Read-only, chunked access to a large HTML document.
+
+    The file is opened once and memory-mapped. On construction a chunk index of
+    byte offsets is built in a single pass, with every chunk ending just before
+    a `<` so that tags are not cut in half. Fetching chunk `n` is then a slice of
+    the mapping: O(1), with no re-reads, however large the document is.
+
+    ```
+    with DocumentStore("index.html") as document:
+        print(f"part 1 of {len(document)}")
+        print(document.read(1))
+    ```
+    """
+
+    def __init__(self, path: str, chunk_size: int = 2500):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+        self.offsets = self._index()
+
+    def _index(self) -> List[int]:
+        data = self._data
+        size = len(data)
+        offsets = [0]
+        start = 0
+        while start < size:
+            end = start + self.chunk_size
+            if end >= size:
+                end = size
+            else:
+                # Prefer to end right before a tag opens, as long as that still
+                # leaves at least half a chunk
+                tag = data.rfind(b"<", start + self.chunk_size // 2, end)
+                if tag != -1:
+                    end = tag
+                else:
+                    # Never split a multi-byte UTF-8 sequence
+                    while end > start + 1 and (data[end] & 0xC0) == 0x80:
+                        end -= 1
+            offsets.append(end)
+            start = end
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def read(self, part: int) -> str:
+        """Return chunk number `part`, counting from 1."""
+        if not 1 <= part <= len(self):
+            raise IndexError(f"part {part} is out of range 1-{len(self)}")
+        start, end = self.offsets[part - 1], self.offsets[part]
+        return self._data[start:end].decode("utf-8", errors="replace")
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
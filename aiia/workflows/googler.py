@@ -1,13 +1,8 @@
-# Because neovim is stupid and has broken indentation when there is nake left parens -.-
-LEFT_PAREN = """
-(
-""".strip()
-
 PROMPT = """
 Answer the following questions as best you can. You have access to the following tools:
 
 1. `SEARCH(query) -> [webpage_links]` - This function searches the internet with a given query and returns a list of the top  webpage links that are related to the query.
-2. `READ(webpage_link) -> webpage_content` - This function loads a webpage link and returns it's content
+2. `READ(webpage_link ...) -> webpage_content` - This function loads a webpage link and returns it's content. Pass several links separated by spaces to read them all at once.
 
 Use the following format:
 
@@ -24,132 +19,234 @@ Begin!
 Question: {question}
 """
 
-import sys
 import re
+import json
 import asyncio
-import aiia.gpt
+import urllib.error
+import urllib.request
 
-from playwright.async_api import async_playwright
 from readability import Document
 from urllib.parse import urlencode
 
+from typing import Dict, List, Optional, Tuple
 
-async def google_search(query):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context()
-
-        page = await context.new_page()
-        qs = urlencode({"q": query})
-        await page.goto(f"https://www.google.com/search?{qs}")
-
-        # Wait for search results to load
-        await page.wait_for_load_state("networkidle")
-
-        # Get the top 10 search result links
-        search_results = await page.locator(".yuRUbf").all()
-        top_links = []
-
-        for result in search_results[:10]:
-            link = result.locator("a").first
-            url = await link.get_attribute("href")
-            top_links.append(url)
+from aiia.agent import Agent
+from aiia.workflows.webcache import CachingFetcher, memoize
 
-        await browser.close()
-        return top_links
 
+class PlaywrightFetcher:
+    """
+    Fetches fully rendered pages with one long-lived Chromium.
 
-async def read_webpage(url, max_words=250):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context()
+    The browser is launched on first use and kept, with a single context and a
+    pool of up to `max_pages` tabs that are handed out to concurrent fetches and
+    reused, so an agent run pays the browser startup once rather than per action.
+    Must be used from one event loop; call `close()` when done.
+    """
 
-        page = await context.new_page()
-        await page.goto(url, wait_until="networkidle")
+    def __init__(self, headless: bool = True, max_pages: int = 4):
+        self.headless = headless
+        self.max_pages = max_pages
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._pages: Optional[asyncio.Queue] = None
+        self._page_count = 0
+        self._lock = asyncio.Lock()
+
+    async def _start(self):
+        async with self._lock:
+            if self._context is not None:
+                return
+            from playwright.async_api import async_playwright
+
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(
+                headless=self.headless
+            )
+            self._context = await self._browser.new_context()
+            self._pages = asyncio.Queue()
+
+    async def _acquire_page(self):
+        await self._start()
+        if self._pages.empty() and self._page_count < self.max_pages:
+            self._page_count += 1
+            return await self._context.new_page()
+        return await self._pages.get()
+
+    async def fetch(self, url: str) -> str:
+        page = await self._acquire_page()
+        try:
+            await page.goto(url, wait_until="networkidle")
+            return await page.content()
+        finally:
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            await self._playwright.stop()
+        self._playwright = self._browser = self._context = None
+
+
+class HTTPFetcher:
+    """
+    Fetches raw HTML over plain HTTP with no JavaScript, e.g. from a local test
+    server. Requests run on worker threads so several can be in flight.
+    """
 
-        # Get the main content using readability
-        content = await page.content()
-        document = Document(content)
-        readable_content = document.summary()
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+
+    def _get(
+        self, url: str, validators: Dict[str, str]
+    ) -> Tuple[Optional[str], Dict[str, str]]:
+        conditional = {}
+        if validators.get("etag"):
+            conditional["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            conditional["If-Modified-Since"] = validators["last_modified"]
+
+        request = urllib.request.Request(url, headers=conditional)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                charset = response.headers.get_content_charset() or "utf-8"
+                html = response.read().decode(charset, errors="replace")
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            html, headers = None, e.headers
+
+        new_validators = {
+            "etag": headers.get("ETag") or validators.get("etag"),
+            "last_modified": headers.get("Last-Modified")
+            or validators.get("last_modified"),
+        }
+        return html, {k: v for k, v in new_validators.items() if v}
+
+    async def fetch(self, url: str) -> str:
+        html, _ = await asyncio.to_thread(self._get, url, {})
+        return html
+
+    async def fetch_conditional(
+        self, url: str, validators: Dict[str, str]
+    ) -> Tuple[Optional[str], Dict[str, str]]:
+        """Fetch `url` unless it is unchanged, in which case the HTML is None."""
+        return await asyncio.to_thread(self._get, url, validators)
+
+    async def close(self):
+        pass
+
+
+def extract_search_links(html: str, limit: int = 10) -> List[str]:
+    """Return the first link of each Google search result (`.yuRUbf`)."""
+    import lxml.html
+
+    tree = lxml.html.fromstring(html)
+    results = tree.xpath(
+        "//*[contains(concat(' ', normalize-space(@class), ' '), ' yuRUbf ')]"
+    )
+    links = []
+    for result in results[:limit]:
+        hrefs = result.xpath(".//a/@href")
+        if hrefs:
+            links.append(hrefs[0])
+    return links
+
+
+def extract_text(html: str, max_words: int = 250) -> str:
+    # Get the main content using readability
+    document = Document(html)
+    readable_content = document.summary()
+
+    # Get the first 250 words
+    text = re.sub("<[^<]+?>", "", readable_content)
+    words = text.split()
+    return " ".join(words[:max_words]) + ("..." if len(words) > max_words else "")
+
+
+GOOGLE_SEARCH_URL = "https://www.google.com/search"
+
+
+@memoize(
+    "search",
+    key=lambda query, fetcher, search_url=GOOGLE_SEARCH_URL: f"{search_url} {query}",
+    skip_empty=True,
+)
+async def google_search(query, fetcher, search_url=GOOGLE_SEARCH_URL):
+    qs = urlencode({"q": query})
+    url = f"{search_url}?{qs}"
+    links = extract_search_links(await fetcher.fetch(url))
+    if not links and isinstance(fetcher, CachingFetcher):
+        # Most likely a captcha or block page, which should not be served again
+        fetcher.forget(url)
+    return links
+
+
+@memoize("text", key=lambda url, fetcher, max_words=250: f"{url} {max_words}")
+async def read_webpage(url, fetcher, max_words=250):
+    html = await fetcher.fetch(url)
+    # readability is CPU bound, keep it off the event loop
+    return await asyncio.to_thread(extract_text, html, max_words)
+
+
+async def read_webpages(urls, fetcher, max_words=250):
+    """Fetch and extract several pages concurrently, in the order given."""
+    return await asyncio.gather(
+        *[read_webpage(url, fetcher, max_words=max_words) for url in urls]
+    )
 
-        # Get the first 250 words
-        text = re.sub("<[^<]+?>", "", readable_content)
-        words = text.split()
-        truncated_text = " ".join(words[:max_words]) + (
-            "..." if len(words) > max_words else ""
-        )
 
-        await browser.close()
-        return truncated_text
+def parse_links(argument: str) -> List[str]:
+    """
+    The links of a READ action: a JSON list, or links separated by whitespace.
+    Commas are not separators, since URLs may contain them.
+    """
+    try:
+        links = json.loads(argument)
+    except ValueError:
+        links = None
+    if not isinstance(links, list):
+        links = argument.split()
+    links = (str(link).strip("\"'`,") for link in links)
+    return [link for link in links if link]
 
 
-def stream_response_until(prompt, stop_word="\nAction: "):
-    response = ""
-    for chunk in aiia.gpt.stream_response(
-        messages=[{"role": "user", "content": prompt}]
-    ):
-        yield chunk
+def run(question: str, fetcher=None):
+    loop = asyncio.new_event_loop()
+    fetcher = CachingFetcher(fetcher or PlaywrightFetcher())
 
-        response += chunk
-        if stop_word in response:
-            break
+    async def search(query):
+        return repr(await google_search(query, fetcher))
 
+    async def read(argument):
+        links = parse_links(argument)
+        results = await read_webpages(links, fetcher)
+        return repr(results[0] if len(results) == 1 else dict(zip(links, results)))
 
-def run(question: str):
     print()
     print(f"\033[34mQuestion:\033[0m {question}")
     print()
     print()
-    prompt = PROMPT.format(question=question)
-    while True:
-        for chunk in stream_response_until(prompt, stop_word="\nObservation: "):
-            prompt += chunk
-            print(chunk, end="")
-            sys.stdout.flush()
-
-        print("\n", end="")
-
-        clauses = re.findall(
-            r"^([\w ]+):(.+?)(?:(?=\n\w+:)|$)", prompt, re.MULTILINE | re.DOTALL
-        )
-        if clauses:
-            if clauses[-1][0] == "Final Answer":
-                print()
-                print()
-                print(f"\033[34mFinal Answer:\033[0m")
-                print(clauses[-1][1])
-                break
-
-            if clauses[-2][0] != "Action":
-                print("error", clauses)
-
-            prompt = prompt.rsplit("\nObservation:", 1)[0]
-            action = clauses[-2][1].strip()
-            action_name = action.split(LEFT_PAREN)[0]
-            if action_name == "SEARCH":
-                query = action.split("SEARCH(")[1].split(")")[0]
-                result = asyncio.run(google_search(query))
-                observation = f"\nObserveration: {result!r}\n"
-                print(observation, end="")
-
-                prompt += observation
-            elif action_name == "READ":
-                link = action.split("READ(")[1].split(")")[0]
-                link = link.strip('"')
-                link = link.strip("'")
-                link = link.strip("`")
-                result = asyncio.run(read_webpage(link))
-                observation = f"\nObserveration: {result!r}\n"
-                print(observation, end="")
-                prompt += observation
-            else:
-                print(f"Unknown action {action}")
-                break
-        else:
-            print("No clauses found")
-            break
-
-        print(prompt)
+    agent = Agent(
+        PROMPT.format(question=question),
+        tools={"SEARCH": search, "READ": read},
+        loop=loop,
+    )
+    try:
+        answer = agent.run()
+    finally:
+        loop.run_until_complete(fetcher.close())
+        loop.close()
+
+    print()
+    print()
+    if answer is None:
+        print("No final answer")
+    else:
+        print(f"\033[34mFinal Answer:\033[0m")
+        print(answer)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,3 @@
-# Because neovim is stupid and has broken indentation when there is nake left parens -.-
-LEFT_PAREN = """
-(
-""".strip()
-LEFT_BRACKET = """
-[
-""".strip()
-
 PROMPT = """\
 Answer the following questions as best you can. Can only use the following function call read the HTML document:
 
@@ -33,78 +25,44 @@ Question: {question}
 """
 
 import sys
-import re
-import aiia.gpt
+
+from aiia.agent import Agent
+from aiia.workflows.docstore import DocumentStore
 
 
-def stream_response_until(prompt, stop_word="\nAction: "):
-    response = ""
-    for chunk in aiia.gpt.stream_response(
-        # model="gpt-4",
-        messages=[{"role": "user", "content": prompt}]
-    ):
-        yield chunk
+def run(question: str, document_path: str):
+    document = DocumentStore(document_path)
+    memories = []
 
-        response += chunk
-        if stop_word in response:
-            break
+    def read(argument):
+        part = int(argument)
+        if 1 <= part <= len(document):
+            result = document.read(part)
+            return f"Result({part} of {len(document)})\n\n ```html\n{result}\n```"
+        return f"There is no part {part}, the document has {len(document)} parts"
 
+    def add_to_memory(observation):
+        memories.append(observation)
 
-def run(question: str):
-    memories = []
     print()
     print(f"Question: {question}")
     print()
-    prompt = PROMPT.format(question=question)
-    while True:
-        print(prompt)
-        print(memories)
-        for chunk in stream_response_until(prompt, stop_word="\nObservation: "):
-            prompt += chunk
-            print(chunk, end="")
-            sys.stdout.flush()
-
-        print("\n", end="")
-
-        clauses = re.findall(
-            r"^([\w ]+):(.+?)(?:(?=\n\w+:)|$)", prompt, re.MULTILINE | re.DOTALL
-        )
-
-        if clauses:
-            if clauses[-1][0] == "Final Answer":
-                print()
-                print(f"Final Answer: {clauses[-1][1]}")
-                break
-
-            if clauses[-2][0] != "Action":
-                print("error", clauses)
-
-            prompt = prompt.rsplit("\nObservation:", 1)[0]
-            action = clauses[-2][1].strip()
-            action_name = action.split(LEFT_BRACKET)[0]
-
-            if action_name == "READ":
-                page_number = int(action.split("READ[")[1].split("]")[0]) - 1
-                CHUNK_SIZE = 2500
-                result = open("/home/thomas/temp/index.html", "r").read()[
-                    (CHUNK_SIZE * page_number) : (CHUNK_SIZE * (page_number + 1))
-                ]
-                observation = f"\nObservation: Result({page_number + 1} of 12)\n\n ```html\n{result}\n```\n"
-                print(observation, end="")
-                prompt += observation
-            elif action_name == "ADD_TO_MEMORY":
-                memories.append(action.split("ADD_TO_MEMORY[")[1].split("]")[0])
-            else:
-                print(f"Unknown action {action_name} text {action}")
-                break
-
-        else:
-            print("No clauses found")
+    agent = Agent(
+        PROMPT.format(question=question),
+        tools={"READ": read, "ADD_TO_MEMORY": add_to_memory},
+    )
+    with document:
+        answer = agent.run()
+
+    print()
+    print(memories)
+    print(f"Final Answer: {answer}")
 
 
 if __name__ == "__main__":
     run(
         """
         Find opening HTML tags for the container of an advertisement. Be sure to read the entire document before responding with the final answer.
-    """.strip()
+    """.strip(),
+        sys.argv[1] if len(sys.argv) > 1 else "index.html",
     )
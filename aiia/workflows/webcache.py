@@ -0,0 +1,183 @@
+"""
+A cache for the web fetching done by the agent workflows.
+
+Two layers share one WebCache: `CachingFetcher` wraps a fetcher and keeps the
+raw HTML of every URL together with its ETag/Last-Modified validators, and the
+`memoize` decorator keeps the results of the fetch functions built on top of it
+(search result links, readability-extracted text). Entries are served from
+memory, then disk; once older than the TTL they are revalidated with a
+conditional request where the fetcher supports one.
+"""
+import os
+import time
+import functools
+import collections
+
+from typing import Any, Callable, Dict, Optional
+
+from aiia.cache import DiskCache, default_cache_dir
+
+
+class WebCache(DiskCache):
+    """
+    :param path: Directory to store entries in. Defaults to ~/.cache/aiia/web.
+    :param ttl: Seconds an entry is served without revalidation.
+    :param memory_entries: How many entries to also keep in process memory.
+    :param max_bytes: Evict least recently used entries beyond this total size.
+    :param max_age: Entries not used for this many seconds are evicted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: float = 6 * 60 * 60,
+        memory_entries: int = 256,
+        max_bytes: int = 128 * 1024 * 1024,
+        max_age: float = 7 * 24 * 60 * 60,
+    ):
+        super().__init__(
+            path or default_cache_dir("web"), max_bytes=max_bytes, max_age=max_age
+        )
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self._memory: Dict[str, Dict[str, Any]] = collections.OrderedDict()
+
+    def lookup(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for `key`, fresh or stale, or None if there is none."""
+        cache_key = self.hash([namespace, key])
+        entry = self._memory.get(cache_key)
+        if entry is not None:
+            self._memory.move_to_end(cache_key)
+            self.hits += 1
+            return entry
+
+        entry = self.get_entry(cache_key)
+        if entry is not None:
+            self._remember(cache_key, entry)
+        return entry
+
+    def store(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        validators: Optional[Dict[str, str]] = None,
+    ) -> None:
+        cache_key = self.hash([namespace, key])
+        entry = {"value": value, "validators": validators or {}}
+        self.put_entry(cache_key, entry)
+        self._remember(cache_key, {"created": time.time(), **entry})
+
+    def discard(self, namespace: str, key: str) -> None:
+        """Drop the entry for `key` from memory and disk, if there is one."""
+        cache_key = self.hash([namespace, key])
+        self._memory.pop(cache_key, None)
+        try:
+            os.unlink(self._entry_path(cache_key))
+        except OSError:
+            pass
+
+    def _remember(self, cache_key: str, entry: Dict[str, Any]) -> None:
+        self._memory[cache_key] = entry
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["created"] <= self.ttl
+
+
+_default_web_cache: Optional[WebCache] = None
+
+
+def default_web_cache() -> Optional[WebCache]:
+    """The shared WebCache, or None if disabled by setting AIIA_WEB_CACHE=0."""
+    global _default_web_cache
+    if os.environ.get("AIIA_WEB_CACHE") == "0":
+        return None
+    if _default_web_cache is None:
+        _default_web_cache = WebCache()
+    return _default_web_cache
+
+
+def memoize(namespace: str, key: Callable[..., str], skip_empty: bool = False):
+    """
+    Cache the results of an async fetch function in the default WebCache.
+
+    `key` is called with the function's arguments and returns the cache key,
+    e.g. the URL; arguments such as the fetcher should not be part of it. With
+    `skip_empty`, empty results are returned but not cached, for fetches where
+    an empty result more likely means a failure than a real answer.
+
+    ```
+    @memoize("text", key=lambda url, fetcher, max_words=250: f"{url} {max_words}")
+    async def read_webpage(url, fetcher, max_words=250):
+        ...
+    ```
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            cache = default_web_cache()
+            if cache is None:
+                return await fn(*args, **kwargs)
+
+            cache_key = key(*args, **kwargs)
+            entry = cache.lookup(namespace, cache_key)
+            if entry is not None and cache.fresh(entry):
+                return entry["value"]
+
+            value = await fn(*args, **kwargs)
+            if value or not skip_empty:
+                cache.store(namespace, cache_key, value)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+class CachingFetcher:
+    """
+    Wraps a fetcher so the raw HTML of each URL is cached.
+
+    Fresh entries are returned without touching the network. Stale ones are
+    revalidated if the wrapped fetcher has a
+    `fetch_conditional(url, validators) -> (html or None, validators)` method,
+    where None means the server answered 304 Not Modified; otherwise the page is
+    fetched again in full.
+    """
+
+    def __init__(self, fetcher, cache: Optional[WebCache] = None):
+        self.fetcher = fetcher
+        self.cache = cache
+
+    async def fetch(self, url: str) -> str:
+        cache = self.cache or default_web_cache()
+        if cache is None:
+            return await self.fetcher.fetch(url)
+
+        entry = cache.lookup("html", url)
+        if entry is not None and cache.fresh(entry):
+            return entry["value"]
+
+        if hasattr(self.fetcher, "fetch_conditional"):
+            validators = entry["validators"] if entry is not None else {}
+            html, validators = await self.fetcher.fetch_conditional(url, validators)
+            if html is None:
+                html = entry["value"]
+        else:
+            html, validators = await self.fetcher.fetch(url), {}
+
+        cache.store("html", url, html, validators)
+        return html
+
+    def forget(self, url: str) -> None:
+        """Drop the cached page for `url`, so the next fetch goes to the network."""
+        cache = self.cache or default_web_cache()
+        if cache is not None:
+            cache.discard("html", url)
+
+    async def close(self):
+        await self.fetcher.close()
@@ -0,0 +1,99 @@
+"""
+Drive `aiia.agent.Agent` through a long scripted transcript from a fake model,
+against the previous workflow loop that re-ran a clause regex over the whole
+prompt after every step.
+
+    python benchmarks/bench_agent.py --steps 200 --observation-size 2500
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiia.agent import Agent
+
+
+def scripted_model(steps: int, chunk_size: int = 4):
+    """A fake model that READs parts 1..steps and then answers."""
+
+    calls = []
+
+    def complete(prompt):
+        step = len(calls)
+        calls.append(step)
+        if step < steps:
+            text = (
+                f"Thought: I should read part {step + 1} of the document next\n"
+                f"Action: READ[{step + 1}]\nObservation: hallucinated"
+            )
+        else:
+            text = "Thought: I now know the final answer\nFinal Answer: done\n"
+        for i in range(0, len(text), chunk_size):
+            yield text[i : i + chunk_size]
+
+    return complete
+
+
+def legacy_run(prompt, complete, read):
+    # The loop googler and html_classifier had before aiia.agent
+    while True:
+        response = ""
+        for chunk in complete(prompt):
+            prompt += chunk
+            response += chunk
+            if "\nObservation: " in response:
+                break
+
+        clauses = re.findall(
+            r"^([\w ]+):(.+?)(?:(?=\n\w+:)|$)", prompt, re.MULTILINE | re.DOTALL
+        )
+        if clauses[-1][0] == "Final Answer":
+            return clauses[-1][1].strip()
+
+        prompt = prompt.rsplit("\nObservation:", 1)[0]
+        action = clauses[-2][1].strip()
+        part = int(action.split("READ[")[1].split("]")[0])
+        prompt += f"\nObservation: {read(part)}\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--observation-size", type=int, default=2500)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    prompt = "Question: what is in the document?\n"
+    observation = "<div>" + "x" * (args.observation_size - 11) + "</div>"
+
+    def read(part):
+        return f"Result({part}) {observation}"
+
+    agent = Agent(
+        prompt,
+        tools={"READ": lambda part: read(int(part))},
+        complete=scripted_model(args.steps),
+        max_steps=args.steps + 1,
+        on_text=lambda text: None,
+    )
+    start = time.perf_counter()
+    answer = agent.run()
+    new_time = time.perf_counter() - start
+    assert answer == "done"
+
+    size = len(agent.transcript) / 1024
+    line = f"{args.steps} steps, {size:.0f} KB: agent {new_time * 1000:8.1f} ms"
+    if not args.skip_legacy:
+        start = time.perf_counter()
+        legacy_answer = legacy_run(prompt, scripted_model(args.steps), read)
+        old_time = time.perf_counter() - start
+        assert legacy_answer == answer
+        line += f"  legacy {old_time * 1000:8.1f} ms  ({old_time / new_time:.1f}x)"
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
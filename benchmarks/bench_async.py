@@ -0,0 +1,60 @@
+"""
+Measure how throughput of `aiia.gpt.gather_responses` scales with concurrency
+against the local fake server, which is given a per-request latency so the
+requests are I/O bound like the real API.
+
+    python benchmarks/bench_async.py -n 64 --ttft 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiia.gpt
+import fake_openai
+
+MESSAGES = [{"role": "user", "content": "Write me a haiku"}]
+
+
+async def run(client, n, max_concurrency):
+    batch = [MESSAGES] * n
+    start = time.perf_counter()
+    await aiia.gpt.gather_responses(
+        batch, max_concurrency=max_concurrency, client=client
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=64, help="requests per level")
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32]
+    )
+    args = parser.parse_args()
+
+    server = fake_openai.serve(ttft=args.ttft, token_delay=args.token_delay)
+    client = aiia.gpt.AsyncClient(base_url=fake_openai.base_url(server))
+
+    baseline = None
+    for level in args.concurrency:
+        elapsed = asyncio.run(run(client, args.n, level))
+        rps = args.n / elapsed
+        baseline = baseline or rps / level
+        print(
+            f"concurrency {level:>3}: {rps:8.1f} req/s"
+            f"  (scaling efficiency {rps / (baseline * level):5.1%})"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
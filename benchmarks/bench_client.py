@@ -0,0 +1,87 @@
+"""
+Compare requests per second of the pooled `aiia.gpt.Client` against the previous
+one-`urlopen`-per-request implementation, both talking to the local fake server.
+
+    python benchmarks/bench_client.py -n 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.request
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiia.gpt
+import fake_openai
+
+MESSAGES = [{"role": "user", "content": "Write me a haiku"}]
+
+
+def urlopen_stream_response(base_url, messages, model="gpt-3.5-turbo"):
+    """The pre-pool implementation of `stream_response`, kept for comparison."""
+    payload = {"stream": True, "model": model, "messages": messages}
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": "Bearer " + aiia.gpt.OPENAI_API_KEY,
+    }
+    url = base_url + "/chat/completions"
+
+    req = urllib.request.Request(url, json.dumps(payload).encode("utf-8"), headers)
+    response = urllib.request.urlopen(req)
+
+    for line in response:
+        line = line.decode("utf-8")
+        line = line.lstrip("data: ").strip()
+        if not line:
+            continue
+
+        if line == "[DONE]":
+            break
+
+        data = json.loads(line)
+        if data["object"] == "chat.completion.chunk":
+            delta = data["choices"][0]["delta"]
+            if delta != "":
+                yield delta.get("content", "")
+
+
+def bench(name, fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10}: {n / elapsed:8.1f} req/s  ({elapsed * 1000 / n:.3f} ms/req)")
+    return n / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=300, help="requests per variant")
+    args = parser.parse_args()
+
+    server = fake_openai.serve()
+    base_url = fake_openai.base_url(server)
+    client = aiia.gpt.Client(base_url=base_url)
+
+    urlopen_rps = bench(
+        "urlopen",
+        lambda: "".join(urlopen_stream_response(base_url, MESSAGES)),
+        args.n,
+    )
+    pooled_rps = bench(
+        "pooled",
+        lambda: aiia.gpt.get_response(MESSAGES, client=client),
+        args.n,
+    )
+    print(f"{'speedup':>10}: {pooled_rps / urlopen_rps:8.2f}x")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
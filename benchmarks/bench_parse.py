@@ -0,0 +1,81 @@
+"""
+Time `aiia.parse.parse_chat_markdown` on synthetic chat logs of increasing size,
+against the previous implementation that grew each message with `+=` and located
+the frontmatter with a whole-document regex.
+
+    python benchmarks/bench_parse.py --sizes 1 10 100
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiia.parse
+from corpus import synthetic_chat_log
+
+
+def legacy_parse_chat_markdown(contents):
+    pattern = re.compile(r"^---$", re.MULTILINE)
+    matches = pattern.findall(contents)
+    if len(matches) >= 2:
+        parts = contents.split("---", 2)
+        yaml_data = yaml.safe_load(parts[1].strip())
+        markdown_body = parts[2].strip()
+    else:
+        yaml_data = {}
+        markdown_body = contents.strip()
+
+    messages = []
+    message = ""
+    role = ""
+    for line in markdown_body.splitlines():
+        if line.startswith(">>>"):
+            if message:
+                messages.append({"role": role, "content": message.strip()})
+            role = "user"
+            message = line[3:].strip() + "\n"
+        elif line.startswith("🤖 GPT:"):
+            if message:
+                messages.append({"role": role, "content": message.strip()})
+            role = "assistant"
+            message = line[7:].strip() + "\n"
+        else:
+            message += line + "\n"
+    if message:
+        messages.append({"role": role, "content": message.strip()})
+    return {"metadata": yaml_data, "messages": messages}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=float, nargs="+", default=[1, 10, 100], help="sizes in MB"
+    )
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    for mb in args.sizes:
+        contents = synthetic_chat_log(int(mb * 1024 * 1024))
+        new, new_time = timed(aiia.parse.parse_chat_markdown, contents)
+        line = f"{mb:6.1f} MB: {new_time * 1000:9.1f} ms"
+        if not args.skip_legacy:
+            old, old_time = timed(legacy_parse_chat_markdown, contents)
+            assert old == new, "parsers disagree"
+            line += f"  legacy {old_time * 1000:9.1f} ms  ({old_time / new_time:.2f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Time loading every log of a chat log archive, the way `aiia respond-batch` and
+`aiia search` do: parsed with the pure Python YAML loader, with libyaml's C
+loader, and through `aiia.parsecache` while it is filled and once it is warm.
+
+    python benchmarks/bench_parse_cache.py --count 10000
+    python benchmarks/bench_parse_cache.py --dir ~/chat-logs
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiia.parse
+import aiia.parsecache
+from corpus import write_corpus
+
+
+def load_all(paths, cache=None):
+    start = time.perf_counter()
+    for path in paths:
+        aiia.parsecache.load_chat_log(path, os.stat(path), cache)
+    if cache is not None:
+        cache.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dir", default=None, help="existing chat log directory")
+    parser.add_argument("--count", type=int, default=10000, help="logs to generate")
+    parser.add_argument(
+        "--max-size", type=int, default=20_000, help="largest generated log in bytes"
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aiia-bench-")
+    try:
+        directory = args.dir
+        if directory is None:
+            directory = os.path.join(workdir, "chat-logs")
+            total = write_corpus(directory, args.count, max_size=args.max_size)
+            print(f"{args.count} logs, {total / 1024 / 1024:.1f} MB")
+        paths = sorted(
+            e.path for e in os.scandir(directory) if e.name.endswith(".chat.md")
+        )
+        # Warm the page cache, so every variant reads from memory
+        load_all(paths)
+
+        aiia.parse.USE_LIBYAML = False
+        pure = load_all(paths)
+        aiia.parse.USE_LIBYAML = True
+        libyaml = load_all(paths)
+
+        cache = aiia.parsecache.ParsedLogCache(os.path.join(workdir, "parsed.sqlite"))
+        cold = load_all(paths, cache)
+        warm = load_all(paths, cache)
+        assert cache.hits == len(paths)
+        cache.close()
+
+        for name, elapsed in [
+            ("pure yaml", pure),
+            ("libyaml", libyaml),
+            ("cache cold", cold),
+            ("cache warm", warm),
+        ]:
+            print(
+                f"{name:>12}: {elapsed * 1000:9.1f} ms"
+                f"  ({elapsed * 1e6 / len(paths):7.1f} us/log, {pure / elapsed:5.2f}x)"
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
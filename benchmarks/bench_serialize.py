@@ -0,0 +1,72 @@
+"""
+Memory peak and throughput of serializing a large chat log to markdown: the
+previous `markdown_body +=` implementation against `aiia.parse.write_chat_markdown`
+writing to a file.
+
+    python benchmarks/bench_serialize.py --sizes 10 100
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiia.parse
+from corpus import synthetic_chat_log
+
+
+def legacy_to_chat_markdown(chat: dict) -> str:
+    yaml_frontmatter = yaml.safe_dump(chat["metadata"], sort_keys=False)
+    markdown_body = ""
+    for message in chat["messages"]:
+        if message["role"] == "user":
+            markdown_body += f">>> {message['content']}\n\n"
+        elif message["role"] == "assistant":
+            markdown_body += f"🤖 GPT:\n\n{message['content']}\n\n"
+    return f"---\n{yaml_frontmatter}---\n\n{markdown_body}"
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=float, nargs="+", default=[10, 100], help="sizes in MB"
+    )
+    args = parser.parse_args()
+
+    for mb in args.sizes:
+        size = int(mb * 1024 * 1024)
+        chat = aiia.parse.parse_chat_markdown(synthetic_chat_log(size))
+
+        def legacy():
+            with open(os.devnull, "w") as f:
+                f.write(legacy_to_chat_markdown(chat))
+
+        def streaming():
+            with open(os.devnull, "w") as f:
+                aiia.parse.write_chat_markdown(chat, f)
+
+        for name, fn in [("legacy", legacy), ("writer", streaming)]:
+            elapsed, peak = measure(fn)
+            print(
+                f"{mb:6.1f} MB {name:>7}: {size / elapsed / 1e6:8.1f} MB/s"
+                f"  peak {peak / 1e6:8.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Round-trip latency of parsing a small chat log the way the nvim plugin does it:
+spawning `aiia parse` per call, against one request to a warm `aiia serve`.
+
+    python benchmarks/bench_serve.py -n 50
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiia.daemon
+import aiia.server
+
+CHAT_LOG = """\
+---
+title: Haiku
+model: gpt-4
+---
+
+>>> Write me a haiku
+
+🤖 GPT:
+
+Silent drifting clouds
+"""
+
+
+def start_daemon(path):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(aiia.server.serve(path),), daemon=True
+    )
+    thread.start()
+    while not aiia.daemon.is_running(path):
+        time.sleep(0.01)
+
+
+def bench(name, fn, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print(
+        f"{name:>10}: p50 {times[len(times) // 2] * 1000:8.2f} ms"
+        f"  p95 {times[int(len(times) * 0.95)] * 1000:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=30)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "aiia.sock")
+    start_daemon(path)
+
+    env = {**os.environ, "AIIA_DAEMON": "0", "PYTHONPATH": ROOT}
+    command = [sys.executable, "-m", "aiia.cli", "parse", "-"]
+
+    bench(
+        "spawn",
+        lambda: subprocess.run(
+            command, input=CHAT_LOG.encode(), capture_output=True, env=env
+        ),
+        args.n,
+    )
+    bench(
+        "daemon",
+        lambda: list(
+            aiia.daemon.request({"type": "parse", "contents": CHAT_LOG}, path)
+        ),
+        args.n,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Per-token overhead of decoding a chat completion event stream: the previous
+line-splitting `lstrip` + `json.loads` loop against `aiia.sse.SSEDecoder` with
+the `delta_content` fast path.
+
+By default a multi-megabyte stream is synthesised in the format the API sends;
+pass `--file` to replay a recorded one instead.
+
+    python benchmarks/bench_sse.py --tokens 200000
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiia.sse import SSEDecoder, delta_content
+from fake_openai import sse_event
+
+WORDS = ["the", " quick", " brown", " fox", "\n", " jumps", " é", ' "over"', "\t"]
+
+
+def record(tokens: int) -> bytes:
+    rng = random.Random(0)
+    events = [sse_event(rng.choice(WORDS)) for _ in range(tokens)]
+    return b"".join(events) + b"data: [DONE]\n\n"
+
+
+def split(stream: bytes, rng: random.Random):
+    """Split the stream into socket-read sized chunks, like read1 returns them."""
+    chunks = []
+    i = 0
+    while i < len(stream):
+        n = rng.randint(1, 4096)
+        chunks.append(stream[i : i + n])
+        i += n
+    return chunks
+
+
+def legacy(stream: bytes):
+    """The pre-decoder loop, which reads the body line by line."""
+    out = []
+    for line in io.BytesIO(stream):
+        line = line.decode("utf-8")
+        line = line.lstrip("data: ").strip()
+        if not line:
+            continue
+
+        if line == "[DONE]":
+            break
+
+        data = json.loads(line)
+        if data["object"] == "chat.completion.chunk":
+            delta = data["choices"][0]["delta"]
+            if delta != "":
+                out.append(delta.get("content", ""))
+    return out
+
+
+def decoder(chunks):
+    out = []
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            if event.event != "message":
+                continue
+            if event.data == "[DONE]":
+                return out
+            content = delta_content(event.data)
+            if content:
+                out.append(content)
+    return out
+
+
+def bench(name, fn, tokens, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:>8}: {best * 1e9 / tokens:8.1f} ns/token  ({best * 1000:.1f} ms)")
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=100000)
+    parser.add_argument("--file", help="a recorded event stream to replay")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            stream = f.read()
+    else:
+        stream = record(args.tokens)
+    chunks = split(stream, random.Random(1))
+    tokens = stream.count(b"\n\ndata: ") or 1
+
+    print(f"stream: {len(stream) / 1e6:.1f} MB, {tokens} events, {len(chunks)} reads")
+    old, old_time = bench("legacy", lambda: legacy(stream), tokens, args.repeat)
+    new, new_time = bench("decoder", lambda: decoder(chunks), tokens, args.repeat)
+    assert "".join(old) == "".join(new), "decoders disagree"
+    print(f"{'speedup':>8}: {old_time / new_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Startup budget for `aiia parse`, which the editor runs on every keypress.
+
+Runs `aiia parse` on a small log without frontmatter a number of times, checks
+the median wall-clock time against BUDGET_MS and prints the slowest imports
+reported by `python -X importtime`. Exits non-zero when over budget.
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median wall-clock milliseconds allowed for `aiia parse` on a small file,
+# interpreter startup included
+BUDGET_MS = 80
+
+# Modules `aiia parse` must not import
+FORBIDDEN = ["aiia.gpt", "aiia.server", "yaml", "asyncio", "urllib.request", "ssl"]
+
+CHAT_LOG = """\
+>>> Write me a haiku
+
+🤖 GPT:
+
+Silent drifting clouds
+"""
+
+
+def importtime(command, env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports.append((int(cumulative_us), int(self_us), name.strip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".chat.md", delete=False) as f:
+        f.write(CHAT_LOG)
+
+    env = {
+        **os.environ,
+        "AIIA_DAEMON": "0",
+        "PYTHONPATH": ROOT,
+        "OPENAI_API_KEY": "",
+    }
+    command = ["-m", "aiia.cli", "parse", f.name]
+
+    times = []
+    for _ in range(args.n):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *command], capture_output=True, env=env)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    median = times[len(times) // 2]
+
+    imports = importtime(command, env)
+    names = {name for _, _, name in imports}
+    print("slowest imports (cumulative us):")
+    for cumulative, _, name in sorted(imports, reverse=True)[: args.top]:
+        print(f"  {cumulative:>8}  {name}")
+
+    os.unlink(f.name)
+
+    print(f"aiia parse: median {median:.1f} ms, budget {args.budget:.0f} ms")
+    failed = False
+    for module in FORBIDDEN:
+        if module in names:
+            print(f"  FAIL: imports {module}")
+            failed = True
+    if median > args.budget:
+        print("  FAIL: over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Synthetic `.chat.md` logs and corpora of them for the benchmarks.
+
+    python benchmarks/corpus.py /tmp/chat-logs --count 1000 --untitled 0.1
+"""
+import os
+import random
+import argparse
+
+# Sizes in bytes of the logs in a corpus, picked from with these weights: mostly
+# short scratch-pad chats with a long tail of big ones
+SIZES = [2_000, 20_000, 200_000, 2_000_000]
+SIZE_WEIGHTS = [60, 30, 9, 1]
+
+
+def synthetic_chat_log(size: int, seed: int = 0, title: str = "Synthetic") -> str:
+    """Build a `.chat.md` log of roughly `size` bytes with large code blocks."""
+    rng = random.Random(seed)
+    parts = [f"---\ntitle: {title}\nmodel: gpt-4\n---\n\n"]
+    total = len(parts[0])
+    while total < size:
+        code = "\n".join(
+            f"    value_{i} = compute({rng.randint(0, 1 << 30)})"
+            for i in range(rng.randint(20, 400))
+        )
+        turn = (
+            f">>> Explain this code\n\n```python\n{code}\n```\n\n"
+            f"🤖 GPT:\n\nIt computes {rng.randint(0, 100)} values.\n\n"
+        )
+        parts.append(turn)
+        total += len(turn)
+    return "".join(parts)
+
+
+def write_corpus(
+    directory: str,
+    count: int,
+    untitled: float = 0.0,
+    max_size: int = SIZES[-1],
+    seed: int = 0,
+) -> int:
+    """
+    Write `count` logs of mixed sizes into `directory`, a share `untitled` of
+    them without a title. Returns the total number of bytes written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    sizes = [size for size in SIZES if size <= max_size] or [max_size]
+    weights = SIZE_WEIGHTS[: len(sizes)]
+
+    total = 0
+    for i in range(count):
+        size = rng.choices(sizes, weights)[0]
+        title = "Untitled" if rng.random() < untitled else f"Chat {i}"
+        contents = synthetic_chat_log(size, seed=seed + i, title=title)
+        with open(os.path.join(directory, f"{i:06d}.chat.md"), "w") as f:
+            f.write(contents)
+        total += len(contents.encode("utf-8"))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--untitled", type=float, default=0.0)
+    parser.add_argument("--max-size", type=int, default=SIZES[-1])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total = write_corpus(
+        args.directory, args.count, args.untitled, args.max_size, args.seed
+    )
+    print(f"Wrote {args.count} logs, {total / 1024 / 1024:.1f} MB to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
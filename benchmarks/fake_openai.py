@@ -0,0 +1,169 @@
+"""
+A local stand-in for the OpenAI `/v1/chat/completions` streaming endpoint.
+
+It speaks HTTP/1.1 with keep-alive and replies to every request with a chunked
+Server-Sent-Events stream, so the aiia clients can be exercised and benchmarked
+without touching the network.
+
+    python benchmarks/fake_openai.py --port 8080
+"""
+import json
+import time
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def synthetic_tokens(count: int, chunk_size: int = 4):
+    """`count` content deltas of `chunk_size` characters each, like words of prose."""
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing"]
+    text = " ".join(words[i % len(words)] for i in range(count * chunk_size // 4 + 1))
+    return [text[i * chunk_size : (i + 1) * chunk_size] for i in range(count)]
+
+
+def sse_event(content: str) -> bytes:
+    """Encode one content delta the way the OpenAI API does, as compact JSON."""
+    data = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": 1680000000,
+        "model": "gpt-3.5-turbo-0301",
+        "choices": [{"delta": {"content": content}, "index": 0, "finish_reason": None}],
+    }
+    encoded = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return b"data: " + encoded + b"\n\n"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    # Set on the server instance by `serve`
+    tokens = ["Hello", " world", "!"]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        with self.server.lock:
+            rate_limited = self.server.rate_limit_first > 0
+            self.server.rate_limit_first -= rate_limited
+        if rate_limited:
+            body = b'{"error": {"message": "Rate limit reached"}}'
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Retry-After", str(self.server.retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        stop = (payload.get("stop") or []) if self.server.honor_stop else []
+        if isinstance(stop, str):
+            stop = [stop]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(self.server.ttft)
+        start = time.perf_counter()
+        longest = max((len(s) for s in stop), default=0)
+        tail = ""
+        for i, token in enumerate(self.server.tokens):
+            if i and self.server.token_delay:
+                # Pace against the start, so the rate holds however long writes take
+                delay = start + i * self.server.token_delay - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if stop:
+                tail = tail[-longest:] + token
+                ends = [j for j in (tail.find(s) for s in stop) if j >= 0]
+                if ends:
+                    # Like the API, end the stream before the stop sequence
+                    token = token[: max(min(ends) - (len(tail) - len(token)), 0)]
+                    if token:
+                        self._write_chunk(sse_event(token))
+                    break
+            self._write_chunk(sse_event(token))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    tokens=None,
+    ttft: float = 0.0,
+    token_delay: float = 0.0,
+    honor_stop: bool = True,
+    rate_limit_first: int = 0,
+    retry_after: float = 0.0,
+) -> ThreadingHTTPServer:
+    """
+    Start the fake server on a background thread and return it. The bound port is
+    available as `server.server_address[1]`; call `server.shutdown()` to stop it.
+
+    `ttft` is the delay in seconds before the first token, `token_delay` the delay
+    between subsequent tokens. `synthetic_tokens` makes replies of any length and
+    chunk size. With `honor_stop` unset, `stop` sequences in the
+    request are ignored, as by an API that does not support them. The first
+    `rate_limit_first` requests are answered with a 429 and `retry_after`.
+    """
+    server = FakeOpenAIServer((host, port), FakeOpenAIHandler)
+    server.tokens = tokens or FakeOpenAIHandler.tokens
+    server.ttft = ttft
+    server.token_delay = token_delay
+    server.honor_stop = honor_stop
+    server.rate_limit_first = rate_limit_first
+    server.retry_after = retry_after
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ttft", type=float, default=0.0, help="seconds")
+    parser.add_argument(
+        "--token-rate", type=float, default=0.0, help="tokens a second, 0 for no limit"
+    )
+    parser.add_argument("--tokens", type=int, default=None, help="tokens per reply")
+    parser.add_argument("--chunk-size", type=int, default=4, help="characters a token")
+    args = parser.parse_args()
+
+    server = serve(
+        args.host,
+        args.port,
+        tokens=synthetic_tokens(args.tokens, args.chunk_size) if args.tokens else None,
+        ttft=args.ttft,
+        token_delay=1 / args.token_rate if args.token_rate else 0.0,
+    )
+    print(f"Serving on {base_url(server)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
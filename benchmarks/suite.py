@@ -0,0 +1,279 @@
+"""
+Run the offline benchmark suite and compare it against a saved baseline.
+
+Everything runs against the local fake OpenAI server and a synthetic chat log
+corpus, so results only depend on this machine and this tree:
+
+    parse.<size>            `aiia.parse.parse_chat_markdown`, ms
+    serialize.<size>        `aiia.parse.to_chat_markdown`, ms
+    stream.per_token_us     client overhead of `stream_response` per token, us
+    respond.e2e_ms          `aiia respond` in a fresh process, ms
+    summarize-chats.*       `scripts/summarize-chats` over a corpus, on the first
+                            run that titles logs and on a run with nothing to do
+
+Each value is the median of a few runs. Save the results of a known good tree
+and check a change against them:
+
+    python benchmarks/suite.py -o baseline.json
+    python benchmarks/suite.py --compare baseline.json --threshold 0.2
+
+With `--compare` the exit status is 1 when any result got worse than its
+baseline by more than the threshold.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiia.gpt
+import aiia.parse
+import corpus
+import fake_openai
+
+SIZES = {"10kb": 10_000, "1mb": 1_000_000, "10mb": 10_000_000}
+
+TEMPLATE = """\
+---
+model: gpt-3.5-turbo
+---
+
+>>> Reply with a short title for this chat log:
+
+{chat_log}
+"""
+
+
+def measure(fn, runs):
+    """Median and all of `runs` wall-clock times of `fn()`, in seconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), times
+
+
+def result(name, value, unit, runs=(), scale=1000, lower_is_better=True):
+    return {
+        "name": name,
+        "value": round(value * scale, 3),
+        "unit": unit,
+        "lower_is_better": lower_is_better,
+        "runs": [round(run * scale, 3) for run in runs],
+    }
+
+
+def bench_parse(args):
+    for label, size in SIZES.items():
+        if size > args.max_size:
+            continue
+        contents = corpus.synthetic_chat_log(size)
+        median, runs = measure(
+            lambda: aiia.parse.parse_chat_markdown(contents), args.runs
+        )
+        yield result(f"parse.{label}", median, "ms", runs)
+
+
+def bench_serialize(args):
+    for label, size in SIZES.items():
+        if size > args.max_size:
+            continue
+        data = aiia.parse.parse_chat_markdown(corpus.synthetic_chat_log(size))
+        median, runs = measure(lambda: aiia.parse.to_chat_markdown(data), args.runs)
+        yield result(f"serialize.{label}", median, "ms", runs)
+
+
+def bench_stream(args):
+    """Per-token time of a reply streamed as fast as the server can write it."""
+    tokens = fake_openai.synthetic_tokens(args.tokens)
+    server = fake_openai.serve(tokens=tokens)
+    client = aiia.gpt.Client(base_url=fake_openai.base_url(server))
+    messages = [{"role": "user", "content": "Write me a story"}]
+    try:
+        aiia.gpt.get_response(messages, client=client)
+        median, runs = measure(
+            lambda: aiia.gpt.get_response(messages, client=client), args.runs
+        )
+    finally:
+        client.close()
+        server.shutdown()
+    per_token = [run / len(tokens) for run in runs]
+    yield result("stream.per_token_us", median / len(tokens), "us", per_token, 1e6)
+
+
+def environment(home, server):
+    env = dict(os.environ)
+    env.update(
+        HOME=home,
+        XDG_CACHE_HOME=os.path.join(home, ".cache"),
+        OPENAI_BASE_URL=fake_openai.base_url(server),
+        OPENAI_API_KEY="sk-benchmark",
+        PYTHONPATH=ROOT,
+        AIIA_DAEMON="0",
+    )
+    for name in ("AIIA_CACHE", "AIIA_TELEMETRY", "AIIA_PARSE_CACHE"):
+        env.pop(name, None)
+    return env
+
+
+def run_checked(command, env):
+    process = subprocess.run(command, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        sys.stderr.write(process.stderr)
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def bench_respond(args):
+    """`aiia respond` on a small log, interpreter startup included."""
+    server = fake_openai.serve(tokens=fake_openai.synthetic_tokens(200))
+    home = tempfile.mkdtemp(prefix="aiia-bench-")
+    try:
+        path = os.path.join(home, "chat.chat.md")
+        with open(path, "w") as f:
+            f.write(corpus.synthetic_chat_log(2_000))
+            f.write(">>> Explain it again\n")
+        env = environment(home, server)
+        command = [sys.executable, "-m", "aiia.cli", "respond", path]
+        median, runs = measure(lambda: run_checked(command, env), args.runs)
+    finally:
+        server.shutdown()
+        shutil.rmtree(home)
+    yield result("respond.e2e_ms", median, "ms", runs)
+
+
+def bench_summarize_chats(args):
+    """A first run that titles the untitled logs, then a run with nothing to do."""
+    server = fake_openai.serve(tokens=["A", " title"])
+    script = os.path.join(ROOT, "scripts", "summarize-chats")
+    first_runs, noop_runs = [], []
+    try:
+        for seed in range(args.runs):
+            home = tempfile.mkdtemp(prefix="aiia-bench-")
+            try:
+                corpus.write_corpus(
+                    os.path.join(home, "chat-logs"),
+                    args.corpus,
+                    untitled=0.2,
+                    max_size=min(args.max_size, 200_000),
+                    seed=seed,
+                )
+                prompts = os.path.join(home, ".local", "share", "prompts")
+                os.makedirs(prompts)
+                with open(
+                    os.path.join(prompts, "summarize-chat-log.chat.md"), "w"
+                ) as f:
+                    f.write(TEMPLATE)
+                env = environment(home, server)
+                command = [sys.executable, script]
+                first_runs.append(measure(lambda: run_checked(command, env), 1)[0])
+                noop_runs.append(measure(lambda: run_checked(command, env), 1)[0])
+            finally:
+                shutil.rmtree(home)
+    finally:
+        server.shutdown()
+    first, noop = statistics.median(first_runs), statistics.median(noop_runs)
+    yield result("summarize-chats.first_run_ms", first, "ms", first_runs)
+    yield result("summarize-chats.noop_ms", noop, "ms", noop_runs)
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "serialize": bench_serialize,
+    "stream": bench_stream,
+    "respond": bench_respond,
+    "summarize-chats": bench_summarize_chats,
+}
+
+
+def compare(results, baseline, threshold):
+    """Print each result against its baseline; return the names that regressed."""
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"{'':32}{'baseline':>12}{'current':>12}{'change':>9}")
+    for r in results:
+        before = previous.get(r["name"])
+        if before is None or not before["value"]:
+            print(f"{r['name']:32}{'-':>12}{r['value']:12.3f}")
+            continue
+        change = r["value"] / before["value"] - 1
+        worse = change if r["lower_is_better"] else -change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(r["name"])
+        print(
+            f"{r['name']:32}{before['value']:12.3f}{r['value']:12.3f}"
+            f"{change:+9.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-o", "--output", help="write the results as JSON to a file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results to compare to")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 for 20%%"
+    )
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=5, help="runs per benchmark")
+    parser.add_argument("--tokens", type=int, default=5000, help="tokens per stream")
+    parser.add_argument("--corpus", type=int, default=200, help="logs in the corpus")
+    parser.add_argument(
+        "--max-size", type=int, default=10_000_000, help="largest log in bytes"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="fewer runs on smaller inputs, for CI"
+    )
+    args = parser.parse_args()
+    if args.quick:
+        args.runs, args.tokens, args.corpus = 3, 1000, 50
+        args.max_size = min(args.max_size, 1_000_000)
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        for r in BENCHMARKS[name](args):
+            print(f"{r['name']:32}{r['value']:12.3f} {r['unit']}", file=sys.stderr)
+            results.append(r)
+
+    report = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,61 @@
 local M = {}
 
+-- The unix socket `aiia serve` listens on, see aiia/server.py
+local function socket_path()
+	local path = os.getenv("AIIA_SOCKET")
+	if path and path ~= "" then
+		return path
+	end
+	local runtime_dir = os.getenv("XDG_RUNTIME_DIR") or os.getenv("TMPDIR") or "/tmp"
+	runtime_dir = runtime_dir:gsub("/$", "")
+	return runtime_dir .. "/aiia-" .. vim.loop.getuid() .. ".sock"
+end
+
+-- Only talk to a socket we own, another user could have made one in /tmp
+local function own_socket(path)
+	local stat = vim.loop.fs_stat(path)
+	return stat ~= nil and stat.type == "socket" and stat.uid == vim.loop.getuid()
+end
+
+local request_id = 0
+
+--[[
+Send a request to the `aiia serve` daemon and call on_frame with every
+JSON frame it sends back. Returns the channel and the request id, or nil
+if no daemon is running.
+]]
+--
+local function daemon_request(request, on_frame)
+	local path = socket_path()
+	if not own_socket(path) then
+		return nil
+	end
+
+	local partial = ""
+	local ok, chan = pcall(vim.fn.sockconnect, "pipe", path, {
+		on_data = function(_, data, _)
+			data[1] = partial .. data[1]
+			partial = table.remove(data)
+			for _, line in ipairs(data) do
+				if line ~= "" then
+					on_frame(vim.fn.json_decode(line))
+				end
+			end
+		end,
+	})
+	if not ok or chan == 0 then
+		return nil
+	end
+
+	request_id = request_id + 1
+	request.id = request_id
+	vim.fn.chansend(chan, vim.fn.json_encode(request) .. "\n")
+	return chan, request_id
+end
+
 -- Setup API key
-M.setup = function()
+M.setup = function(opts)
+	opts = opts or {}
 	if os.getenv("OPENAI_API_KEY") == "" then
 		print("Please set the OPENAI_API_KEY environment variable")
 		return
@@ -12,6 +66,11 @@ M.setup = function()
 	if vim.fn.isdirectory(share_dir) == 0 then
 		vim.fn.mkdir(share_dir, "p")
 	end
+
+	-- Keep a warm `aiia serve` process around so requests skip python startup
+	if opts.daemon and not vim.loop.fs_stat(socket_path()) then
+		vim.fn.jobstart({ "aiia", "serve" }, { detach = true })
+	end
 end
 
 --[[
@@ -21,6 +80,7 @@ as a time as they are streamed back from OpenAI.
 ```
 require('gpt').stream("What is the meaning of life?", {
 	trim_leading = true, -- Trim leading whitespace of the response
+	coalesce_ms = 16, -- Join tokens arriving within this window into one chunk
 	on_chunk = function(chunk)
 		print(chunk)
 	end
@@ -56,16 +116,54 @@ M.stream = function(prompt_or_messages, opts)
 	opts = opts or {}
 	local cb = opts.on_chunk or identity1
 	local on_exit = opts.on_exit or identity
-	local command = "aiia respond -if json - | tee /tmp/aiia.log"
+	local coalesce_ms = opts.coalesce_ms or 16
+
+	local chan, id
+	chan, id = daemon_request({
+		type = "respond",
+		contents = encoded_payload,
+		input_format = "json",
+		-- Join tokens into one frame, and one redraw, per window
+		coalesce_ms = coalesce_ms,
+	}, function(frame)
+		if frame.type == "chunk" then
+			cb(frame.content)
+			return
+		end
+		if frame.type == "error" then
+			print("aiia: " .. frame.message)
+		end
+		vim.g.gpt_daemon_chan = nil
+		vim.fn.chanclose(chan)
+		on_exit(chan, frame.type == "done" and 0 or 1, "exit")
+	end)
+	if chan then
+		vim.g.gpt_daemon_chan = chan
+		vim.g.gpt_daemon_request = id
+		return
+	end
+
+	-- Events are JSON lines whose deltas are already coalesced, see aiia/events.py
+	local command = "aiia respond -if json --stream-format events --coalesce-ms "
+		.. coalesce_ms .. " - | tee /tmp/aiia.log"
 
+	local partial = ""
 	local job_id = vim.fn.jobstart(command, {
 		stdout_buffered = false,
 		stdin_buffered = true,
 		on_exit = on_exit,
 		on_stdout = function(_, data, _)
-			local joined = table.concat(data, "\n")
-			if joined ~= "" then
-				cb(joined)
+			data[1] = partial .. data[1]
+			partial = table.remove(data)
+			for _, line in ipairs(data) do
+				if line ~= "" then
+					local event = vim.fn.json_decode(line)
+					if event.type == "delta" then
+						cb(event.content)
+					elseif event.type == "error" then
+						print("aiia: " .. event.message)
+					end
+				end
 			end
 		end,
 	})
@@ -209,10 +307,31 @@ M.visual_prompt = function()
 end
 
 M.cancel = function()
+	if vim.g.gpt_daemon_chan then
+		local cancel = { id = vim.g.gpt_daemon_request, type = "cancel" }
+		pcall(vim.fn.chansend, vim.g.gpt_daemon_chan, vim.fn.json_encode(cancel) .. "\n")
+		return
+	end
 	vim.fn.jobstop(vim.g.gpt_jobid)
 end
 
 local function parse_chatlog(chatlog)
+	local result
+	local chan = daemon_request({
+		type = "parse",
+		contents = chatlog,
+		input_format = "markdown",
+	}, function(frame)
+		result = frame
+	end)
+	if chan then
+		vim.wait(1000, function() return result ~= nil end, 1)
+		vim.fn.chanclose(chan)
+		if result and result.type == "result" then
+			return result.data
+		end
+	end
+
 	local json_string = vim.fn.system("aiia parse -if markdown - 2>/dev/null", chatlog)
 	local parsed_chatlog = vim.fn.json_decode(json_string)
 	return parsed_chatlog
@@ -399,19 +518,22 @@ M.create_chat_from_template = function(template_path, params)
 	new_file = vim.fn.expand(new_file)
 
 	template_path = vim.fn.expand(template_path)
-	local template = table.concat(vim.fn.readfile(template_path), '\n')
 
-	-- Replace the placeholders with the parameter values
-	for key, value in pairs(params) do
-		template = template:gsub('{%s*' .. key .. '%s*}', value)
+	-- `aiia template render` keeps templates parsed and fills the placeholders
+	-- after the frontmatter only, indenting any `>>>` line of the selection, so
+	-- a selection cannot break the frontmatter or start a message of its own
+	vim.fn.system(
+		{ "aiia", "template", "render", template_path, "--vars-json", "-", "-o", new_file },
+		vim.fn.json_encode(params)
+	)
+	if vim.v.shell_error ~= 0 then
+		print("aiia: could not render template " .. template_path)
+		return nil
 	end
 
-	-- Write the modified template to the destination file
 	local scratchpad_file = "~/chat-logs/latest"
 	scratchpad_file = vim.fn.expand(scratchpad_file)
 
-	vim.fn.writefile(vim.split(template, "\n"), new_file)
-	vim.fn.system("touch " .. new_file)
 	vim.fn.system("ln -sf " .. new_file .. " " .. scratchpad_file)
 
 	return new_file
@@ -437,4 +559,31 @@ M.open_chatwindow = function()
 end
 
 
+--[[
+Full-text search the chat log archive with `aiia search` and put the
+ranked matches in the quickfix list.
+]]
+--
+M.search = function(query)
+	query = query or vim.fn.input({ prompt = "[Search chats]: ", cancelreturn = "" })
+	if query == "" then
+		return
+	end
+
+	local lines = vim.fn.systemlist({ "aiia", "search", "-of", "jsonl", query })
+	local items = {}
+	for _, line in ipairs(lines) do
+		local ok, result = pcall(vim.fn.json_decode, line)
+		if ok and type(result) == "table" then
+			table.insert(items, {
+				filename = result.path,
+				text = "(" .. result.title .. ") " .. result.snippet:gsub("%s+", " "),
+			})
+		end
+	end
+
+	vim.fn.setqflist({}, " ", { title = "aiia search: " .. query, items = items })
+	vim.cmd("copen")
+end
+
 return M
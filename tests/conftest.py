@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from aiia import telemetry, templates
+from aiia.workflows import webcache
+from benchmarks import fake_openai
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    monkeypatch.setattr(webcache, "_default_web_cache", None)
+    monkeypatch.setattr(templates, "_default_registry", None)
+    monkeypatch.delenv("AIIA_TELEMETRY", raising=False)
+    monkeypatch.setattr(telemetry, "_sinks", [])
+    monkeypatch.setattr(telemetry, "_configured", False)
+
+
+@pytest.fixture
+def fake_server():
+    server = fake_openai.serve()
+    yield server
+    server.shutdown()
+    server.server_close()
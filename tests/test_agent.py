@@ -0,0 +1,108 @@
+import asyncio
+
+from aiia.agent import Agent, ClauseParser, Step, parse_action
+
+
+def scripted(turns, chunk_size=3):
+    """A fake model that streams each scripted turn in small chunks."""
+    prompts = []
+
+    def complete(prompt):
+        prompts.append(prompt)
+        text = turns[len(prompts) - 1]
+        for i in range(0, len(text), chunk_size):
+            yield text[i : i + chunk_size]
+
+    return complete, prompts
+
+
+def test_clause_parser_handles_labels_split_across_chunks():
+    parser = ClauseParser()
+    chunks = ["Thou", "ght: look it", " up\nnote", "s: kept\nAct", "ion: SEARCH(x)\n"]
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+
+    assert parser.clauses == [
+        Step("Thought", " look it up\n"),
+        Step("notes", " kept\n"),
+        Step("Action", " SEARCH(x)\n"),
+    ]
+
+
+def test_clause_parser_keeps_long_and_unlabelled_lines_in_the_clause():
+    parser = ClauseParser()
+    parser.feed("Thought: one\n- a list: item\nplain\n")
+    parser.close()
+
+    assert parser.clauses == [Step("Thought", " one\n- a list: item\nplain\n")]
+
+
+def test_parse_action():
+    assert parse_action(" SEARCH(a (b))") == ("SEARCH", "a (b)")
+    assert parse_action("READ[3]\n") == ("READ", "3")
+
+
+def test_agent_runs_sync_and_async_tools_until_final_answer():
+    complete, prompts = scripted(
+        [
+            "Thought: search\nAction: SEARCH(cats)\nObservation: made up",
+            "Thought: read\nAction: READ[2]\n",
+            "Thought: done\nFinal Answer: 42\n",
+        ]
+    )
+
+    async def search(query):
+        await asyncio.sleep(0)
+        return f"results for {query}"
+
+    echoed = []
+    agent = Agent(
+        "Question: q\n",
+        tools={"SEARCH": search, "READ": lambda part: f"part {part}"},
+        complete=complete,
+        on_text=echoed.append,
+    )
+
+    assert agent.run() == "42"
+    assert prompts[1] == (
+        "Question: q\nThought: search\nAction: SEARCH(cats)\n"
+        "Observation: results for cats\n"
+    )
+    assert prompts[2].endswith("Action: READ[2]\nObservation: part 2\n")
+    assert "made up" not in agent.transcript
+    assert "".join(echoed) == agent.transcript[len("Question: q\n") :]
+    assert [step.label for step in agent.steps] == [
+        "",
+        "Thought",
+        "Action",
+        "Observation",
+        "Thought",
+        "Action",
+        "Observation",
+        "Thought",
+        "Final Answer",
+    ]
+
+
+def test_agent_reports_unknown_actions_and_tool_errors():
+    complete, prompts = scripted(
+        [
+            "Action: FLY(away)\n",
+            "Action: READ[x]\n",
+            "Final Answer: no\n",
+        ]
+    )
+    agent = Agent(
+        "Q\n", tools={"READ": int}, complete=complete, on_text=lambda text: None
+    )
+
+    assert agent.run() == "no"
+    assert "Unknown action FLY, use one of [READ]" in prompts[1]
+    assert "READ failed: ValueError" in prompts[2]
+
+
+def test_agent_stops_when_the_model_does_not_act():
+    complete, _ = scripted(["Thought: hmm\n"])
+    agent = Agent("Q\n", tools={}, complete=complete, on_text=lambda text: None)
+    assert agent.run() is None
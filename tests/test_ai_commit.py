@@ -0,0 +1,68 @@
+import os
+import importlib.util
+import importlib.machinery
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "scripts", "ai-commit")
+loader = importlib.machinery.SourceFileLoader("ai_commit", SCRIPT)
+spec = importlib.util.spec_from_loader("ai_commit", loader)
+ai_commit = importlib.util.module_from_spec(spec)
+loader.exec_module(ai_commit)
+
+BLOB_A = "1" * 40
+BLOB_B = "2" * 40
+
+
+def file_diff(path, hunks):
+    header = (
+        f"diff --git a/{path} b/{path}\n"
+        f"index {BLOB_A}..{BLOB_B} 100644\n"
+        f"--- a/{path}\n"
+        f"+++ b/{path}\n"
+    )
+    return header + "".join(hunks)
+
+
+def hunk(start, lines):
+    return f"@@ -{start},1 +{start},{len(lines)} @@ def f():\n" + "".join(
+        f"+{line}\n" for line in lines
+    )
+
+
+def test_split_diff_into_files_and_hunks():
+    diff = file_diff("a.py", [hunk(1, ["x = 1"]), hunk(10, ["y = 2"])]) + file_diff(
+        "docs/b.md", [hunk(3, ["# Title"])]
+    )
+
+    a, b = ai_commit.split_diff(diff)
+
+    assert (a.path, b.path) == ("a.py", "docs/b.md")
+    assert a.blobs == (BLOB_A, BLOB_B)
+    assert a.hunks == [hunk(1, ["x = 1"]), hunk(10, ["y = 2"])]
+    assert a.text + b.text == diff
+
+
+def test_chunk_file_splits_at_hunks():
+    hunks = [hunk(i * 10, [f"line {i} {j}" for j in range(20)]) for i in range(5)]
+    (file,) = ai_commit.split_diff(file_diff("a.py", hunks))
+
+    pieces = ai_commit.chunk_file(file, limit=1000)
+
+    assert len(pieces) > 1
+    assert all(len(piece) <= 1000 for piece in pieces)
+    assert all(piece.startswith(file.header) for piece in pieces)
+    assert "".join(piece[len(file.header) :] for piece in pieces) == "".join(hunks)
+
+
+def test_oversized_hunk_is_split_between_lines():
+    lines = [f"line {j}" for j in range(500)] + ["x" * 5000]
+    (file,) = ai_commit.split_diff(file_diff("a.py", [hunk(1, lines)]))
+    head = hunk(1, lines).split("\n", 1)[0] + "\n"
+
+    pieces = ai_commit.chunk_file(file, limit=1000)
+
+    assert len(pieces) > 5
+    assert all(len(piece) <= 1000 for piece in pieces)
+    assert all(piece.startswith(file.header + head) for piece in pieces)
+    kept = [line for piece in pieces for line in piece.splitlines()[5:]]
+    assert kept[:-1] == [f"+{line}" for line in lines[:-1]]
+    assert kept[-1].startswith("+xxx") and kept[-1].endswith("[truncated]")
@@ -0,0 +1,126 @@
+import io
+import json
+import time
+import asyncio
+import urllib.error
+
+import aiia.gpt
+from aiia import batch, parse
+
+from benchmarks import fake_openai
+
+
+def scheduler_for(server, **kwargs):
+    client = aiia.gpt.AsyncClient(base_url=fake_openai.base_url(server))
+    return batch.Scheduler(client=client, **kwargs)
+
+
+def run(conversations, scheduler):
+    replies, errors = {}, {}
+    counts = asyncio.run(
+        batch.run_batch(
+            conversations,
+            scheduler,
+            lambda c, reply, summarized: replies.setdefault(c.id, reply),
+            lambda c, error: errors.setdefault(c.id, error),
+        )
+    )
+    return counts, replies, errors
+
+
+def test_replies_to_a_directory_and_skips_answered_logs(fake_server, tmp_path):
+    for i in range(5):
+        (tmp_path / f"{i}.chat.md").write_text(f">>> question {i}\n")
+    (tmp_path / "answered.chat.md").write_text(">>> hi\n\n🤖 GPT:\n\nhello\n")
+    (tmp_path / "broken.chat.md").write_text("---\n: [\n---\n>>> hi\n")
+
+    counts, replies, errors = run(
+        batch.iter_directory(str(tmp_path)),
+        scheduler_for(fake_server, max_concurrency=2),
+    )
+
+    assert counts == {"replied": 5, "skipped": 1, "failed": 1}
+    assert set(replies.values()) == {"Hello world!"}
+    assert list(errors) == [str(tmp_path / "broken.chat.md")]
+
+
+def test_rate_limits_are_retried_after_retry_after():
+    server = fake_openai.serve(rate_limit_first=3, retry_after=0.1)
+    try:
+        lines = io.StringIO(
+            "\n".join(
+                json.dumps({"id": i, "messages": [{"role": "user", "content": "hi"}]})
+                for i in range(4)
+            )
+        )
+        scheduler = scheduler_for(server, max_concurrency=4)
+
+        start = time.monotonic()
+        counts, replies, _ = run(batch.iter_jsonl(lines), scheduler)
+
+        assert counts["replied"] == 4
+        assert sorted(replies) == ["0", "1", "2", "3"]
+        assert scheduler.retries == 3
+        assert time.monotonic() - start >= 0.1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_gives_up_after_max_retries():
+    server = fake_openai.serve(rate_limit_first=10)
+    try:
+        lines = [json.dumps({"messages": [{"role": "user", "content": "hi"}]})]
+        scheduler = scheduler_for(server, max_retries=2, base_delay=0.001)
+        counts, _, errors = run(batch.iter_jsonl(lines), scheduler)
+
+        assert counts["failed"] == 1
+        assert errors["1"].code == 429
+        assert scheduler.retries == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_retry_after_header_forms():
+    def error(value):
+        headers = {"Retry-After": value} if value is not None else {}
+        return urllib.error.HTTPError("", 429, "", headers, None)
+
+    assert batch.retry_after(error("2")) == 2.0
+    assert batch.retry_after(error(None)) is None
+    assert batch.retry_after(error("Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0
+    assert not batch.retryable(urllib.error.HTTPError("", 400, "", {}, None))
+
+
+def test_token_bucket_paces_requests():
+    async def acquire_all():
+        # 10,000 tokens a second, the first minute's worth available at once
+        bucket = batch.TokenBucket(tokens_per_minute=600_000)
+        await bucket.acquire(600_000)
+        start = time.monotonic()
+        await bucket.acquire(2000)
+        return time.monotonic() - start
+
+    assert 0.15 < asyncio.run(acquire_all()) < 1.0
+
+
+def test_respond_batch_appends_in_place(fake_server, tmp_path, monkeypatch):
+    from aiia import cli
+
+    path = tmp_path / "log.chat.md"
+    path.write_text(">>> hi\n")
+    monkeypatch.setattr(
+        aiia.gpt,
+        "_default_async_client",
+        aiia.gpt.AsyncClient(base_url=fake_openai.base_url(fake_server)),
+    )
+
+    cli.respond_batch_command(str(tmp_path))
+    cli.respond_batch_command(str(tmp_path))
+
+    data = parse.parse_chat_markdown(path.read_text())
+    assert data["messages"] == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "Hello world!"},
+    ]
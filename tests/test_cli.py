@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import subprocess
+
+import aiia.parse
+
+
+def test_parse_does_not_import_network_or_yaml(tmp_path):
+    path = tmp_path / "log.chat.md"
+    path.write_text(">>> Write me a haiku\n")
+    env = {**os.environ, "AIIA_DAEMON": "0", "OPENAI_API_KEY": ""}
+    script = (
+        "import sys, runpy; sys.argv = ['aiia', 'parse', sys.argv[1]]; "
+        "runpy.run_module('aiia.cli', run_name='__main__'); "
+        "print(sorted(m for m in sys.modules if m in "
+        "('aiia.gpt', 'aiia.server', 'yaml', 'asyncio', 'ssl')))"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", script, str(path)],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    output, imported = result.stdout.rsplit("\n", 2)[:2]
+
+    assert json.loads(output)["messages"][0]["content"] == "Write me a haiku"
+    assert imported == "[]"
+
+
+def test_parse_jsonl_output(tmp_path):
+    path = tmp_path / "log.chat.md"
+    path.write_text(
+        "---\ntitle: Haiku\n---\n\n>>> Write me a haiku\n\n🤖 GPT:\n\nOld pond\n"
+        "\n>>> Another\n"
+    )
+    env = {**os.environ, "AIIA_DAEMON": "0"}
+    command = [sys.executable, "-m", "aiia.cli", "parse", str(path)]
+
+    jsonl = subprocess.run(
+        command + ["-of", "jsonl"], capture_output=True, text=True, env=env, check=True
+    ).stdout
+    whole = subprocess.run(
+        command + ["-of", "json"], capture_output=True, text=True, env=env, check=True
+    ).stdout
+
+    lines = [json.loads(line) for line in jsonl.splitlines()]
+    assert jsonl.endswith("\n") and len(lines) == 4
+    assert lines == [
+        {"metadata": {"title": "Haiku"}},
+        {"role": "user", "content": "Write me a haiku"},
+        {"role": "assistant", "content": "Old pond"},
+        {"role": "user", "content": "Another"},
+    ]
+    assert json.loads(whole) == {
+        "metadata": lines[0]["metadata"],
+        "messages": lines[1:],
+    }
+
+
+def test_template_render_skips_yaml_once_cached(tmp_path):
+    prompts = tmp_path / "data" / "prompts"
+    prompts.mkdir(parents=True)
+    (prompts / "explain.chat.md").write_text(
+        "---\nmodel: gpt-4\n---\n\n>>> Explain {code}\n"
+    )
+    output = tmp_path / "chat.chat.md"
+    env = {
+        **os.environ,
+        "XDG_DATA_HOME": str(tmp_path / "data"),
+        "XDG_CACHE_HOME": str(tmp_path / "cache"),
+    }
+    script = (
+        "import sys, runpy; sys.argv = ['aiia', 'template', 'render', 'explain', "
+        "'--vars-json', '-', '-o', sys.argv[1]]; "
+        "runpy.run_module('aiia.cli', run_name='__main__'); "
+        "print('yaml' in sys.modules)"
+    )
+
+    imported = []
+    for _ in range(2):
+        result = subprocess.run(
+            [sys.executable, "-c", script, str(output)],
+            input=json.dumps({"code": "x = 1\n>>> y"}),
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+        imported.append(result.stdout.strip())
+
+    assert imported == ["True", "False"]
+    assert output.read_text() == "---\nmodel: gpt-4\n---\n\n>>> Explain x = 1\n >>> y\n"
+    assert aiia.parse.parse_chat_markdown(output.read_text())["messages"] == [
+        {"role": "user", "content": "Explain x = 1\n >>> y"}
+    ]
@@ -0,0 +1,155 @@
+import os
+
+from aiia import context
+
+
+def chat(turns, words=200):
+    messages = [{"role": "system", "content": "Be brief."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "w " * words})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "w " * words})
+    messages.append({"role": "user", "content": "latest question"})
+    return messages
+
+
+class Summarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, messages):
+        self.calls.append(messages)
+        return f"summary of {len(messages)} messages"
+
+
+def cost(messages):
+    return sum(context.estimate_tokens(m["content"]) for m in messages)
+
+
+def test_short_chats_are_sent_unchanged():
+    messages = chat(2)
+    summarize = Summarizer()
+
+    fitted, summary = context.fit_messages(messages, 3000, summarize)
+
+    assert fitted == messages
+    assert summary is None
+    assert not summarize.calls
+
+
+def test_old_turns_are_summarized_and_recent_ones_kept():
+    messages = chat(20)
+    summarize = Summarizer()
+
+    fitted, summary = context.fit_messages(messages, 1000, summarize)
+
+    assert cost(fitted) <= 1000
+    assert fitted[0] == messages[0]
+    assert fitted[1]["content"].startswith(context.SUMMARY_PREFIX)
+    assert fitted[2]["role"] == "user"
+    assert fitted[-1] == messages[-1]
+    assert fitted[2:] == messages[1 + summary["messages"] :]
+
+
+def test_summary_is_reused_then_rolled_forward():
+    summarize = Summarizer()
+    messages = chat(20)
+    _, summary = context.fit_messages(messages, 1000, summarize)
+    calls = len(summarize.calls)
+
+    # One more turn still fits next to the stored summary
+    messages = messages[:-1] + chat(21)[-3:]
+    fitted, reused = context.fit_messages(messages, 1000, summarize, summary)
+    assert reused is summary
+    assert len(summarize.calls) == calls
+
+    # Many more do not, and the new summary starts from the old one
+    messages = chat(40)
+    fitted, rolled = context.fit_messages(messages, 1000, summarize, summary)
+    assert cost(fitted) <= 1000
+    assert rolled["messages"] > summary["messages"]
+    assert summarize.calls[calls][0] == context.summary_message(summary["content"])
+
+
+def test_summary_requests_fit_in_the_budget():
+    summarize = Summarizer()
+    messages = chat(20)
+    messages[3] = {"role": "user", "content": "w " * 5000}
+
+    fitted, summary = context.fit_messages(messages, 1000, summarize)
+
+    assert cost(fitted) <= 1000
+    for call in summarize.calls:
+        assert cost(call) <= 1000
+    # Each request after the first folds in the summary so far
+    for call in summarize.calls[1:]:
+        assert call[0]["content"].startswith(context.SUMMARY_PREFIX)
+
+
+def test_edited_history_invalidates_the_summary():
+    summarize = Summarizer()
+    messages = chat(20)
+    _, summary = context.fit_messages(messages, 1000, summarize)
+    calls = len(summarize.calls)
+
+    messages[1] = {"role": "user", "content": "edited"}
+    context.fit_messages(messages, 1000, summarize, summary)
+
+    assert len(summarize.calls) > calls
+    assert summarize.calls[calls][0] == messages[1]
+
+
+def test_summaries_are_reused_without_the_frontmatter(tmp_path):
+    summarize = Summarizer()
+    cache = context.SummaryCache("gpt-4", str(tmp_path / "summaries"))
+    written_back = Summarizer()
+    data = {"metadata": {"context_budget": 1500}, "messages": []}
+    for turns in range(1, 41):
+        # A fresh parse every turn, as when the reply is not written back
+        fresh = {"metadata": {"context_budget": 1500}, "messages": chat(turns)}
+        fitted, _ = context.fit_chat(fresh, "gpt-4", summarize, cache)
+        assert cost(fitted) <= 1500
+
+        data["messages"] = chat(turns)
+        context.fit_chat(data, "gpt-4", written_back)
+
+    assert len(summarize.calls) <= len(written_back.calls)
+
+
+def test_budgets_match_exact_model_names():
+    assert context.get_budget({}, "gpt-4-0613") == 6000
+    assert context.get_budget({}, "gpt-4-32k-0613") == 24000
+    assert context.get_budget({}, "gpt-3.5-turbo-16k") == 12000
+    for model in ["gpt-4-1106-preview", "gpt-4-turbo", "gpt-4o"]:
+        assert context.get_budget({}, model) == 96000
+    assert context.get_budget({"context_budget": 100}, "gpt-4") == 100
+
+    # Unknown models are not trimmed
+    assert context.get_budget({}, "gpt-4-future") == 0
+    assert context.fit_messages(chat(20), 0, Summarizer()) == (chat(20), None)
+
+
+def test_malformed_frontmatter_summaries_are_ignored():
+    messages = chat(20)
+    for summary in ["oops", ["messages", 3], {"messages": "3"}, {"messages": 3}]:
+        fitted, fresh = context.fit_messages(messages, 1000, Summarizer(), summary)
+        assert cost(fitted) <= 1000
+        assert isinstance(fresh, dict)
+
+
+def test_chats_under_budget_leave_no_cache_behind():
+    data = {"metadata": {}, "messages": chat(2)}
+
+    assert context.fit_chat(data, "gpt-4", Summarizer()) == (data["messages"], False)
+    assert not os.path.exists(context.default_cache_dir("summaries"))
+
+
+def test_prompt_stays_bounded_as_the_log_grows():
+    summarize = Summarizer()
+    data = {"metadata": {"context_budget": 1500}, "messages": []}
+    for turns in range(1, 101):
+        data["messages"] = chat(turns)
+        fitted, _ = context.fit_chat(data, "gpt-4", summarize)
+        assert cost(fitted) <= 1500
+
+    # Summaries are only made every few turns
+    assert len(summarize.calls) < 40
@@ -0,0 +1,24 @@
+from aiia.workflows.docstore import DocumentStore
+
+
+def test_chunks_cover_document_and_end_before_tags(tmp_path):
+    html = "<html><body>" + "".join(
+        f"<div class='ad-{i}'>héllo wörld {i}</div>" for i in range(500)
+    )
+    path = tmp_path / "index.html"
+    path.write_text(html)
+
+    with DocumentStore(str(path), chunk_size=100) as document:
+        parts = [document.read(i) for i in range(1, len(document) + 1)]
+
+    assert "".join(parts) == html
+    assert all(part.startswith("<") for part in parts)
+    assert all(len(part.encode()) <= 100 for part in parts)
+
+
+def test_empty_document(tmp_path):
+    path = tmp_path / "index.html"
+    path.write_text("")
+
+    with DocumentStore(str(path)) as document:
+        assert len(document) == 0
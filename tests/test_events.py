@@ -0,0 +1,133 @@
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+
+import pytest
+
+from aiia import events
+from benchmarks import fake_openai
+
+
+def paced(chunks, delay):
+    for chunk in chunks:
+        time.sleep(delay)
+        yield chunk
+
+
+def test_coalesce_joins_fast_chunks():
+    batches = list(events.coalesce(paced(["a"] * 50, 0.001), interval=0.02))
+
+    assert "".join(batches) == "a" * 50
+    assert len(batches) < 15
+
+
+def test_coalesce_holds_a_chunk_at_most_the_interval():
+    def stalled():
+        yield "first"
+        yield "held"
+        time.sleep(0.3)
+        yield "late"
+
+    arrivals = []
+    start = time.perf_counter()
+    for batch in events.coalesce(stalled(), interval=0.02):
+        arrivals.append((batch, time.perf_counter() - start))
+
+    assert [batch for batch, _ in arrivals] == ["first", "held", "late"]
+    assert arrivals[1][1] < 0.1
+
+
+def test_coalesce_flushes_at_max_chars():
+    batches = list(events.coalesce(["abc"] * 4, interval=10, max_chars=6))
+    assert "".join(batches) == "abc" * 4
+    assert all(len(batch) <= 6 for batch in batches[1:])
+
+
+def test_coalesce_raises_after_the_text_before_a_failure():
+    def failing():
+        yield "partial"
+        raise ConnectionError("dropped")
+
+    seen = []
+    with pytest.raises(ConnectionError):
+        for batch in events.coalesce(failing(), interval=0.02):
+            seen.append(batch)
+    assert seen == ["partial"]
+
+
+def test_acoalesce_joins_fast_chunks():
+    async def chunks():
+        for _ in range(50):
+            await asyncio.sleep(0.001)
+            yield "a"
+
+    async def collect():
+        return [batch async for batch in events.acoalesce(chunks(), interval=0.02)]
+
+    batches = asyncio.run(collect())
+    assert "".join(batches) == "a" * 50
+    assert len(batches) < 15
+
+
+def test_event_writer_reports_errors():
+    def failing():
+        yield "partial"
+        raise ConnectionError("dropped")
+
+    out = io.StringIO()
+    assert not events.EventWriter(out, "gpt-4").stream(failing())
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line["type"] for line in lines] == ["start", "delta", "error"]
+    assert lines[-1]["message"] == "dropped"
+
+
+def test_respond_stream_format_events(tmp_path):
+    server = fake_openai.serve(tokens=["a"] * 100, ttft=0.05, token_delay=0.001)
+    path = tmp_path / "chat.chat.md"
+    path.write_text(">>> hi\n")
+    env = {
+        **os.environ,
+        "AIIA_DAEMON": "0",
+        "OPENAI_BASE_URL": fake_openai.base_url(server),
+    }
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "aiia.cli", "respond", "-sf", "events", str(path)],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert lines[0]["type"] == "start"
+    assert lines[-1]["type"] == "done"
+    deltas = [line for line in lines if line["type"] == "delta"]
+    assert "".join(d["content"] for d in deltas) == "a" * 100
+    assert len(deltas) < 30
+    assert lines[-1]["chunks"] == 100
+    assert lines[-1]["ttft_ms"] >= 50
+    assert [line["t_ms"] for line in lines] == sorted(line["t_ms"] for line in lines)
+
+
+def test_events_cannot_be_written_inplace(tmp_path):
+    path = tmp_path / "chat.chat.md"
+    path.write_text(">>> hi\n")
+    result = subprocess.run(
+        [sys.executable, "-m", "aiia.cli", "respond", "-sf", "events", "-i", str(path)],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "AIIA_DAEMON": "0"},
+    )
+
+    assert result.returncode == 2
+    assert "--inplace" in result.stderr
+    assert path.read_text() == ">>> hi\n"
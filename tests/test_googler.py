@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("readability")
+pytest.importorskip("lxml")
+
+from aiia.workflows import googler
+
+PAGES = {
+    "/search": """
+        <div class="g"><div class="yuRUbf"><a href="/one">One</a></div></div>
+        <div class="g"><div class="yuRUbf"><a href="/two">Two</a></div></div>
+    """,
+    "/one": "<html><body><article><p>The first page says hello.</p></article></body></html>",
+    "/two": "<html><body><article><p>The second page says goodbye.</p></article></body></html>",
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = PAGES[self.path.split("?")[0]].encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_search_and_batched_read_with_pluggable_fetcher(site):
+    fetcher = googler.HTTPFetcher()
+
+    async def search_then_read():
+        links = await googler.google_search(
+            "hello", fetcher, search_url=site + "/search"
+        )
+        return links, await googler.read_webpages([site + l for l in links], fetcher)
+
+    links, pages = asyncio.run(search_then_read())
+
+    assert links == ["/one", "/two"]
+    assert "hello" in pages[0]
+    assert "goodbye" in pages[1]
+
+
+def test_read_links_may_contain_commas():
+    assert googler.parse_links("https://a.com/x?ids=1,2") == ["https://a.com/x?ids=1,2"]
+    assert googler.parse_links("https://a.com/a,b\n'https://b.com',") == [
+        "https://a.com/a,b",
+        "https://b.com",
+    ]
+    assert googler.parse_links('["https://a.com/a,b", "https://c.com"]') == [
+        "https://a.com/a,b",
+        "https://c.com",
+    ]
+
+
+def test_blocked_search_is_not_cached():
+    class Fetcher:
+        pages = ["<p>Our systems have detected unusual traffic</p>", PAGES["/search"]]
+
+        async def fetch(self, url):
+            return self.pages.pop(0)
+
+    fetcher = googler.CachingFetcher(Fetcher())
+
+    assert asyncio.run(googler.google_search("hello", fetcher)) == []
+    assert asyncio.run(googler.google_search("hello", fetcher)) == ["/one", "/two"]
@@ -1,3 +1,7 @@
+import io
+
+import pytest
+
 import aiia.parse
 
 
@@ -94,3 +98,97 @@ You're welcome
         "role": "system",
         "content": "I am a little teapot, short and stout",
     }
+
+
+def test_horizontal_rule_in_body_is_not_frontmatter():
+    data = aiia.parse.parse_chat_markdown(
+        """\
+---
+title: test
+---
+
+>>> Split this --- on dashes
+
+---
+
+🤖 GPT: Done
+"""
+    )
+
+    assert data["metadata"] == {"title": "test"}
+    assert data["messages"] == [
+        {"role": "user", "content": "Split this --- on dashes\n\n---"},
+        {"role": "assistant", "content": "Done"},
+    ]
+
+
+def test_iter_chat_markdown_yields_metadata_then_messages():
+    items = aiia.parse.iter_chat_markdown(
+        io.StringIO(
+            """\
+---
+title: test
+prompt: Be brief
+---
+
+>>> Write me a haiku
+
+🤖 GPT: 
+
+Silent drifting clouds
+"""
+        )
+    )
+
+    assert next(items) == {"title": "test", "prompt": "Be brief"}
+    assert list(items) == [
+        {"role": "system", "content": "Be brief"},
+        {"role": "user", "content": "Write me a haiku"},
+        {"role": "assistant", "content": "Silent drifting clouds"},
+    ]
+
+
+def test_append_assistant_message(tmp_path):
+    path = tmp_path / "log.chat.md"
+    path.write_text("---\ntitle: test\n---\n\n>>> Write me a haiku\n\n\n  \n")
+
+    aiia.parse.append_assistant_message(str(path), iter(["Silent ", "clouds"]))
+
+    assert path.read_text().endswith(
+        ">>> Write me a haiku\n\n🤖 GPT:\n\nSilent clouds\n\n"
+    )
+    assert aiia.parse.parse_chat_markdown(path.read_text())["messages"] == [
+        {"role": "user", "content": "Write me a haiku"},
+        {"role": "assistant", "content": "Silent clouds"},
+    ]
+
+
+def test_interrupted_append_leaves_a_valid_chat_log(tmp_path):
+    path = tmp_path / "log.chat.md"
+    path.write_text(">>> Write me a haiku\n")
+
+    def chunks():
+        yield "Silent "
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        aiia.parse.append_assistant_message(str(path), chunks())
+
+    assert aiia.parse.parse_chat_markdown(path.read_text())["messages"][-1] == {
+        "role": "assistant",
+        "content": "Silent",
+    }
+
+
+def test_failed_request_leaves_the_log_unchanged(tmp_path):
+    path = tmp_path / "log.chat.md"
+    path.write_text(">>> Write me a haiku\n\n")
+
+    def chunks():
+        raise ConnectionRefusedError
+        yield
+
+    with pytest.raises(ConnectionRefusedError):
+        aiia.parse.append_assistant_message(str(path), chunks())
+
+    assert path.read_text() == ">>> Write me a haiku\n\n"
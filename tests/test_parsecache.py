@@ -0,0 +1,78 @@
+import os
+import datetime
+
+import pytest
+
+from aiia import batch, parse, parsecache
+
+LOG = """\
+---
+title: Dates
+date: 2023-05-01
+---
+
+>>> When was this?
+
+🤖 GPT:
+
+Yesterday.
+"""
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "logs" / "a.chat.md"
+    path.parent.mkdir()
+    path.write_text(LOG)
+    return path
+
+
+def test_unchanged_logs_are_loaded_without_parsing(tmp_path, log, monkeypatch):
+    cache = parsecache.ParsedLogCache(str(tmp_path / "parsed.sqlite"))
+    first = cache.load(str(log))
+    assert first["metadata"]["date"] == datetime.date(2023, 5, 1)
+    cache.close()
+
+    def fail(contents):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(parse, "parse_chat_markdown", fail)
+    with parsecache.ParsedLogCache(str(tmp_path / "parsed.sqlite")) as cache:
+        assert cache.load(str(log)) == first
+        assert cache.hits == 1
+
+
+def test_changed_logs_are_parsed_again(tmp_path, log):
+    with parsecache.ParsedLogCache(str(tmp_path / "parsed.sqlite")) as cache:
+        cache.load(str(log))
+        log.write_text(LOG + "\n>>> And today?\n")
+        data = cache.load(str(log))
+
+        assert data["messages"][-1] == {"role": "user", "content": "And today?"}
+        assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_iter_directory_through_cache(tmp_path, log):
+    with parsecache.ParsedLogCache(str(tmp_path / "parsed.sqlite")) as cache:
+        for _ in range(2):
+            (conversation,) = batch.iter_directory(str(log.parent), cache)
+            assert conversation.data["metadata"]["title"] == "Dates"
+        assert cache.hits == 1
+
+
+def test_default_cache_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.delenv("AIIA_PARSE_CACHE", raising=False)
+    assert parsecache.default_cache() is None
+
+    monkeypatch.setenv("AIIA_PARSE_CACHE", str(tmp_path / "parsed.sqlite"))
+    cache = parsecache.default_cache()
+    cache.close()
+    assert os.path.exists(tmp_path / "parsed.sqlite")
+
+
+def test_pure_python_yaml_fallback(monkeypatch):
+    expected = parse.parse_chat_markdown(LOG)
+    monkeypatch.setattr(parse, "USE_LIBYAML", False)
+
+    assert parse.parse_chat_markdown(LOG) == expected
+    assert parse.parse_chat_markdown(parse.to_chat_markdown(expected)) == expected
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import aiia.cli
+import aiia.search
+
+
+def write_log(directory, name, title, body):
+    path = directory / name
+    path.write_text(f"---\ntitle: {title}\nmodel: gpt-4\n---\n\n{body}")
+    return str(path)
+
+
+def test_search_ranks_and_updates_incrementally(tmp_path):
+    logs = tmp_path / "chat-logs"
+    logs.mkdir()
+    rust = write_log(logs, "a.chat.md", "Rust lifetimes", ">>> What is a borrow?\n")
+    write_log(logs, "b.chat.md", "Cooking", ">>> How long to boil an egg?\n")
+
+    conn = aiia.search.connect(str(tmp_path / "index.sqlite"))
+    assert aiia.search.update_index(conn, str(logs)) == 2
+    assert aiia.search.update_index(conn, str(logs)) == 0
+
+    (result,) = aiia.search.search(conn, "borrow")
+    assert result["path"] == rust
+    assert result["title"] == "Rust lifetimes"
+    assert result["snippet"] == "What is a [borrow]?"
+
+    write_log(logs, "a.chat.md", "Rust lifetimes", ">>> What is a borrow checker?\n")
+    os.unlink(logs / "b.chat.md")
+    assert aiia.search.update_index(conn, str(logs)) == 1
+
+    assert aiia.search.search(conn, "egg") == []
+    assert len(aiia.search.search(conn, "borrow")) == 1
+
+
+def test_plain_queries_are_quoted(tmp_path):
+    logs = tmp_path / "chat-logs"
+    logs.mkdir()
+    write_log(logs, "a.chat.md", "Quotes", '>>> say "hello" AND (goodbye)\n')
+
+    conn = aiia.search.connect(str(tmp_path / "index.sqlite"))
+    aiia.search.update_index(conn, str(logs))
+
+    assert len(aiia.search.search(conn, 'hello" (goodbye')) == 1
+
+
+@pytest.mark.parametrize(
+    "query, raw", [("", False), (" ", True), ('"', True), ("foo AND", True)]
+)
+def test_invalid_queries_are_usage_errors(tmp_path, capsys, query, raw):
+    logs = tmp_path / "chat-logs"
+    logs.mkdir()
+    write_log(logs, "a.chat.md", "Quotes", ">>> foo\n")
+
+    with pytest.raises(SystemExit) as exit:
+        aiia.cli.search_command(query, str(logs), raw=raw)
+
+    assert exit.value.code == 2
+    assert "search query" in capsys.readouterr().err
+    assert os.path.exists(tmp_path / "cache" / "aiia" / "search.sqlite")
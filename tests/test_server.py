@@ -0,0 +1,163 @@
+import os
+import json
+import stat
+import time
+import argparse
+import asyncio
+import tempfile
+import threading
+
+import pytest
+
+import aiia.cli
+import aiia.daemon
+import aiia.server
+
+from benchmarks import fake_openai
+
+
+@pytest.fixture
+def socket_path():
+    path = os.path.join(tempfile.mkdtemp(), "aiia.sock")
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(aiia.server.serve(path))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while not aiia.daemon.is_running(path):
+        time.sleep(0.01)
+
+    yield path
+
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join()
+    loop.close()
+
+
+def test_parse_over_socket(socket_path):
+    (frame,) = aiia.daemon.request(
+        {"type": "parse", "contents": ">>> hi", "output_format": "jsonl"},
+        socket_path,
+    )
+
+    assert frame["type"] == "result"
+    assert frame["data"]["messages"] == [{"role": "user", "content": "hi"}]
+    assert frame["output"] == '{"metadata": {}}\n{"role": "user", "content": "hi"}'
+
+
+def test_respond_streams_chunks(socket_path, fake_server, monkeypatch):
+    import aiia.gpt
+
+    client = aiia.gpt.AsyncClient(base_url=fake_openai.base_url(fake_server))
+    monkeypatch.setattr(aiia.gpt, "_default_async_client", client)
+
+    frames = list(
+        aiia.daemon.request({"type": "respond", "contents": ">>> hi"}, socket_path)
+    )
+
+    assert [f["content"] for f in frames if f["type"] == "chunk"] == [
+        "Hello",
+        " world",
+        "!",
+    ]
+    assert frames[-1]["type"] == "done"
+
+
+def test_unknown_request_type(socket_path):
+    (frame,) = aiia.daemon.request({"type": "dance"}, socket_path)
+
+    assert frame["type"] == "error"
+
+
+def test_respond_coalesces_chunks(socket_path, monkeypatch):
+    import aiia.gpt
+
+    server = fake_openai.serve(tokens=["a"] * 40, token_delay=0.002)
+    client = aiia.gpt.AsyncClient(base_url=fake_openai.base_url(server))
+    monkeypatch.setattr(aiia.gpt, "_default_async_client", client)
+    try:
+        frames = list(
+            aiia.daemon.request(
+                {"type": "respond", "contents": ">>> hi", "coalesce_ms": 20},
+                socket_path,
+            )
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    chunks = [f["content"] for f in frames if f["type"] == "chunk"]
+    assert "".join(chunks) == "a" * 40
+    assert len(chunks) < 15
+    assert frames[-1]["type"] == "done"
+
+
+def test_socket_is_private(socket_path, monkeypatch):
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+    # A socket of another user, as could be left at the /tmp fallback path
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(socket_path).st_uid + 1)
+    assert not aiia.daemon.is_running(socket_path)
+    with pytest.raises(PermissionError):
+        list(aiia.daemon.request({"type": "parse", "contents": ""}, socket_path))
+
+
+def test_forwarded_events_report_the_frontmatter_model(
+    socket_path, fake_server, monkeypatch, tmp_path, capsys
+):
+    import aiia.gpt
+
+    client = aiia.gpt.AsyncClient(base_url=fake_openai.base_url(fake_server))
+    monkeypatch.setattr(aiia.gpt, "_default_async_client", client)
+    monkeypatch.setenv("AIIA_SOCKET", socket_path)
+    monkeypatch.delenv("AIIA_DAEMON", raising=False)
+    path = tmp_path / "log.chat.md"
+    path.write_text("---\nmodel: gpt-4\n---\n\n>>> hi\n")
+    args = argparse.Namespace(
+        command="respond",
+        file_path=str(path),
+        input_format="markdown",
+        inplace=False,
+        stats=False,
+        model="gpt-3.5-turbo",
+        coalesce_ms=0,
+        stream_format="events",
+    )
+
+    assert aiia.cli.forward_command(args)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines[0]["type"] == "start" and lines[0]["model"] == "gpt-4"
+    assert lines[-1]["type"] == "done"
+
+
+@pytest.mark.parametrize(
+    "input_format, output_format, forwarded",
+    [
+        ("markdown", "jsonl", False),
+        ("json", "jsonl", False),
+        ("markdown", "markdown", False),
+        ("markdown", "json", True),
+    ],
+)
+def test_streaming_parses_stay_local(
+    socket_path, monkeypatch, tmp_path, capsys, input_format, output_format, forwarded
+):
+    monkeypatch.setenv("AIIA_SOCKET", socket_path)
+    monkeypatch.delenv("AIIA_DAEMON", raising=False)
+    path = tmp_path / "log.chat.md"
+    path.write_text(">>> hi\n" if input_format == "markdown" else '{"messages": []}')
+    args = argparse.Namespace(
+        command="parse",
+        file_path=str(path),
+        input_format=input_format,
+        output_format=output_format,
+    )
+
+    assert aiia.cli.forward_command(args) is forwarded
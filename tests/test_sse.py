@@ -0,0 +1,63 @@
+import json
+
+from aiia.sse import Event, SSEDecoder, delta_content
+
+
+def test_decoder_handles_partial_reads():
+    stream = b'data: {"a": 1}\r\n\r\n: keepalive\r\n\r\nevent: ping\ndata: x\n\n'
+    decoder = SSEDecoder()
+
+    events = []
+    for i in range(len(stream)):
+        events += decoder.feed(stream[i : i + 1])
+
+    assert events == [
+        Event("message", '{"a": 1}', ""),
+        Event("ping", "x", ""),
+    ]
+
+
+def test_decoder_joins_multiline_data():
+    decoder = SSEDecoder()
+
+    assert decoder.feed(b"data: one\ndata:two\n\ndata: [DONE]\n") == [
+        Event("message", "one\ntwo", "")
+    ]
+    assert decoder.feed(b"\n") == [Event("message", "[DONE]", "")]
+
+
+def test_delta_content_fast_path_matches_json():
+    for content in ["plain", 'quo"te', "new\nline", "é中", ""]:
+        for separators in [(",", ":"), (", ", ": ")]:
+            data = json.dumps(
+                {
+                    "object": "chat.completion.chunk",
+                    "choices": [{"delta": {"content": content}, "index": 0}],
+                },
+                separators=separators,
+            )
+            assert delta_content(data) == content
+
+
+def test_delta_content_without_content():
+    data = json.dumps(
+        {
+            "object": "chat.completion.chunk",
+            "choices": [{"delta": {"role": "assistant"}, "index": 0}],
+        }
+    )
+
+    assert delta_content(data) is None
+
+
+def test_decoder_skips_events_without_data():
+    decoder = SSEDecoder()
+
+    assert decoder.feed(b"data:\n\nevent: ping\n\nid: 1\n\ndata: x\n\n") == [
+        Event("message", "x", "1")
+    ]
+
+
+def test_delta_content_of_data_that_is_not_json():
+    assert delta_content("x") is None
+    assert delta_content("[1, 2]") is None
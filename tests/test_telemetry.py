@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import aiia.gpt
+from aiia import telemetry
+
+from benchmarks import fake_openai
+
+
+def test_records_timings_of_each_request():
+    server = fake_openai.serve(tokens=["a"] * 6, ttft=0.05)
+    try:
+        client = aiia.gpt.Client(base_url=fake_openai.base_url(server))
+        sink = telemetry.MemorySink()
+        telemetry.add_sink(sink)
+        messages = [{"role": "user", "content": "hi"}]
+
+        aiia.gpt.get_response(messages, client=client)
+        aiia.gpt.get_response(messages, client=client)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    first, second = sink.records
+    assert (first["reused"], second["reused"]) == (False, True)
+    assert first["connect_ms"] <= first["headers_ms"] <= first["ttft_ms"]
+    assert first["ttft_ms"] >= 50
+    assert first["ttft_ms"] <= first["duration_ms"]
+    assert (first["chunks"], first["chars"]) == (6, 6)
+    assert sum(first["gap_histogram"]) == 5
+    assert first["error"] is None
+
+
+def test_gaps_and_rate_between_chunks(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(telemetry.time, "perf_counter", lambda: now[0])
+    timer = telemetry.RequestTimer("gpt-4")
+    for stamp in (0.05, 0.06, 0.07, 0.09, 0.10, 0.11):
+        now[0] = stamp
+        timer.chunk("a")
+    now[0] = 0.12
+    record = timer.record()
+
+    assert record["ttft_ms"] == 50
+    assert record["duration_ms"] == 120
+    assert record["gap_p50_ms"] == pytest.approx(10)
+    assert record["gap_max_ms"] == pytest.approx(20)
+    assert sum(record["gap_histogram"]) == 5
+    assert record["tokens_per_s"] == pytest.approx(5 / 0.06, abs=0.01)
+
+
+def test_async_requests_and_failures_are_recorded():
+    server = fake_openai.serve(rate_limit_first=1)
+    try:
+        client = aiia.gpt.AsyncClient(base_url=fake_openai.base_url(server))
+        sink = telemetry.MemorySink()
+        telemetry.add_sink(sink)
+        messages = [{"role": "user", "content": "hi"}]
+
+        async def twice():
+            try:
+                await aiia.gpt.aget_response(messages, client=client)
+            except Exception:
+                pass
+            return await aiia.gpt.aget_response(messages, client=client)
+
+        assert asyncio.run(twice()) == "Hello world!"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    failed, ok = sink.records
+    assert "HTTPError" in failed["error"]
+    assert ok["chunks"] == 3 and ok["ttft_ms"] is not None
+
+
+def test_nothing_is_timed_without_sinks(fake_server, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("timed while disabled")
+
+    monkeypatch.setattr(telemetry, "RequestTimer", fail)
+    client = aiia.gpt.Client(base_url=fake_openai.base_url(fake_server))
+    assert aiia.gpt.get_response([{"role": "user", "content": "hi"}], client=client)
+
+
+def test_jsonl_log_from_env_and_summary(fake_server, tmp_path, monkeypatch):
+    path = tmp_path / "telemetry.jsonl"
+    monkeypatch.setenv("AIIA_TELEMETRY", str(path))
+    client = aiia.gpt.Client(base_url=fake_openai.base_url(fake_server))
+    for _ in range(3):
+        aiia.gpt.get_response([{"role": "user", "content": "hi"}], client=client)
+
+    records = telemetry.read_log(str(path))
+    summary = telemetry.format_summary(records)
+
+    assert len(records) == 3
+    assert summary.splitlines()[0] == "3 requests, 0 cached, 0 failed"
+    assert "ttft_ms" in summary and "p99" in summary
+    assert "gaps between chunks:" in summary
+
+
+def test_percentiles():
+    values = list(range(1, 101))
+    assert telemetry.percentile(values, 50) == 50
+    assert telemetry.percentile(values, 99) == 99
+    assert telemetry.percentile([], 50) is None
+    assert telemetry.histogram_percentile([0, 10, 0, 1] + [0] * 12, 99) == 2
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+from aiia.workflows import webcache
+
+
+class FakeFetcher:
+    """Serves one page with an ETag, counting full and not-modified responses."""
+
+    def __init__(self, html="<p>hello</p>", etag='"v1"'):
+        self.html = html
+        self.etag = etag
+        self.full = 0
+        self.not_modified = 0
+
+    async def fetch_conditional(self, url, validators):
+        if validators.get("etag") == self.etag:
+            self.not_modified += 1
+            return None, validators
+        self.full += 1
+        return self.html, {"etag": self.etag}
+
+    async def close(self):
+        pass
+
+
+def test_caching_fetcher_serves_fresh_entries_without_fetching(tmp_path):
+    cache = webcache.WebCache(str(tmp_path))
+    inner = FakeFetcher()
+    fetcher = webcache.CachingFetcher(inner, cache)
+
+    assert asyncio.run(fetcher.fetch("http://example.com")) == "<p>hello</p>"
+    assert asyncio.run(fetcher.fetch("http://example.com")) == "<p>hello</p>"
+    assert inner.full == 1
+
+    # A new process finds the page on disk
+    fetcher = webcache.CachingFetcher(inner, webcache.WebCache(str(tmp_path)))
+    assert asyncio.run(fetcher.fetch("http://example.com")) == "<p>hello</p>"
+    assert inner.full == 1
+
+
+def test_caching_fetcher_revalidates_stale_entries(tmp_path):
+    cache = webcache.WebCache(str(tmp_path), ttl=0)
+    inner = FakeFetcher()
+    fetcher = webcache.CachingFetcher(inner, cache)
+
+    asyncio.run(fetcher.fetch("http://example.com"))
+    time.sleep(0.01)
+    assert asyncio.run(fetcher.fetch("http://example.com")) == "<p>hello</p>"
+    assert (inner.full, inner.not_modified) == (1, 1)
+
+    inner.html, inner.etag = "<p>changed</p>", '"v2"'
+    time.sleep(0.01)
+    assert asyncio.run(fetcher.fetch("http://example.com")) == "<p>changed</p>"
+    assert inner.full == 2
+
+
+def test_memoize_keys_on_arguments_and_skips_when_disabled(tmp_path, monkeypatch):
+    cache = webcache.WebCache(str(tmp_path))
+    monkeypatch.setattr(webcache, "_default_web_cache", cache)
+    calls = []
+
+    @webcache.memoize(
+        "text", key=lambda url, fetcher, max_words=250: f"{url}{max_words}"
+    )
+    async def read(url, fetcher, max_words=250):
+        calls.append((url, max_words))
+        return f"{url}:{max_words}"
+
+    assert asyncio.run(read("a", object())) == "a:250"
+    assert asyncio.run(read("a", object())) == "a:250"
+    assert asyncio.run(read("a", object(), max_words=10)) == "a:10"
+    assert calls == [("a", 250), ("a", 10)]
+
+    monkeypatch.setenv("AIIA_WEB_CACHE", "0")
+    asyncio.run(read("a", object()))
+    assert len(calls) == 3
+
+
+def test_memoize_skip_empty_leaves_empty_results_uncached(tmp_path, monkeypatch):
+    cache = webcache.WebCache(str(tmp_path))
+    monkeypatch.setattr(webcache, "_default_web_cache", cache)
+    results = [[], ["http://example.com"]]
+
+    @webcache.memoize("search", key=lambda query: query, skip_empty=True)
+    async def search(query):
+        return results.pop(0)
+
+    assert asyncio.run(search("q")) == []
+    assert asyncio.run(search("q")) == ["http://example.com"]
+    assert asyncio.run(search("q")) == ["http://example.com"]
+
+
+def test_caching_fetcher_forget_drops_the_page(tmp_path):
+    cache = webcache.WebCache(str(tmp_path))
+    inner = FakeFetcher()
+    fetcher = webcache.CachingFetcher(inner, cache)
+
+    asyncio.run(fetcher.fetch("http://example.com"))
+    fetcher.forget("http://example.com")
+    assert cache.lookup("html", "http://example.com") is None
+    asyncio.run(fetcher.fetch("http://example.com"))
+    assert inner.full == 2
+
+
+def test_memory_layer_is_bounded(tmp_path):
+    cache = webcache.WebCache(str(tmp_path), memory_entries=2)
+    for i in range(5):
+        cache.store("html", str(i), i)
+    assert len(cache._memory) == 2
+    assert cache.lookup("html", "0")["value"] == 0